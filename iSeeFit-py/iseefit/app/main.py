@@ -4,6 +4,8 @@ iSeeFit Backend API Main Application
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+import logging
 import sys
 from pathlib import Path
 
@@ -11,11 +13,14 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
-from config.database import Base, engine
-from routes import auth, meals, workouts, recommendations, weight, live, food_analysis
+from config.database import engine, dispose_async_engine
+from config.settings import settings
+from routes import auth, meals, workouts, recommendations, weight, live, food_analysis, system, images
+from services.model_registry import registry
+from utils.idempotency import IdempotencyMiddleware
+from migrations import run_migrations
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
 # Create FastAPI app
 app = FastAPI(
@@ -24,6 +29,10 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Idempotency-Key replays (added before CORS so replayed responses still get CORS headers)
+if settings.IDEMPOTENCY_ENABLED:
+    app.add_middleware(IdempotencyMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -41,6 +50,54 @@ app.include_router(recommendations.router)
 app.include_router(weight.router)
 app.include_router(live.router)
 app.include_router(food_analysis.router)
+app.include_router(system.router)
+app.include_router(images.router)
+
+@app.on_event("startup")
+async def migrate_database():
+    """Apply pending schema migrations (replaces create_all at import time)"""
+    if not settings.AUTO_MIGRATE:
+        return
+    applied = await run_in_threadpool(run_migrations, engine)
+    if applied:
+        logger.info(f"Applied schema migrations: {applied}")
+
+@app.on_event("startup")
+async def warmup_models():
+    """Preload models listed in MODEL_WARMUP (models otherwise load on first use)"""
+    warmup = settings.MODEL_WARMUP.strip()
+    if not warmup:
+        return
+    names = None if warmup.lower() == "all" else [n.strip() for n in warmup.split(",") if n.strip()]
+    results = await run_in_threadpool(registry.warmup, names)
+    logger.info(f"Startup model warm-up: {results}")
+
+@app.on_event("shutdown")
+async def close_vision_client():
+    """Close the pooled OpenAI HTTP connections"""
+    from services.food_analysis_service import vision_client
+
+    if vision_client is not None:
+        await vision_client.aclose()
+
+@app.on_event("shutdown")
+async def close_password_hasher():
+    """Stop the bcrypt worker pool"""
+    from services.password_hasher import password_hasher
+
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+async def finish_image_jobs():
+    """Let deferred image downscales finish before exiting"""
+    from utils.image import drain_image_jobs
+
+    await drain_image_jobs()
+
+@app.on_event("shutdown")
+async def close_database():
+    """Close the pooled async database connections"""
+    await dispose_async_engine()
 
 @app.get("/")
 async def root():
@@ -2,7 +2,7 @@
 Configuration package
 """
 
-from .database import Base, engine, get_db
+from .database import Base, engine, get_db, get_async_db
 from .settings import settings
 
-__all__ = ["Base", "engine", "get_db", "settings"]
+__all__ = ["Base", "engine", "get_db", "get_async_db", "settings"]
@@ -4,33 +4,131 @@ Database configuration and connection
 
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
+from config.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, instrument_engine, pool_status
+from config.settings import settings
+
 # Load environment variables
 load_dotenv()
 
+# Sync driver prefix -> asyncio driver prefix
+ASYNC_DRIVERS = {
+    "mysql+pymysql://": "mysql+aiomysql://",
+    "mysql://": "mysql+aiomysql://",
+    "sqlite+pysqlite://": "sqlite+aiosqlite://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+
 def get_database_url():
     """Get database connection URL from environment variables"""
+    # A full URL (e.g. sqlite:///./iseefit.db for local runs) overrides the DB_* settings
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        return database_url
+
     db_host = os.getenv("DB_HOST", "localhost")
     db_port = os.getenv("DB_PORT", "3306")
     db_user = os.getenv("DB_USER", "root")
     db_password = os.getenv("DB_PASSWORD", "nari2008")
     db_name = os.getenv("DB_NAME", "iseefit")
-    
+
     return f"mysql+pymysql://{db_user}:{db_password}@{db_host}:{db_port}/{db_name}"
 
+def get_async_database_url(database_url: str = None):
+    """Same database through an asyncio driver (aiomysql / aiosqlite)"""
+    if database_url is None:
+        async_url = os.getenv("ASYNC_DATABASE_URL")
+        if async_url:
+            return async_url
+        database_url = get_database_url()
+
+    if database_url.startswith(tuple(ASYNC_DRIVERS.values())):
+        return database_url
+    for sync_prefix, async_prefix in ASYNC_DRIVERS.items():
+        if database_url.startswith(sync_prefix):
+            return async_prefix + database_url[len(sync_prefix):]
+    raise ValueError(f"No asyncio driver known for {database_url.split('://')[0]}; set ASYNC_DATABASE_URL")
+
+def _engine_kwargs(database_url: str, is_async: bool = False) -> dict:
+    if database_url.startswith("sqlite"):
+        # Local runs: default SQLite pooling; sessions are used from the threadpool / aiosqlite worker threads
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
 # Database configuration
 DATABASE_URL = get_database_url()
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL))
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def get_db():
-    """Database dependency for FastAPI"""
+    """Database dependency for FastAPI (sync; scripts and threadpool code)"""
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+# Async engines, keyed by role ("primary" / "replica"). Created on first use so scripts that
+# only need the sync engine do not require the asyncio driver.
+_async_engines = {}
+_async_session_factories = {}
+
+def _resolve_role(role: str) -> str:
+    return "replica" if role == "replica" and settings.DB_READ_REPLICA_URL else "primary"
+
+def get_async_engine(role: str = "primary"):
+    """Async engine for the primary, or for the read replica when one is configured"""
+    role = _resolve_role(role)
+    if role not in _async_engines:
+        async_url = get_async_database_url(settings.DB_READ_REPLICA_URL if role == "replica" else None)
+        async_engine = create_async_engine(async_url, **_engine_kwargs(async_url, is_async=True))
+        instrument_engine(async_engine.sync_engine)
+        _async_engines[role] = async_engine
+    return _async_engines[role]
+
+def get_async_session_factory(role: str = "primary") -> async_sessionmaker:
+    role = _resolve_role(role)
+    if role not in _async_session_factories:
+        # expire_on_commit=False: attributes stay loaded after commit, so returning a committed
+        # object from a route does not trigger a lazy load outside the event loop's greenlet
+        _async_session_factories[role] = async_sessionmaker(
+            get_async_engine(role), class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factories[role]
+
+async def get_async_db():
+    """Async database dependency for FastAPI routes"""
+    async with get_async_session_factory()() as db:
+        yield db
+
+async def get_async_read_db():
+    """Async session on the read replica (falls back to the primary); read-only stats endpoints"""
+    async with get_async_session_factory("replica")() as db:
+        yield db
+
+def pool_stats() -> dict:
+    """Pool occupancy and metrics of every engine created so far"""
+    stats = {"sync": pool_status(engine)}
+    for role, async_engine in _async_engines.items():
+        stats[f"async_{role}"] = pool_status(async_engine)
+    return stats
+
+async def dispose_async_engine():
+    """Close pooled async connections (application shutdown)"""
+    for async_engine in _async_engines.values():
+        await async_engine.dispose()
+    _async_engines.clear()
+    _async_session_factories.clear()
@@ -0,0 +1,109 @@
+"""
+Instrumented connection pools
+QueuePool subclasses that record how long checkouts wait, how often the pool grows into its
+overflow and how often a checkout times out; exposed through /system/db/pool.
+"""
+
+import time
+import threading
+from typing import Any, Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+class PoolMetrics:
+    """Counters shared by a pool and the pools it is recreated into (engine.dispose())"""
+
+    def __init__(self):
+        # Imported here: the utils package imports config.database at import time
+        from utils.metrics import Histogram
+
+        self.checkout_wait = Histogram()
+        self.checkouts = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait_seconds: float, overflowed: bool):
+        self.checkout_wait.observe(wait_seconds)
+        with self._lock:
+            self.checkouts += 1
+            if overflowed:
+                self.overflow_events += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {
+                "checkouts": self.checkouts,
+                "overflow_events": self.overflow_events,
+                "timeouts": self.timeouts,
+                "invalidations": self.invalidations,
+            }
+        counters["checkout_wait_seconds"] = self.checkout_wait.snapshot()
+        return counters
+
+class _InstrumentedPoolMixin:
+    _metrics = None
+
+    @property
+    def metrics(self) -> PoolMetrics:
+        if self._metrics is None:
+            self._metrics = PoolMetrics()
+        return self._metrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        overflow_before = self._overflow
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        # _overflow starts at -pool_size; only growth past the pool size is an overflow connection
+        self.metrics.record_checkout(time.perf_counter() - started, self._overflow > max(overflow_before, 0))
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._metrics = self.metrics
+        return pool
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def instrument_engine(engine):
+    """Count invalidated connections (stale / dropped by the server) on a sync engine"""
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        pool = engine.pool
+        if isinstance(pool, _InstrumentedPoolMixin):
+            pool.metrics.record_invalidation()
+
+def pool_status(engine) -> Dict[str, Any]:
+    """Current pool occupancy plus cumulative metrics (sync or async engine)"""
+    pool = getattr(engine, "sync_engine", engine).pool
+    status: Dict[str, Any] = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout_seconds": pool.timeout(),
+        })
+    if isinstance(pool, _InstrumentedPoolMixin):
+        status.update(pool.metrics.snapshot())
+    return status
@@ -17,19 +17,123 @@ class Settings:
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "nari2008")
     DB_NAME: str = os.getenv("DB_NAME", "iseefit")
     
+    # Database connection pool configuration
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))  # persistent connections per engine
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))  # extra connections under bursts
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; keep below MySQL wait_timeout
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_READ_REPLICA_URL: str = os.getenv("DB_READ_REPLICA_URL", "")  # empty = stats reads use the primary
+    
     # JWT configuration
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+    TOKEN_REVOCATION_SYNC_SECONDS: float = float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", "30"))  # how stale another worker's revocation list may be
+    USER_CACHE_TTL_SECONDS: float = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))  # authenticated user snapshots; 0 = always query
+    USER_CACHE_MAX_ENTRIES: int = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Password hashing configuration
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))  # changing it rehashes passwords on next login
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # concurrent bcrypt operations per worker
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))  # running + queued; beyond = 503
+    PASSWORD_HASH_EXECUTOR: str = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")  # thread or process
     
     # File upload configuration
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
+    IMAGE_WORKERS: int = int(os.getenv("IMAGE_WORKERS", "2"))  # threads for image resize / encode
+    IMAGE_DEFERRED_PROCESSING: bool = os.getenv("IMAGE_DEFERRED_PROCESSING", "true").lower() == "true"  # downscale after the response
+    IMAGE_QUEUE_SIZE: int = int(os.getenv("IMAGE_QUEUE_SIZE", "100"))  # pending background jobs; beyond = processed inline
+    
+    # Batch ingestion configuration
+    BATCH_MAX_RECORDS: int = int(os.getenv("BATCH_MAX_RECORDS", "500"))  # records per /meals/batch, /workouts/batch, /weight/batch request
+    
+    # Idempotency-Key configuration (safe retries of write requests)
+    IDEMPOTENCY_ENABLED: bool = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+    IDEMPOTENCY_BACKEND: str = os.getenv("IDEMPOTENCY_BACKEND", "memory")  # memory or sqlite (shared by all workers on a host)
+    IDEMPOTENCY_PATH: str = os.getenv("IDEMPOTENCY_PATH", "idempotency.sqlite3")
+    IDEMPOTENCY_PATHS: str = os.getenv("IDEMPOTENCY_PATHS", "/meals,/workouts,/weight,/api/food")  # POST path prefixes
+    IDEMPOTENCY_TTL_SECONDS: float = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))  # how long responses are replayed
+    IDEMPOTENCY_LOCK_SECONDS: float = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))  # unfinished requests older than this can run again
+    IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+    IDEMPOTENCY_MAX_BODY_BYTES: int = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", "16777216"))  # larger requests skip idempotency
+    IDEMPOTENCY_MAX_RESPONSE_BYTES: int = int(os.getenv("IDEMPOTENCY_MAX_RESPONSE_BYTES", "1048576"))  # larger responses are not stored
+    
+    # Image storage configuration
+    IMAGE_STORAGE_BACKEND: str = os.getenv("IMAGE_STORAGE_BACKEND", "local")  # local or s3
+    IMAGE_STORAGE_DIR: str = os.getenv("IMAGE_STORAGE_DIR", os.path.join(UPLOAD_DIR, "store"))  # local backend root
+    IMAGE_EXTRA_FORMATS: str = os.getenv("IMAGE_EXTRA_FORMATS", "")  # comma-separated: webp, avif (JPEG is always stored)
+    S3_ENDPOINT_URL: str = os.getenv("S3_ENDPOINT_URL", "")  # empty = AWS; e.g. http://localhost:9000 for MinIO
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "iseefit-images")
+    S3_ACCESS_KEY_ID: str = os.getenv("S3_ACCESS_KEY_ID", "")
+    S3_SECRET_ACCESS_KEY: str = os.getenv("S3_SECRET_ACCESS_KEY", "")
+    S3_REGION: str = os.getenv("S3_REGION", "us-east-1")
+    IMAGE_ACCEL_REDIRECT_PREFIX: str = os.getenv("IMAGE_ACCEL_REDIRECT_PREFIX", "")  # e.g. /_images/: nginx internal location aliased to IMAGE_STORAGE_DIR
+    IMAGE_RELEASE_GRACE_SECONDS: float = float(os.getenv("IMAGE_RELEASE_GRACE_SECONDS", "300"))  # unreferenced content is deleted after this; covers uploads not yet committed
     
     # Logging configuration
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # Schema migrations
+    AUTO_MIGRATE: bool = os.getenv("AUTO_MIGRATE", "true").lower() == "true"  # apply pending migrations at startup
+    
     # Recommendation system configuration
     RECOMMENDATION_UPDATE_INTERVAL: int = int(os.getenv("RECOMMENDATION_UPDATE_INTERVAL", "24"))  # hours
+    RECOMMENDATION_STATS_CACHE_TTL_SECONDS: float = float(os.getenv("RECOMMENDATION_STATS_CACHE_TTL_SECONDS", "60"))  # 0 = no caching
+    RECOMMENDATION_STATS_CACHE_MAX_ENTRIES: int = int(os.getenv("RECOMMENDATION_STATS_CACHE_MAX_ENTRIES", "10000"))  # users
+    
+    # Food-101 batching inference configuration
+    FOOD_BATCH_MAX_SIZE: int = int(os.getenv("FOOD_BATCH_MAX_SIZE", "8"))  # images per forward pass
+    FOOD_BATCH_MAX_WAIT_MS: float = float(os.getenv("FOOD_BATCH_MAX_WAIT_MS", "10"))
+    FOOD_BATCH_QUEUE_SIZE: int = int(os.getenv("FOOD_BATCH_QUEUE_SIZE", "64"))  # pending requests
+    
+    # Model registry configuration
+    MODEL_WARMUP: str = os.getenv("MODEL_WARMUP", "")  # comma-separated model names to load at startup, or "all"
+    MODEL_MEMORY_LIMIT_MB: float = float(os.getenv("MODEL_MEMORY_LIMIT_MB", "0"))  # 0 = no LRU unloading
+    MODEL_IDLE_UNLOAD_SECONDS: float = float(os.getenv("MODEL_IDLE_UNLOAD_SECONDS", "0"))  # 0 = keep loaded
+    
+    # Food analysis result cache configuration
+    ANALYSIS_CACHE_ENABLED: bool = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+    ANALYSIS_CACHE_BACKEND: str = os.getenv("ANALYSIS_CACHE_BACKEND", "memory")  # memory or sqlite
+    ANALYSIS_CACHE_PATH: str = os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.sqlite3")
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1000"))
+    ANALYSIS_CACHE_TTL_SECONDS: float = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400"))
+    ANALYSIS_CACHE_PHASH_DISTANCE: int = int(os.getenv("ANALYSIS_CACHE_PHASH_DISTANCE", "0"))  # 0 = exact matches only
+    
+    # OpenAI vision client configuration
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")  # empty = api.openai.com; set to a local fake server for tests
+    OPENAI_TIMEOUT_SECONDS: float = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "20"))
+    OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    OPENAI_BACKOFF_BASE_SECONDS: float = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "0.5"))
+    OPENAI_BACKOFF_MAX_SECONDS: float = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "8"))
+    OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))  # in-flight upstream calls per worker
+    OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+    OPENAI_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("OPENAI_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    OPENAI_CIRCUIT_RESET_SECONDS: float = float(os.getenv("OPENAI_CIRCUIT_RESET_SECONDS", "30"))
+    
+    # Hedged analysis: race OpenAI against the local classifier
+    ANALYSIS_HEDGE_MODE: str = os.getenv("ANALYSIS_HEDGE_MODE", "off")  # off, parallel or delayed
+    ANALYSIS_HEDGE_DELAY_MS: float = float(os.getenv("ANALYSIS_HEDGE_DELAY_MS", "1500"))  # classifier start delay (delayed mode)
+    ANALYSIS_LATENCY_BUDGET_MS: float = float(os.getenv("ANALYSIS_LATENCY_BUDGET_MS", "4000"))  # how long OpenAI is preferred
+    ANALYSIS_HEDGE_LOSER: str = os.getenv("ANALYSIS_HEDGE_LOSER", "cancel")  # cancel or record
+    
+    # Video pose pipeline (decode / infer / encode stages)
+    VIDEO_INFER_BATCH_SIZE: int = int(os.getenv("VIDEO_INFER_BATCH_SIZE", "4"))  # frames per YOLO call
+    VIDEO_PIPELINE_QUEUE_SIZE: int = int(os.getenv("VIDEO_PIPELINE_QUEUE_SIZE", "32"))  # frames buffered between stages
+    VIDEO_STREAM_CHUNK_SIZE: int = int(os.getenv("VIDEO_STREAM_CHUNK_SIZE", "65536"))  # bytes per upload/download chunk
+    VIDEO_STREAM_QUEUE_SIZE: int = int(os.getenv("VIDEO_STREAM_QUEUE_SIZE", "8"))  # encoded frames waiting for a streaming client
+    VIDEO_STREAM_STALL_SECONDS: float = float(os.getenv("VIDEO_STREAM_STALL_SECONDS", "30"))  # abort when the client stops reading
+    
+    # Motion analysis frame sampling
+    VIDEO_SAMPLING_STRATEGY: str = os.getenv("VIDEO_SAMPLING_STRATEGY", "all")  # all, stride, time, motion or grab-stride
+    VIDEO_SAMPLE_STRIDE: int = int(os.getenv("VIDEO_SAMPLE_STRIDE", "3"))  # stride / grab-stride: infer every Nth frame
+    VIDEO_SAMPLE_INTERVAL_MS: float = float(os.getenv("VIDEO_SAMPLE_INTERVAL_MS", "100"))  # time: one frame per interval
+    VIDEO_MOTION_THRESHOLD: float = float(os.getenv("VIDEO_MOTION_THRESHOLD", "4.0"))  # motion: mean abs pixel diff (0-255)
+    VIDEO_MOTION_MAX_GAP: int = int(os.getenv("VIDEO_MOTION_MAX_GAP", "15"))  # motion: max frames between samples
+    VIDEO_CLASSIFY_EVERY_FRAMES: int = int(os.getenv("VIDEO_CLASSIFY_EVERY_FRAMES", "5"))  # action classifier schedule
+    VIDEO_CLASSIFY_WINDOW_FRAMES: int = int(os.getenv("VIDEO_CLASSIFY_WINDOW_FRAMES", "30"))  # classify within the first N frames; 0 = whole clip
+    VIDEO_SEGMENT_SECONDS: float = float(os.getenv("VIDEO_SEGMENT_SECONDS", "1"))  # segment length in the motion JSON
 
 settings = Settings()
@@ -6,75 +6,17 @@ Creates database tables and sample data in English
 
 import os
 import sys
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Text, Boolean, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
+from pathlib import Path
+from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
 import bcrypt
 
-# Database Models
-Base = declarative_base()
+# 添加当前目录到 Python 路径
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
 
-class User(Base):
-    __tablename__ = "users"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String(50), unique=True, index=True, nullable=False)
-    email = Column(String(100), unique=True, index=True, nullable=False)
-    hashed_password = Column(String(255), nullable=False)
-    full_name = Column(String(100))
-    age = Column(Integer)
-    height = Column(Float)  # cm
-    weight = Column(Float)  # kg
-    gender = Column(String(10))
-    activity_level = Column(String(20))  # sedentary, light, moderate, active, very_active
-    goal = Column(String(20))  # lose_weight, maintain, gain_weight
-    created_at = Column(DateTime, default=datetime.utcnow)
-    is_active = Column(Boolean, default=True)
-
-class MealRecord(Base):
-    __tablename__ = "meal_records"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    meal_type = Column(String(20), nullable=False)  # breakfast, lunch, dinner, snack
-    food_name = Column(String(200), nullable=False)
-    calories = Column(Float, nullable=False)
-    protein = Column(Float, default=0)
-    carbs = Column(Float, default=0)
-    fat = Column(Float, default=0)
-    portion_size = Column(String(100))
-    image_path = Column(String(500))
-    notes = Column(Text)
-    recorded_at = Column(DateTime, default=datetime.utcnow)
-
-class WorkoutRecord(Base):
-    __tablename__ = "workout_records"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    workout_type = Column(String(100), nullable=False)
-    duration_minutes = Column(Integer, nullable=False)
-    calories_burned = Column(Float, nullable=False)
-    intensity = Column(String(20))  # low, moderate, high
-    reps = Column(Integer)
-    sets = Column(Integer)
-    weight_used = Column(Float)
-    image_path = Column(String(500))
-    notes = Column(Text)
-    recorded_at = Column(DateTime, default=datetime.utcnow)
-
-class Recommendation(Base):
-    __tablename__ = "recommendations"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    recommendation_type = Column(String(50), nullable=False)  # meal, workout, general
-    title = Column(String(200), nullable=False)
-    content = Column(Text, nullable=False)
-    priority = Column(String(20), default="medium")  # low, medium, high
-    is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+from migrations import run_migrations
+from models import User, MealRecord, WorkoutRecord, Recommendation
 
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
@@ -108,10 +50,10 @@ def create_database():
         with engine.connect() as conn:
             print("✅ MySQL connection successful!")
         
-        # Create all tables
-        print("Creating database tables...")
-        Base.metadata.create_all(bind=engine)
-        print("✅ Database tables created successfully!")
+        # Create / upgrade tables through the versioned migrations
+        print("Applying schema migrations...")
+        applied = run_migrations(engine)
+        print(f"✅ Database schema up to date (applied: {applied or 'none pending'})")
         
         # Create session
         SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Database Path Load Test
+Compares the async database path (AsyncSession via get_async_db) with the previous sync path
+(blocking Session used inside `async def` routes) under concurrent load.
+
+In-process mode (default) builds a temporary SQLite database whose connections sleep
+--latency-ms on every statement, standing in for the network round-trip to MySQL. The sleep
+happens in whichever thread runs the query: on the sync path that is the event loop itself,
+on the async path it is the aiosqlite worker, which is exactly the difference being measured.
+The client shares that event loop, so on the sync path latency percentiles leave out the time
+spent queued behind the blocked loop; compare throughput (or use --url against real servers).
+
+用法:
+    python loadtest_db.py                                   # 进程内对比 sync / async
+    python loadtest_db.py --latency-ms 10 --concurrency 64
+    python loadtest_db.py --url http://localhost:8000 --token <JWT>   # 压测运行中的服务
+"""
+
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import tempfile
+import argparse
+import statistics
+from pathlib import Path
+
+# 添加当前目录到 Python 路径
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+import httpx
+from fastapi import APIRouter, Depends, FastAPI
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from config.database import get_async_db
+from config.settings import settings
+from migrations import run_migrations
+from models import User, MealRecord
+from utils.auth import create_access_token, security
+
+import jwt
+
+# ============== Simulated database latency ==============
+LATENCY_SECONDS = 0.0
+
+class _SlowCursor(sqlite3.Cursor):
+    def execute(self, *args, **kwargs):
+        time.sleep(LATENCY_SECONDS)
+        return super().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        time.sleep(LATENCY_SECONDS)
+        return super().executemany(*args, **kwargs)
+
+class _SlowConnection(sqlite3.Connection):
+    def cursor(self, factory=_SlowCursor):
+        return super().cursor(factory)
+
+# ============== In-process app ==============
+def build_app(db_path: str, pool_size: int) -> FastAPI:
+    """Real /meals routes on the async path plus a copy of the old sync list route under /sync"""
+    from routes import meals
+
+    connect_args = {"factory": _SlowConnection, "check_same_thread": False}
+    # Same pool size on both paths (aiosqlite would otherwise default to NullPool)
+    sync_engine = create_engine(f"sqlite:///{db_path}", connect_args=connect_args,
+                                poolclass=QueuePool, pool_size=pool_size, max_overflow=0)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", connect_args=connect_args,
+                                       poolclass=AsyncAdaptedQueuePool, pool_size=pool_size, max_overflow=0)
+    SyncSession = sessionmaker(bind=sync_engine, autoflush=False)
+    AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def loadtest_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    sync_router = APIRouter(prefix="/sync")
+
+    @sync_router.get("/meals/")
+    async def sync_meal_records(credentials: HTTPAuthorizationCredentials = Depends(security), limit: int = 50):
+        # Previous behaviour: blocking Session calls inside an async route
+        username = jwt.decode(credentials.credentials, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])["sub"]
+        db = SyncSession()
+        try:
+            user = db.query(User).filter(User.username == username).first()
+            records = db.query(MealRecord).filter(MealRecord.user_id == user.id) \
+                .order_by(MealRecord.recorded_at.desc(), MealRecord.id.desc()).limit(limit).all()
+            return [{"id": r.id, "food_name": r.food_name, "calories": r.calories} for r in records]
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(meals.router)
+    app.include_router(sync_router)
+    app.dependency_overrides[get_async_db] = loadtest_async_db
+    app.state.engines = (sync_engine, async_engine)
+    return app
+
+def seed(db_path: str, records: int) -> str:
+    """Create the schema and one user with `records` meals; returns a bearer token"""
+    engine = create_engine(f"sqlite:///{db_path}")
+    run_migrations(engine)
+    with engine.begin() as conn:
+        user_id = conn.execute(User.__table__.insert().values(
+            username="loadtest", email="loadtest@example.com", hashed_password="x")).inserted_primary_key[0]
+        conn.execute(MealRecord.__table__.insert(), [
+            {"user_id": user_id, "meal_type": "lunch", "food_name": f"meal {i}", "calories": 500} for i in range(records)
+        ])
+    engine.dispose()
+    return create_access_token(data={"sub": "loadtest"})
+
+# ============== Load generator ==============
+async def run_load(client: httpx.AsyncClient, path: str, token: str, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in counter:
+            started = time.perf_counter()
+            response = await client.get(path, headers={"Authorization": f"Bearer {token}"})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return {
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 2),
+        "req_per_s": round(total / elapsed, 1),
+        "p50_ms": round(pct(0.50), 1),
+        "p95_ms": round(pct(0.95), 1),
+        "p99_ms": round(pct(0.99), 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+    }
+
+def print_result(name: str, result: dict):
+    print(f"✅ {name}: {result['req_per_s']} req/s, p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, "
+          f"p99 {result['p99_ms']} ms, errors {result['errors']}")
+
+async def compare_in_process(args):
+    global LATENCY_SECONDS
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "loadtest.sqlite3")
+        token = seed(db_path, args.records)
+        LATENCY_SECONDS = args.latency_ms / 1000.0
+        app = build_app(db_path, pool_size=args.concurrency)
+        transport = httpx.ASGITransport(app=app)
+        results = {}
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+                for name, path in (("sync", "/sync/meals/"), ("async", "/meals/")):
+                    path = f"{path}?limit={args.limit}"
+                    await run_load(client, path, token, min(args.concurrency, args.requests), args.concurrency)  # warm-up
+                    results[name] = await run_load(client, path, token, args.requests, args.concurrency)
+                    print_result(f"{name:5} path", results[name])
+        finally:
+            sync_engine, async_engine = app.state.engines
+            sync_engine.dispose()
+            await async_engine.dispose()
+    speedup = results["async"]["req_per_s"] / results["sync"]["req_per_s"]
+    print(f"\n📊 async / sync throughput: {speedup:.2f}x "
+          f"({args.concurrency} concurrent clients, {args.latency_ms} ms per statement)")
+
+async def load_remote(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        result = await run_load(client, args.path, args.token, args.requests, args.concurrency)
+    print_result(f"{args.url}{args.path}", result)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async database path load test")
+    parser.add_argument("--requests", type=int, default=500, help="每种路径的请求总数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发客户端数")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="进程内模式：每条 SQL 的模拟往返延迟")
+    parser.add_argument("--records", type=int, default=2000, help="进程内模式：预置饮食记录数")
+    parser.add_argument("--limit", type=int, default=20, help="列表每页条数")
+    parser.add_argument("--url", default=None, help="压测运行中的服务（如 http://localhost:8000）")
+    parser.add_argument("--token", default=None, help="--url 模式使用的 JWT")
+    parser.add_argument("--path", default="/meals/?limit=20", help="--url 模式请求的路径")
+    args = parser.parse_args()
+
+    print("🚀 Starting database load test")
+    print("=" * 50)
+    if args.url:
+        if not args.token:
+            parser.error("--url requires --token")
+        asyncio.run(load_remote(args))
+    else:
+        asyncio.run(compare_in_process(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+数据库迁移脚本
+应用 migrations/versions 中尚未执行的迁移，或查看迁移状态
+
+用法:
+    python migrate.py              # 升级到最新版本
+    python migrate.py --target 1   # 升级到指定版本
+    python migrate.py --status     # 查看已应用 / 待应用的迁移
+"""
+
+import sys
+import argparse
+import logging
+from pathlib import Path
+
+# 添加当前目录到 Python 路径
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from config.database import engine
+from migrations import run_migrations, migration_status
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply iSeeFit schema migrations")
+    parser.add_argument("--target", type=int, default=None, help="升级到该版本为止")
+    parser.add_argument("--status", action="store_true", help="只显示迁移状态")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.status:
+        for m in migration_status(engine):
+            mark = "✅" if m["applied"] else "⏳"
+            print(f"{mark} {m['version']:04d} {m['description']}")
+        return
+
+    try:
+        applied = run_migrations(engine, target=args.target)
+    except Exception as e:
+        print(f"❌ 迁移失败: {e}")
+        sys.exit(1)
+    if applied:
+        print(f"✅ 已应用迁移: {', '.join(f'{v:04d}' for v in applied)}")
+    else:
+        print("✅ 数据库已是最新版本")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Versioned schema migrations
+Each module in migrations/versions defines VERSION, DESCRIPTION and upgrade(conn).
+Applied versions are recorded in the schema_migrations table; run_migrations() applies
+the pending ones in order. Replaces Base.metadata.create_all at import time.
+
+MySQL commits DDL implicitly, so every operation helper below is idempotent (it checks
+the live schema first) and a partially applied migration can simply be re-run.
+"""
+
+import importlib
+import logging
+import pkgutil
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+
+logger = logging.getLogger(__name__)
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MYSQL_LOCK_NAME = "iseefit_schema_migrations"
+
+# ============== Operation helpers ==============
+def has_table(conn, table: str) -> bool:
+    return inspect(conn).has_table(table)
+
+def has_column(conn, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+def has_index(conn, table: str, name: str) -> bool:
+    insp = inspect(conn)
+    names = {ix["name"] for ix in insp.get_indexes(table)}
+    names |= {uc["name"] for uc in insp.get_unique_constraints(table)}
+    return name in names
+
+def create_tables(conn, *tables: Table):
+    """CREATE TABLE (with its indexes) for tables that do not exist yet"""
+    for table in tables:
+        table.create(bind=conn, checkfirst=True)
+
+def add_column(conn, table: Table, column_name: str):
+    """ALTER TABLE ... ADD COLUMN using the column definition from the model"""
+    if has_column(conn, table.name, column_name):
+        return
+    column = table.c[column_name]
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+    logger.info(f"Added column {table.name}.{column_name}")
+
+def create_index(conn, table: Table, name: str):
+    """Create an index declared in the model's __table_args__ if it is missing"""
+    if has_index(conn, table.name, name):
+        return
+    index = next(ix for ix in table.indexes if ix.name == name)
+    index.create(bind=conn)
+    logger.info(f"Created index {name} on {table.name}")
+
+# ============== Runner ==============
+def load_migrations() -> List[Any]:
+    """Migration modules from migrations/versions, sorted by VERSION"""
+    from migrations import versions
+
+    modules = []
+    for info in pkgutil.iter_modules(versions.__path__):
+        module = importlib.import_module(f"migrations.versions.{info.name}")
+        if hasattr(module, "VERSION") and hasattr(module, "upgrade"):
+            modules.append(module)
+    modules.sort(key=lambda m: m.VERSION)
+    versions_seen = [m.VERSION for m in modules]
+    if len(set(versions_seen)) != len(versions_seen):
+        raise RuntimeError(f"Duplicate migration versions: {versions_seen}")
+    return modules
+
+def applied_versions(engine) -> List[int]:
+    with engine.connect() as conn:
+        if not has_table(conn, schema_migrations.name):
+            return []
+        return [row[0] for row in conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version))]
+
+def migration_status(engine) -> List[Dict[str, Any]]:
+    applied = set(applied_versions(engine))
+    return [
+        {"version": m.VERSION, "description": m.DESCRIPTION, "applied": m.VERSION in applied}
+        for m in load_migrations()
+    ]
+
+def run_migrations(engine, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to `target` (default: latest); returns applied versions"""
+    migrations = load_migrations()
+    lock_conn = None
+    if engine.dialect.name == "mysql":
+        # Several workers may start at once; only one migrates, the others wait
+        lock_conn = engine.connect()
+        got = lock_conn.execute(text("SELECT GET_LOCK(:name, 300)"), {"name": MYSQL_LOCK_NAME}).scalar()
+        if got != 1:
+            lock_conn.close()
+            raise RuntimeError("Timed out waiting for the schema migration lock")
+    try:
+        with engine.begin() as conn:
+            create_tables(conn, schema_migrations)
+        done = set(applied_versions(engine))
+        newly_applied = []
+        for migration in migrations:
+            if migration.VERSION in done or (target is not None and migration.VERSION > target):
+                continue
+            started = time.perf_counter()
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=migration.VERSION,
+                    description=migration.DESCRIPTION,
+                    applied_at=datetime.utcnow(),
+                ))
+            newly_applied.append(migration.VERSION)
+            logger.info(f"Applied migration {migration.VERSION:04d} {migration.DESCRIPTION} "
+                        f"({time.perf_counter() - started:.2f}s)")
+        return newly_applied
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MYSQL_LOCK_NAME})
+            lock_conn.close()
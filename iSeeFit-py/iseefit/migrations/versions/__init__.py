@@ -0,0 +1,3 @@
+"""
+Migration modules (vNNNN_description.py)
+"""
@@ -0,0 +1,94 @@
+"""
+Initial schema: the tables previously created by Base.metadata.create_all
+Frozen copy of the models as they were before versioned migrations; later columns, indexes
+and tables are added by their own migrations, so this must not import the live models.
+"""
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, func
+)
+
+VERSION = 1
+DESCRIPTION = "initial schema"
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String(50), unique=True, index=True, nullable=False),
+    Column("email", String(100), unique=True, index=True, nullable=False),
+    Column("hashed_password", String(255), nullable=False),
+    Column("full_name", String(100)),
+    Column("age", Integer),
+    Column("height", Float),
+    Column("weight", Float),
+    Column("gender", String(10)),
+    Column("activity_level", String(20)),
+    Column("goal", String(20)),
+    Column("created_at", DateTime),
+    Column("is_active", Boolean),
+)
+
+meal_records = Table(
+    "meal_records", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("meal_type", String(20), nullable=False),
+    Column("food_name", String(200), nullable=False),
+    Column("calories", Float, nullable=False),
+    Column("protein", Float),
+    Column("carbs", Float),
+    Column("fat", Float),
+    Column("portion_size", String(100)),
+    Column("image_path", String(500)),
+    Column("notes", Text),
+    Column("recorded_at", DateTime),
+)
+
+workout_records = Table(
+    "workout_records", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("workout_type", String(100), nullable=False),
+    Column("duration_minutes", Integer, nullable=False),
+    Column("calories_burned", Float, nullable=False),
+    Column("intensity", String(20)),
+    Column("reps", Integer),
+    Column("sets", Integer),
+    Column("weight_used", Float),
+    Column("image_path", String(500)),
+    Column("notes", Text),
+    Column("recorded_at", DateTime),
+)
+
+recommendations = Table(
+    "recommendations", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("recommendation_type", String(50), nullable=False),
+    Column("title", String(200), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("priority", String(20)),
+    Column("is_read", Boolean),
+    Column("created_at", DateTime),
+)
+
+weight_records = Table(
+    "weight_records", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False, index=True),
+    Column("weight", Float, nullable=False, comment="体重 (kg)"),
+    Column("height", Float, nullable=True, comment="身高 (cm) - 记录时的身高"),
+    Column("bmi", Float, nullable=True, comment="BMI 指数"),
+    Column("notes", Text, nullable=True, comment="备注"),
+    Column("image_path", String(500), nullable=True, comment="体重照片路径"),
+    Column("recorded_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+def upgrade(conn):
+    from migrations import create_tables
+
+    create_tables(conn, users, meal_records, workout_records, recommendations, weight_records)
@@ -0,0 +1,22 @@
+"""
+Composite indexes for the per-user record queries
+- (user_id, recorded_at) on meal / workout / weight records: every list, stats and
+  rollup query filters on the user and a recorded_at range
+- recommendations: (user_id, created_at) for the list, (user_id, is_read, created_at)
+  for unread lists / read-all, (user_id, recommendation_type, priority, is_read) for
+  filtered lists and stats counts
+"""
+
+VERSION = 2
+DESCRIPTION = "composite indexes on record and recommendation tables"
+
+def upgrade(conn):
+    from migrations import create_index
+    from models import MealRecord, WorkoutRecord, WeightRecord, Recommendation
+
+    create_index(conn, MealRecord.__table__, "ix_meal_records_user_recorded")
+    create_index(conn, WorkoutRecord.__table__, "ix_workout_records_user_recorded")
+    create_index(conn, WeightRecord.__table__, "ix_weight_records_user_recorded")
+    create_index(conn, Recommendation.__table__, "ix_recommendations_user_created")
+    create_index(conn, Recommendation.__table__, "ix_recommendations_user_read_created")
+    create_index(conn, Recommendation.__table__, "ix_recommendations_user_type_priority")
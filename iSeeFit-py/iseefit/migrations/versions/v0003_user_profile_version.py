@@ -0,0 +1,13 @@
+"""
+users.profile_version: bumped on every profile change and embedded in access tokens,
+so per-process user snapshot caches can tell when a snapshot is older than the token
+"""
+
+VERSION = 3
+DESCRIPTION = "users.profile_version"
+
+def upgrade(conn):
+    from migrations import add_column
+    from models import User
+
+    add_column(conn, User.__table__, "profile_version")
@@ -0,0 +1,12 @@
+"""
+refresh_tokens: hashed, rotating refresh tokens for /auth/refresh
+"""
+
+VERSION = 4
+DESCRIPTION = "refresh_tokens table"
+
+def upgrade(conn):
+    from migrations import create_tables
+    from models import RefreshToken
+
+    create_tables(conn, RefreshToken.__table__)
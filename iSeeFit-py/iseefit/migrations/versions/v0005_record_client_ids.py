@@ -0,0 +1,16 @@
+"""
+client_id on meal / workout / weight records, unique per user: lets offline clients re-send a
+batch without creating duplicates
+"""
+
+VERSION = 5
+DESCRIPTION = "record client_id columns"
+
+def upgrade(conn):
+    from migrations import add_column, create_index
+    from models import MealRecord, WorkoutRecord, WeightRecord
+
+    for model in (MealRecord, WorkoutRecord, WeightRecord):
+        table = model.__table__
+        add_column(conn, table, "client_id")
+        create_index(conn, table, f"uq_{table.name}_user_client")
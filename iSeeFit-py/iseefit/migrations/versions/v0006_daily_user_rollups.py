@@ -0,0 +1,16 @@
+"""
+daily_user_rollups: one row per (user, day) with meal / workout / weight totals, maintained
+on every record write (services/rollup_service.py). Existing records are rolled up here, so
+stats read full history as soon as the migration has run
+"""
+
+VERSION = 6
+DESCRIPTION = "daily_user_rollups table"
+
+def upgrade(conn):
+    from migrations import create_tables
+    from models import DailyUserRollup
+    from services.rollup_service import backfill_rollups
+
+    create_tables(conn, DailyUserRollup.__table__)
+    backfill_rollups(conn)
@@ -7,6 +7,8 @@ from .meal import MealRecord
 from .workout import WorkoutRecord
 from .recommendation import Recommendation
 from .weight import WeightRecord
+from .rollup import DailyUserRollup
+from .refresh_token import RefreshToken
 
 
-__all__ = ["User", "MealRecord", "WorkoutRecord", "Recommendation", "WeightRecord"]
+__all__ = ["User", "MealRecord", "WorkoutRecord", "Recommendation", "WeightRecord", "DailyUserRollup", "RefreshToken"]
@@ -2,13 +2,17 @@
 Meal record model and related schemas
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from config.database import Base
 
 class MealRecord(Base):
     __tablename__ = "meal_records"
+    __table_args__ = (
+        Index("ix_meal_records_user_recorded", "user_id", "recorded_at"),
+        Index("uq_meal_records_user_client", "user_id", "client_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -22,6 +26,7 @@ class MealRecord(Base):
     image_path = Column(String(500))
     notes = Column(Text)
     recorded_at = Column(DateTime, default=datetime.utcnow)
+    client_id = Column(String(64))  # client-generated key for offline batch sync
     
     # Relationship
     user = relationship("User", back_populates="meal_records")
@@ -2,13 +2,18 @@
 Recommendation model and related schemas
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from config.database import Base
 
 class Recommendation(Base):
     __tablename__ = "recommendations"
+    __table_args__ = (
+        Index("ix_recommendations_user_created", "user_id", "created_at"),
+        Index("ix_recommendations_user_read_created", "user_id", "is_read", "created_at"),
+        Index("ix_recommendations_user_type_priority", "user_id", "recommendation_type", "priority", "is_read"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,25 @@
+"""
+Refresh token model
+Only a SHA-256 of each token is stored. Tokens rotate on every use; all tokens issued from one
+login share a family_id, which access tokens carry as their sid claim.
+"""
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from datetime import datetime
+from config.database import Base
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    __table_args__ = (
+        Index("ix_refresh_tokens_family", "family_id"),
+        Index("ix_refresh_tokens_revoked_at", "revoked_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)  # sha256 hex of the token
+    family_id = Column(String(32), nullable=False)  # one per login; revoked as a whole
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    rotated_at = Column(DateTime)  # exchanged for a new token; presenting it again is reuse
+    revoked_at = Column(DateTime)  # family revoked (logout or reuse detected)
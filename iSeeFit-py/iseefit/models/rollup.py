@@ -0,0 +1,42 @@
+"""
+Daily per-user nutrition / activity rollup model
+One row per (user, day), maintained from meal, workout and weight records
+"""
+
+from sqlalchemy import Column, Integer, Float, Date, DateTime, Text, ForeignKey, UniqueConstraint
+from datetime import datetime
+from config.database import Base
+
+class DailyUserRollup(Base):
+    __tablename__ = "daily_user_rollups"
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", name="uq_daily_user_rollups_user_day"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+
+    # Meals
+    kcal_in = Column(Float, nullable=False, default=0)
+    protein = Column(Float, nullable=False, default=0)
+    carbs = Column(Float, nullable=False, default=0)
+    fat = Column(Float, nullable=False, default=0)
+    meal_count = Column(Integer, nullable=False, default=0)
+    meal_breakdown = Column(Text)  # JSON: {meal_type: {calories, protein, carbs, fat, count}}
+
+    # Workouts
+    kcal_out = Column(Float, nullable=False, default=0)
+    workout_minutes = Column(Integer, nullable=False, default=0)
+    workout_count = Column(Integer, nullable=False, default=0)
+    workout_breakdown = Column(Text)  # JSON: {workout_type: {duration, calories_burned, count}}
+
+    # Weight
+    weight_count = Column(Integer, nullable=False, default=0)
+    weight_sum = Column(Float, nullable=False, default=0)
+    weight_min = Column(Float)
+    weight_max = Column(Float)
+    last_weight = Column(Float)  # latest record of the day
+    prev_weight = Column(Float)  # second latest record of the day
+
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
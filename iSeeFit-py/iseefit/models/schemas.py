@@ -2,7 +2,7 @@
 Pydantic schemas for request/response models
 """
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime, date
 from typing import Optional, List, Dict, Any
 
@@ -62,6 +62,7 @@ class MealRecordResponse(BaseModel):
     image_path: Optional[str]
     notes: Optional[str]
     recorded_at: datetime
+    client_id: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -89,6 +90,7 @@ class WorkoutRecordResponse(BaseModel):
     image_path: Optional[str]
     notes: Optional[str]
     recorded_at: datetime
+    client_id: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -110,6 +112,10 @@ class RecommendationResponse(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 # Statistics schemas
 class DailyMealStats(BaseModel):
@@ -153,6 +159,7 @@ class WeightRecordResponse(BaseModel):
     bmi: Optional[float]
     notes: Optional[str]
     image_path: Optional[str]
+    client_id: Optional[str] = None
     recorded_at: datetime
     created_at: datetime
     updated_at: datetime
@@ -160,7 +167,40 @@ class WeightRecordResponse(BaseModel):
     class Config:
         from_attributes = True
 
-# BMI calculation schemas
+# Batch ingestion schemas (offline sync)
+class MealRecordBatchItem(MealRecordCreate):
+    client_id: str = Field(..., min_length=1, max_length=64)
+    recorded_at: Optional[datetime] = None
+
+class WorkoutRecordBatchItem(WorkoutRecordCreate):
+    client_id: str = Field(..., min_length=1, max_length=64)
+    recorded_at: Optional[datetime] = None
+
+class WeightRecordBatchItem(WeightRecordCreate):
+    client_id: str = Field(..., min_length=1, max_length=64)
+    recorded_at: Optional[datetime] = None
+
+class MealRecordBatch(BaseModel):
+    records: List[MealRecordBatchItem]
+
+class WorkoutRecordBatch(BaseModel):
+    records: List[WorkoutRecordBatchItem]
+
+class WeightRecordBatch(BaseModel):
+    records: List[WeightRecordBatchItem]
+
+class BatchItemResult(BaseModel):
+    client_id: str
+    status: str  # created, duplicate or error
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class BatchResponse(BaseModel):
+    created: int
+    duplicates: int
+    errors: int
+    results: List[BatchItemResult]
+
 class BMICalculationRequest(BaseModel):
     weight: float
     height: float
@@ -187,11 +227,12 @@ class WeightStatsResponse(BaseModel):
 
 class WeightHistoryResponse(BaseModel):
     records: List[WeightRecordResponse]
-    total_count: int
+    total_count: Optional[int] = None  # omitted when include_total=false
     page: int
     page_size: int
     has_next: bool
     has_prev: bool
+    next_cursor: Optional[str] = None  # pass as ?cursor= to fetch the next page
 
 class WeightTrendResponse(BaseModel):
     start_date: date
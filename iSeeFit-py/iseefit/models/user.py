@@ -2,7 +2,7 @@
 User model and related schemas
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, event, inspect
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from config.database import Base
@@ -23,9 +23,18 @@ class User(Base):
     goal = Column(String(20))  # lose_weight, maintain, gain_weight
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    profile_version = Column(Integer, nullable=False, default=1, server_default="1")  # embedded in access tokens
     
     # Relationships
     meal_records = relationship("MealRecord", back_populates="user")
     workout_records = relationship("WorkoutRecord", back_populates="user")
     weight_records = relationship("WeightRecord", back_populates="user")
     recommendations = relationship("Recommendation", back_populates="user")
+
+@event.listens_for(User, "before_update")
+def bump_profile_version(mapper, connection, target):
+    """Any column change bumps profile_version, so cached user snapshots older than a token are reloaded"""
+    state = inspect(target)
+    if any(state.attrs[attr.key].history.has_changes()
+           for attr in mapper.column_attrs if attr.key != "profile_version"):
+        target.profile_version = (target.profile_version or 0) + 1
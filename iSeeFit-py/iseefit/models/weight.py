@@ -5,7 +5,7 @@
 #  Created by Virginia Zheng on 2025-01-19.
 #
 
-from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from config.database import Base
@@ -14,6 +14,10 @@ from config.database import Base
 class WeightRecord(Base):
     """体重记录模型"""
     __tablename__ = "weight_records"
+    __table_args__ = (
+        Index("ix_weight_records_user_recorded", "user_id", "recorded_at"),
+        Index("uq_weight_records_user_client", "user_id", "client_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
@@ -22,6 +26,7 @@ class WeightRecord(Base):
     bmi = Column(Float, nullable=True, comment="BMI 指数")
     notes = Column(Text, nullable=True, comment="备注")
     image_path = Column(String(500), nullable=True, comment="体重照片路径")
+    client_id = Column(String(64), nullable=True, comment="客户端生成的离线同步键")
     recorded_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+每日汇总表重建脚本
+从饮食 / 健身 / 体重原始记录回填或重建 daily_user_rollups
+
+用法:
+    python rebuild_rollups.py                      # 重建所有用户
+    python rebuild_rollups.py --user-id 3          # 只重建某个用户
+    python rebuild_rollups.py --since 2025-01-01   # 只重建某天之后
+"""
+
+import sys
+import argparse
+from datetime import date
+from pathlib import Path
+
+# 添加当前目录到 Python 路径
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from config.database import SessionLocal, engine
+from migrations import run_migrations
+from services.rollup_service import rebuild_rollups
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild daily_user_rollups from raw records")
+    parser.add_argument("--user-id", type=int, default=None, help="只重建该用户")
+    parser.add_argument("--since", type=date.fromisoformat, default=None, help="只重建该日期（YYYY-MM-DD）及之后")
+    args = parser.parse_args()
+
+    run_migrations(engine)
+
+    db = SessionLocal()
+    try:
+        days = rebuild_rollups(db, user_id=args.user_id, since=args.since)
+        print(f"✅ 已重建 {days} 个 (用户, 日期) 汇总行")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ 重建失败: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,6 @@
 Routes package
 """
 
-from . import auth, meals, workouts, recommendations, weight, live, food_analysis
+from . import auth, meals, workouts, recommendations, weight, live, food_analysis, system, images
 
-__all__ = ["auth", "meals", "workouts", "recommendations", "weight", "live", "food_analysis"]
+__all__ = ["auth", "meals", "workouts", "recommendations", "weight", "live", "food_analysis", "system", "images"]
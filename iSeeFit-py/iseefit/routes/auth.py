@@ -3,7 +3,8 @@ Authentication routes
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import sys
 from pathlib import Path
 
@@ -11,26 +12,40 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
-from config.database import get_db
+from config.database import get_async_db
 from models.user import User
-from models.schemas import UserCreate, UserLogin, UserResponse, Token
-from utils.auth import hash_password, verify_password, create_access_token, get_current_user
+from models.schemas import UserCreate, UserLogin, UserResponse, Token, RefreshTokenRequest
+from services.password_hasher import PasswordHasherBusy, password_hasher
+from services.refresh_tokens import InvalidRefreshToken, hash_refresh_token, issue_refresh_token, \
+    revoke_family, rotate_refresh_token
+from models.refresh_token import RefreshToken
+from utils.auth import create_user_access_token, get_current_user
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many concurrent sign-ins, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/register", response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """User registration"""
     # Check if username already exists
-    if db.query(User).filter(User.username == user.username).first():
+    if await db.scalar(select(User.id).where(User.username == user.username)):
         raise HTTPException(status_code=400, detail="Username already registered")
     
     # Check if email already exists
-    if db.query(User).filter(User.email == user.email).first():
+    if await db.scalar(select(User.id).where(User.email == user.email)):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Create new user
-    hashed_password = hash_password(user.password)
+    # Create new user (bcrypt runs on the password hasher pool, not the event loop)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
     db_user = User(
         username=user.username,
         email=user.email,
@@ -45,34 +60,77 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return db_user
 
 @router.post("/login", response_model=Token)
-async def login(user: UserLogin, db: Session = Depends(get_db)):
+async def login(user: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """User login"""
     # Verify user
-    db_user = db.query(User).filter(User.username == user.username).first()
-
-    print(user.password)
-    print(hash_password(user.password))
-    print(db_user.hashed_password)
-
-    hash = '$2b$12$LQv3c1yqBWVHxkd0LHAkCOYz6TtxMQJqhN8/LewdBPj4J/8Qz8K2'
-
-    # if not db_user or not verify_password(hash, db_user.hashed_password):
-    #     raise HTTPException(
-    #         status_code=status.HTTP_401_UNAUTHORIZED,
-    #         detail="Incorrect username or password",
-    #         headers={"WWW-Authenticate": "Bearer"},
-    #     )
+    db_user = await db.scalar(select(User).where(User.username == user.username))
+    try:
+        password_ok = db_user is not None and await password_hasher.verify(user.password, db_user.hashed_password)
+    except PasswordHasherBusy:
+        raise _hasher_busy()
+    if not password_ok:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    # Upgrade hashes made with a different BCRYPT_ROUNDS while the plain password is at hand
+    rehashed = False
+    if password_hasher.needs_rehash(db_user.hashed_password):
+        try:
+            db_user.hashed_password = await password_hasher.hash(user.password)
+            rehashed = True
+        except PasswordHasherBusy:
+            # Not worth failing the login over; retried on the next one
+            pass
+    
+    # New session: refresh token family, referenced by the access token's sid claim
+    refresh_token, session_id = issue_refresh_token(db, db_user.id)
+    await db.commit()
+    if rehashed:
+        password_hasher.record_rehash()
     
     # Create access token
-    access_token = create_access_token(data={"sub": db_user.username})
+    access_token = create_user_access_token(db_user, session_id)
     
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/refresh", response_model=Token)
+async def refresh(request: RefreshTokenRequest, db: AsyncSession = Depends(get_async_db)):
+    """Exchange a refresh token for a new access / refresh token pair (the old one stops working)"""
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        user_id, refresh_token, session_id = await rotate_refresh_token(db, request.refresh_token)
+    except InvalidRefreshToken:
+        raise invalid
+    
+    db_user = await db.get(User, user_id)
+    if db_user is None:
+        raise invalid
+    
+    access_token = create_user_access_token(db_user, session_id)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/logout")
+async def logout(request: RefreshTokenRequest, db: AsyncSession = Depends(get_async_db)):
+    """Revoke the session of a refresh token; its access tokens stop working too"""
+    session_id = await db.scalar(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == hash_refresh_token(request.refresh_token))
+    )
+    if session_id is not None:
+        await revoke_family(db, session_id)
+    return {"message": "Logged out successfully"}
 
 @router.get("/me", response_model=UserResponse)
 async def read_users_me(current_user: User = Depends(get_current_user)):
@@ -18,7 +18,9 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
-from services.food_analysis_service import analyze_food_image
+from services.food_analysis_service import analyze_food_image_async
+from services.batch_inference import BatchingEngine, QueueFullError
+from config.settings import settings
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -29,55 +31,161 @@ router = APIRouter(prefix="/api/food", tags=["food"])
 
 
 
-import io, torch, torch.nn as nn, torchvision.models as M, torchvision.transforms as T
-from fastapi import FastAPI, UploadFile, File
-from PIL import Image, ImageOps
-import uvicorn
+import asyncio
+from fastapi.concurrency import run_in_threadpool
+from PIL import ImageOps
 
+from services.model_registry import registry
 
 
+# ---------- 1) 按需加载：模型 + 预处理（torch 只在首次使用时导入） ----------
+FOOD_VIT_MODEL = "food101_vit"
 
+list_food_items = ['apple_pie', 'baby_back_ribs', 'baklava', 'beef_carpaccio', 'beef_tartare', 'beet_salad', 'beignets', 'bibimbap', 'bread_pudding', 'breakfast_burrito', 'bruschetta', 'caesar_salad', 'cannoli', 'caprese_salad', 'carrot_cake', 'ceviche', 'cheesecake', 'cheese_plate', 'chicken_curry', 'chicken_quesadilla', 'chicken_wings', 'chocolate_cake', 'chocolate_mousse', 'churros', 'clam_chowder', 'club_sandwich', 'crab_cakes', 'creme_brulee', 'croque_madame', 'cup_cakes', 'deviled_eggs', 'donuts', 'dumplings', 'edamame', 'eggs_benedict', 'escargots', 'falafel', 'filet_mignon', 'fish_and_chips', 'foie_gras', 'french_fries', 'french_onion_soup', 'french_toast', 'fried_calamari', 'fried_rice', 'frozen_yogurt', 'garlic_bread', 'gnocchi', 'greek_salad', 'grilled_cheese_sandwich', 'grilled_salmon', 'guacamole', 'gyoza', 'hamburger', 'hot_and_sour_soup', 'hot_dog', 'huevos_rancheros', 'hummus', 'ice_cream', 'lasagna', 'lobster_bisque', 'lobster_roll_sandwich', 'macaroni_and_cheese', 'macarons', 'miso_soup', 'mussels', 'nachos', 'omelette', 'onion_rings', 'oysters', 'pad_thai', 'paella', 'pancakes', 'panna_cotta', 'peking_duck', 'pho', 'pizza', 'pork_chop', 'poutine', 'prime_rib', 'pulled_pork_sandwich', 'ramen', 'ravioli', 'red_velvet_cake', 'risotto', 'samosa', 'sashimi', 'scallops', 'seaweed_salad', 'shrimp_and_grits', 'spaghetti_bolognese', 'spaghetti_carbonara', 'spring_rolls', 'steak', 'strawberry_shortcake', 'sushi', 'tacos', 'takoyaki', 'tiramisu', 'tuna_tartare', 'waffles']
+num_classes = len(list_food_items)
 
+mean,std=[0.485,0.456,0.406],[0.229,0.224,0.225]
 
-# ---------- 1) 启动时加载：模型 + 预处理 ----------
-app = FastAPI()
-device = torch.device("cuda" if torch.cuda.is_available()
-                      else "mps" if torch.backends.mps.is_available() else "cpu")
+# ====== TTA 视角集合 ======
+# 视角写法（逗号分隔）：
+#   - 数字 s：Resize(s) + CenterCrop(224)，如 256,288
+#   - auto_ratio：按长宽比裁成 512x384 / 384x512 的矩形输入
+#   - flip：为以上每个视角再加一个水平翻转
+DEFAULT_TTA_VIEWS = "256,288"
+AUTO_RATIO_TTA_VIEWS = "auto_ratio,flip"
+
+_device = None
+_val_tf = None
+
+def get_device():
+    global _device
+    if _device is None:
+        import torch
+        _device = torch.device("cuda" if torch.cuda.is_available()
+                               else "mps" if torch.backends.mps.is_available() else "cpu")
+    return _device
+
+def get_val_tf():
+    """与验证一致的预处理：Resize(256) + CenterCrop(224)"""
+    global _val_tf
+    if _val_tf is None:
+        import torchvision.transforms as T
+        _val_tf = T.Compose([T.Resize(256), T.CenterCrop(224), T.ToTensor(), T.Normalize(mean,std)])
+    return _val_tf
+
+def load_food_vit():
+    import torch, torch.nn as nn, torchvision.models as M
+
+    # 与训练一致的结构
+    device = get_device()
+    model = M.vit_b_16(weights=None)
+    model.heads.head = nn.Linear(model.heads.head.in_features, num_classes)
+    model_path = parent_dir / "checkpoints" / "best_model.pt"
+    state = torch.load(model_path, map_location=device)  # 或 best_model_swa.pt
+    model.load_state_dict(state)
+    model.to(device).eval()
+    return model
+
+registry.register(FOOD_VIT_MODEL, load_food_vit, description="Food-101 ViT-B/16 (checkpoints/best_model.pt)")
+
+
+# ---------- 2) 动态批处理：并发请求合并为一次前向 ----------
+def _batched_forward(x):
+    """Run one batched forward pass on the worker thread, return float32 logits on CPU"""
+    import torch
+
+    model = registry.get(FOOD_VIT_MODEL)
+    device = get_device()
+    with torch.no_grad(), torch.autocast(device.type, torch.float16 if device.type!="cpu" else torch.float32):
+        return model(x.to(device)).float().cpu()
+
+_batch_engine: Optional[BatchingEngine] = None
+
+def get_batch_engine() -> BatchingEngine:
+    """Return the shared batching engine, starting it on first use"""
+    global _batch_engine
+    if _batch_engine is None:
+        _batch_engine = BatchingEngine(
+            _batched_forward,
+            max_batch_size=settings.FOOD_BATCH_MAX_SIZE,
+            max_wait_ms=settings.FOOD_BATCH_MAX_WAIT_MS,
+            max_queue_size=settings.FOOD_BATCH_QUEUE_SIZE,
+            name="food101-batcher",
+        )
+        _batch_engine.start()
+    return _batch_engine
 
-list_food_items = ['apple_pie', 'baby_back_ribs', 'baklava', 'beef_carpaccio', 'beef_tartare', 'beet_salad', 'beignets', 'bibimbap', 'bread_pudding', 'breakfast_burrito', 'bruschetta', 'caesar_salad', 'cannoli', 'caprese_salad', 'carrot_cake', 'ceviche', 'cheesecake', 'cheese_plate', 'chicken_curry', 'chicken_quesadilla', 'chicken_wings', 'chocolate_cake', 'chocolate_mousse', 'churros', 'clam_chowder', 'club_sandwich', 'crab_cakes', 'creme_brulee', 'croque_madame', 'cup_cakes', 'deviled_eggs', 'donuts', 'dumplings', 'edamame', 'eggs_benedict', 'escargots', 'falafel', 'filet_mignon', 'fish_and_chips', 'foie_gras', 'french_fries', 'french_onion_soup', 'french_toast', 'fried_calamari', 'fried_rice', 'frozen_yogurt', 'garlic_bread', 'gnocchi', 'greek_salad', 'grilled_cheese_sandwich', 'grilled_salmon', 'guacamole', 'gyoza', 'hamburger', 'hot_and_sour_soup', 'hot_dog', 'huevos_rancheros', 'hummus', 'ice_cream', 'lasagna', 'lobster_bisque', 'lobster_roll_sandwich', 'macaroni_and_cheese', 'macarons', 'miso_soup', 'mussels', 'nachos', 'omelette', 'onion_rings', 'oysters', 'pad_thai', 'paella', 'pancakes', 'panna_cotta', 'peking_duck', 'pho', 'pizza', 'pork_chop', 'poutine', 'prime_rib', 'pulled_pork_sandwich', 'ramen', 'ravioli', 'red_velvet_cake', 'risotto', 'samosa', 'sashimi', 'scallops', 'seaweed_salad', 'shrimp_and_grits', 'spaghetti_bolognese', 'spaghetti_carbonara', 'spring_rolls', 'steak', 'strawberry_shortcake', 'sushi', 'tacos', 'takoyaki', 'tiramisu', 'tuna_tartare', 'waffles']
-num_classes = len(list_food_items)
+def _preprocess(img_bytes: bytes, tta_views: Optional[str] = None) -> list:
+    # 读图 & EXIF 纠正 + 预处理（与验证一致）
+    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    img = ImageOps.exif_transpose(img)
+    if tta_views:
+        # TTA：视角按尺寸堆叠成 batch
+        return build_tta_batches(img, tta_views)
+    return [get_val_tf()(img).unsqueeze(0)]
 
-# 与训练一致的结构
-model = M.vit_b_16(weights=None)
-model.heads.head = nn.Linear(model.heads.head.in_features, num_classes)
-model_path = parent_dir / "checkpoints" / "best_model.pt"
-state = torch.load(model_path, map_location=device)  # 或 best_model_swa.pt
-model.load_state_dict(state)
-model.to(device).eval()
-print("Food-100 Model loaded successfully")
 
-mean,std=[0.485,0.456,0.406],[0.229,0.224,0.225]
-val_tf = T.Compose([T.Resize(256), T.CenterCrop(224), T.ToTensor(), T.Normalize(mean,std)])
+def _decode_rgb(image_data: bytes) -> Image.Image:
+    pil_image = Image.open(io.BytesIO(image_data))
+    # Ensure image is in RGB format
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+    pil_image.load()
+    return pil_image
 
 
 # predict food-100 by calling pt model
 @router.post("/predict")
-async def predict(file: UploadFile = File(...), topk: int = 5):
-    # 读图 & EXIF 纠正
-    img_bytes = await file.read()
-    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-    img = ImageOps.exif_transpose(img)
+async def predict(
+    file: UploadFile = File(...),
+    topk: int = 5,
+    tta: bool = False,
+    tta_views: str = DEFAULT_TTA_VIEWS,
+):
+    """
+    Food-101 Top-K prediction.
 
-    # 预处理（与验证一致）
-    x = val_tf(img).unsqueeze(0).to(device)
+    With `tta=true`, the views in `tta_views` (crop sizes such as 256,288, plus
+    `auto_ratio` and `flip`) are stacked and run as a single batched forward;
+    logits are averaged across views.
+    """
+    if tta:
+        try:
+            parse_tta_views(tta_views)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    with torch.no_grad(), torch.autocast(device.type, torch.float16 if device.type!="cpu" else torch.float32):
-        logits = model(x)
-        probs = torch.softmax(logits, dim=1)[0]
-        top_prob, top_idx = torch.topk(probs, k=min(topk, num_classes))
+    img_bytes = await file.read()
+    try:
+        batches = await run_in_threadpool(_preprocess, img_bytes, tta_views if tta else None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unable to process image: {str(e)}")
+
+    engine = get_batch_engine()
+    futures = []
+    try:
+        for x in batches:
+            futures.append(engine.submit(x))
+    except QueueFullError:
+        for f in futures:
+            f.cancel()
+        raise HTTPException(status_code=503, detail="Prediction queue is full, please retry later")
+    outputs = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+
+    import torch
+    probs = torch.softmax(mean_logits(outputs), dim=1)[0]
+    top_prob, top_idx = torch.topk(probs, k=min(topk, num_classes))
 
     result = [{"label": list_food_items[i], "prob": float(p)} for p,i in zip(top_prob.tolist(), top_idx.tolist())]
-    return {"topk": result}
+    response = {"topk": result}
+    if tta:
+        response["tta_views"] = sum(len(x) for x in batches)
+    return response
+
+@router.get("/predict/stats")
+async def predict_stats():
+    """Batching engine configuration plus queue-wait / batch-size histograms"""
+    return get_batch_engine().stats()
 
 
 @router.post("/analyze")
@@ -111,16 +219,13 @@ async def analyze_food(
         
         # Convert to PIL image object
         try:
-            pil_image = Image.open(io.BytesIO(image_data))
-            # Ensure image is in RGB format
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
+            pil_image = await run_in_threadpool(_decode_rgb, image_data)
         except Exception as e:
             logger.error(f"Image processing failed: {e}")
             raise HTTPException(status_code=400, detail=f"Unable to process image: {str(e)}")
         
         # Call analysis service
-        result = analyze_food_image(
+        result = await analyze_food_image_async(
             image=pil_image,
             use_ai_portions=use_ai_portions,
             manual_override=manual_override,
@@ -149,7 +254,7 @@ async def health_check():
 @router.get("/config")
 async def get_config():
     """Get service configuration information"""
-    from services.food_analysis_service import USE_OPENAI, openai_error_msg
+    from services.food_analysis_service import USE_OPENAI, openai_error_msg, vision_client, hedge_stats
     
     config = {
         "openai_enabled": USE_OPENAI,
@@ -157,11 +262,24 @@ async def get_config():
         "fallback_classifier": "food101" if not USE_OPENAI else "available",
     }
     
+    if vision_client is not None:
+        config["vision_client"] = vision_client.stats()
+        config["hedging"] = hedge_stats.snapshot()
+    
     if openai_error_msg:
         config["openai_error"] = openai_error_msg
     
     return config
 
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Result cache hit/miss counters"""
+    from services.food_analysis_service import analysis_cache
+
+    if analysis_cache is None:
+        return {"enabled": False}
+    return dict(analysis_cache.stats(), enabled=True)
+
 
 
 def auto_resize_to_rect(img: Image.Image, landscape=(512,384), portrait=(384,512)) -> Image.Image:
@@ -186,60 +304,106 @@ def auto_resize_to_rect(img: Image.Image, landscape=(512,384), portrait=(384,512
     return img.resize(target_size, Image.Resampling.LANCZOS)
 
 def to_tensor_norm(img: Image.Image):
+    import torchvision.transforms as T
     return T.Compose([T.ToTensor(), T.Normalize(mean, std)])(img)
 
-def build_tta_tensors(img: Image.Image, use_auto_ratio: bool):
+# ====== TTA 视角解析（视角集合定义见文件开头） ======
+def parse_tta_views(views: str) -> Tuple[List[int], bool, bool]:
+    """解析视角字符串，返回 (crop_scales, auto_ratio, flip)；非法写法抛 ValueError"""
+    scales: List[int] = []
+    auto_ratio = flip = False
+    for token in (t.strip().lower() for t in views.split(",")):
+        if not token:
+            continue
+        if token == "flip":
+            flip = True
+        elif token in ("auto_ratio", "auto"):
+            auto_ratio = True
+        elif token.isdigit() and 224 <= int(token) <= 512:
+            scales.append(int(token))
+        else:
+            raise ValueError(f"Unknown TTA view '{token}' (use crop sizes 224-512, 'auto_ratio' or 'flip')")
+    if not scales and not auto_ratio:
+        scales = [256]
+    return scales, auto_ratio, flip
+
+def build_tta_batches(img: Image.Image, views: str = DEFAULT_TTA_VIEWS) -> list:
     """
-    返回一个 list[tensor] 做 TTA。
-    - 如果 use_auto_ratio=True：使用 512x384 / 384x512 的矩形输入 + 可选翻转
-    - 否则：使用与验证一致的 224 CenterCrop + 多尺度
+    按视角集合构造 TTA 输入，并按形状堆叠成 batch：
+    返回 list[tensor(n, 3, H, W)]，同尺寸的视角合成一个 batch，一次前向即可。
+    （224 方形视角一组，auto_ratio 的矩形视角一组）
     """
-    tensors = []
-    if use_auto_ratio:
+    import torch
+    import torchvision.transforms as T
+
+    scales, auto_ratio, flip = parse_tta_views(views)
+    groups = []
+
+    square = []
+    for s in scales:
+        cropped = T.CenterCrop(224)(T.Resize(s)(img))
+        square.append(cropped)
+        if flip:
+            square.append(cropped.transpose(Image.FLIP_LEFT_RIGHT))
+    if square:
+        groups.append(torch.stack([to_tensor_norm(v) for v in square]))
+
+    if auto_ratio:
         base = auto_resize_to_rect(img)  # 512x384 或 384x512
-        # 原图 + 水平翻转 两个视角
-        tensors.append(to_tensor_norm(base))
-        tensors.append(to_tensor_norm(base.transpose(Image.FLIP_LEFT_RIGHT)))
-    else:
-        # 与验证一致：224×224；再加一个 288 短边的 CenterCrop 作为 TTA
-        for s in (256, 288):
-            tf = T.Compose([T.Resize(s), T.CenterCrop(224), T.ToTensor(), T.Normalize(mean,std)])
-            tensors.append(tf(img))
-    return tensors
+        rect = [base, base.transpose(Image.FLIP_LEFT_RIGHT)] if flip else [base]
+        groups.append(torch.stack([to_tensor_norm(v) for v in rect]))
+    return groups
+
+def build_tta_tensors(img: Image.Image, use_auto_ratio: bool):
+    """
+    返回一个 list[tensor] 做 TTA（兼容旧接口，逐视角展开）。
+    - 如果 use_auto_ratio=True：使用 512x384 / 384x512 的矩形输入 + 水平翻转
+    - 否则：使用与验证一致的 224 CenterCrop + 多尺度（256、288）
+    """
+    views = AUTO_RATIO_TTA_VIEWS if use_auto_ratio else DEFAULT_TTA_VIEWS
+    return [t for batch in build_tta_batches(img, views) for t in batch]
+
+def mean_logits(outputs: list):
+    """把各组前向输出 (n_i, C) 合并后对所有视角求平均，返回 (1, C)"""
+    import torch
+    return torch.cat(outputs, dim=0).float().mean(dim=0, keepdim=True)
 
 # ====== Top-K 预测 ======
-def predict_topk(img_path: str, topk: int = 5, tta: bool = True, auto_ratio: bool = False
-                 ) -> List[Tuple[str, float]]:
+def predict_topk(img_path: str, topk: int = 5, tta: bool = True, auto_ratio: bool = False,
+                 views: Optional[str] = None) -> List[Tuple[str, float]]:
     """
     返回 Top-K [(label, prob)]。
     参数:
       - topk: 返回前 K 个类别
       - tta: 是否启用测试时增强
       - auto_ratio: 是否按长宽比裁成 512x384/384x512（若 False 则与验证一致 224×224）
+      - views: 自定义 TTA 视角集合（见 parse_tta_views），指定后忽略 auto_ratio
+    所有视角堆叠成 batch，每种输入尺寸只做一次前向。
     """
+    import torch
+
+    model = registry.get(FOOD_VIT_MODEL)
+    device = get_device()
     img = Image.open(img_path).convert("RGB")
     img = ImageOps.exif_transpose(img)  # 矫正EXIF方向
 
-    with torch.no_grad(), torch.autocast(device.type, torch.float16 if device.type!="cpu" else torch.float32):
+    if views is None:
         if tta:
-            tensors = build_tta_tensors(img, use_auto_ratio=auto_ratio)
-            logits_sum = None
-            for t in tensors:
-                x = t.unsqueeze(0).to(device)
-                out = model(x)
-                logits_sum = out if logits_sum is None else (logits_sum + out)
-            logits = logits_sum / len(tensors)
+            views = AUTO_RATIO_TTA_VIEWS if auto_ratio else DEFAULT_TTA_VIEWS
         else:
             # 单视角输入
-            x = (to_tensor_norm(auto_resize_to_rect(img)) if auto_ratio else val_tf_224(img)).unsqueeze(0).to(device)
-            logits = model(x)
-
-        probs = F.softmax(logits, dim=1)[0]
-        top_prob, top_idx = torch.topk(probs, k=topk)
-        top_prob = top_prob.tolist()
-        top_idx = top_idx.tolist()
-        result = [(list_food_items[i], float(p)) for i, p in zip(top_idx, top_prob)]
-        return result
+            views = "auto_ratio" if auto_ratio else "256"
+
+    with torch.no_grad(), torch.autocast(device.type, torch.float16 if device.type!="cpu" else torch.float32):
+        outputs = [model(batch.to(device)) for batch in build_tta_batches(img, views)]
+        logits = mean_logits(outputs)
+
+    probs = torch.softmax(logits, dim=1)[0]
+    top_prob, top_idx = torch.topk(probs, k=min(topk, num_classes))
+    top_prob = top_prob.tolist()
+    top_idx = top_idx.tolist()
+    result = [(list_food_items[i], float(p)) for i, p in zip(top_idx, top_prob)]
+    return result
 
 # ====== 用法示例 ======
 # 1) 与验证一致的 224×224 + TTA（推荐先试这个，最稳）
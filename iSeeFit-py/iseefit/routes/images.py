@@ -0,0 +1,155 @@
+"""
+Image serving routes
+GET /images/{digest} serves a stored image (thumb / list / full, JPEG or a format from the Accept
+header) to users whose records reference it. Content-addressed URLs never change content, so
+responses carry a strong ETag derived from the hash and an immutable Cache-Control: clients
+revalidate with If-None-Match and get 304 without a body. Range requests are supported.
+
+GET /images/records/{record_type}/{record_id} resolves a record's image_path: it redirects to
+the content URL, or serves legacy file-path images directly.
+"""
+
+import os
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from sqlalchemy import exists, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.database import get_async_db
+from config.settings import settings
+from models import MealRecord, WorkoutRecord, WeightRecord
+from models.user import User
+from services.image_storage import FORMATS, VARIANTS, get_storage, image_ref, load_manifest, parse_image_ref, variant_key
+from services.ttl_cache import KeyedTTLCache
+from utils.auth import get_current_user
+from utils.file_serving import serve_bytes, serve_file
+from utils.image import is_pending
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/images", tags=["images"])
+
+RECORD_MODELS = {"meal": MealRecord, "workout": WorkoutRecord, "weight": WeightRecord}
+IMMUTABLE_CACHE = "private, max-age=31536000, immutable"
+LEGACY_CACHE = "private, no-cache"
+# Preferred order when the client accepts several formats
+FORMAT_PREFERENCE = ("avif", "webp", "jpeg")
+
+# Manifests never change once written; access is re-checked every few minutes
+manifest_cache = KeyedTTLCache(ttl_seconds=3600, max_entries=10000)
+access_cache = KeyedTTLCache(ttl_seconds=300, max_entries=50000)
+
+async def _manifest(digest: str) -> Optional[Dict[str, Any]]:
+    manifest, generation = manifest_cache.get(digest)
+    if manifest is None:
+        manifest = await run_in_threadpool(load_manifest, digest)
+        if manifest is not None:
+            manifest_cache.set(digest, manifest, generation)
+    return manifest
+
+async def _can_access(db: AsyncSession, user_id: int, digest: str) -> bool:
+    """The user has at least one record referencing the image"""
+    allowed, generation = access_cache.get((user_id, digest))
+    if allowed:
+        return True
+    ref = image_ref(digest)
+    allowed = bool(await db.scalar(select(or_(*(
+        exists().where(model.user_id == user_id, model.image_path == ref) for model in RECORD_MODELS.values()
+    )))))
+    if allowed:
+        access_cache.set((user_id, digest), True, generation)
+    return allowed
+
+def _pick_format(accept: Optional[str], available) -> str:
+    accept = (accept or "").lower()
+    for fmt in FORMAT_PREFERENCE:
+        if fmt in available and (fmt == "jpeg" or FORMATS[fmt]["content_type"] in accept):
+            return fmt
+    return "jpeg"
+
+@router.api_route("/{digest}", methods=["GET", "HEAD"])
+async def get_image(
+    digest: str,
+    request: Request,
+    size: str = Query("full", description="thumb, list or full"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Serve a stored image (strong ETag, 304 revalidation, Range, immutable caching)"""
+    if parse_image_ref(image_ref(digest)) is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if size not in dict(VARIANTS):
+        raise HTTPException(status_code=400, detail=f"size must be one of: {', '.join(dict(VARIANTS))}")
+    if not await _can_access(db, current_user.id, digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    manifest = await _manifest(digest)
+    if manifest is None:
+        if is_pending(digest):
+            # Uploaded moments ago; derivatives are still being generated
+            raise HTTPException(status_code=503, detail="Image is still being processed", headers={"Retry-After": "1"})
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    fmt = _pick_format(request.headers.get("accept"), manifest.get("formats", ["jpeg"]))
+    key = variant_key(digest, size, fmt)
+    etag = f'"{digest}-{size}.{FORMATS[fmt]["ext"]}"'
+    media_type = FORMATS[fmt]["content_type"]
+
+    storage = get_storage()
+    path = await run_in_threadpool(storage.local_path, key)
+    if path is not None:
+        stat_result = await run_in_threadpool(os.stat, path)
+        accel_path = f"{settings.IMAGE_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{key}" if settings.IMAGE_ACCEL_REDIRECT_PREFIX else None
+        return serve_file(request, path, etag, media_type, IMMUTABLE_CACHE, accel_path=accel_path, stat_result=stat_result)
+    try:
+        data = await run_in_threadpool(storage.get, key)
+    except Exception as e:
+        logger.warning(f"Failed to read image {key}: {e}")
+        raise HTTPException(status_code=404, detail="Image not found")
+    return serve_bytes(request, data, etag, media_type, IMMUTABLE_CACHE)
+
+@router.api_route("/records/{record_type}/{record_id}", methods=["GET", "HEAD"])
+async def get_record_image(
+    record_type: str,
+    record_id: int,
+    request: Request,
+    size: str = Query("full", description="thumb, list or full"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Image of a meal / workout / weight record"""
+    model = RECORD_MODELS.get(record_type)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Unknown record type: {record_type}")
+    image_path = await db.scalar(select(model.image_path).where(model.id == record_id, model.user_id == current_user.id))
+    if not image_path:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    digest = parse_image_ref(image_path)
+    if digest is not None:
+        # The record's image can change; the content URL it points to cannot
+        url = request.url_for("get_image", digest=digest).include_query_params(size=size)
+        return RedirectResponse(url=str(url), status_code=307, headers={"Cache-Control": LEGACY_CACHE})
+
+    # Legacy upload stored as a file path under UPLOAD_DIR
+    upload_root = os.path.abspath(settings.UPLOAD_DIR)
+    path = os.path.abspath(image_path)
+    if not path.startswith(upload_root + os.sep):
+        raise HTTPException(status_code=404, detail="Image not found")
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found")
+    etag = f'W/"{int(stat_result.st_mtime)}-{stat_result.st_size}"'
+    return serve_file(request, path, etag, "image/jpeg", LEGACY_CACHE, stat_result=stat_result)
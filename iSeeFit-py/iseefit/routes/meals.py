@@ -2,10 +2,11 @@
 饮食记录相关的 API 路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import logging
 
 import sys
@@ -15,17 +16,23 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
-from config.database import get_db
+from config.database import get_async_db, get_async_read_db
 from models.user import User
 from models.meal import MealRecord
-from models.schemas import MealRecordCreate, MealRecordResponse
+from models.schemas import MealRecordCreate, MealRecordResponse, MealRecordBatch, BatchResponse
 from utils.auth import get_current_user
-from utils.image import save_image
+from utils.image import release_image, save_image
+from utils.pagination import keyset_page, set_next_cursor
+from services.stats_service import day_range, MEAL_SUMS, rollup, averages
+from services.rollup_service import meal_rows
+from services.batch_ingest import ingest_batch
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/meals", tags=["meals"])
 
+MEAL_FIELDS = list(MEAL_SUMS)
+
 @router.post("/", response_model=MealRecordResponse)
 async def create_meal_record(
     meal_type: str = Form(...),
@@ -38,14 +45,14 @@ async def create_meal_record(
     notes: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建饮食记录"""
     try:
         # 保存图片
         image_path = None
         if image:
-            image_path = save_image(image, current_user.id, "meal")
+            image_path = await save_image(image, current_user.id, "meal")
         
         # 创建记录
         db_meal = MealRecord(
@@ -62,50 +69,75 @@ async def create_meal_record(
         )
         
         db.add(db_meal)
-        db.commit()
-        db.refresh(db_meal)
+        await db.commit()
+        await db.refresh(db_meal)
         
         logger.info(f"Meal record created for user {current_user.username}: {food_name}")
         return db_meal
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating meal record: {e}")
         raise HTTPException(status_code=500, detail="Failed to create meal record")
 
+@router.post("/batch", response_model=BatchResponse)
+async def create_meal_records_batch(
+    batch: MealRecordBatch,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量创建饮食记录（离线同步：client_id 已存在的记录返回 duplicate，不会重复写入）"""
+    def build_row(item):
+        row = item.model_dump(exclude={"client_id", "recorded_at"})
+        for field in ("protein", "carbs", "fat"):
+            row[field] = row[field] or 0
+        return row
+    
+    result = await ingest_batch(db, MealRecord, current_user.id, batch.records, build_row)
+    logger.info(f"Meal batch for user {current_user.username}: {result['created']} created, "
+                f"{result['duplicates']} duplicates, {result['errors']} errors")
+    return result
+
 @router.get("/", response_model=List[MealRecordResponse])
 async def get_meal_records(
+    response: Response,
     date_filter: Optional[date] = None,
     meal_type: Optional[str] = None,
-    limit: int = 50,
-    offset: int = 0,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    offset: Optional[int] = Query(None, ge=0, deprecated=True, description="旧版分页偏移量，建议改用 cursor"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取用户的饮食记录"""
-    query = db.query(MealRecord).filter(MealRecord.user_id == current_user.id)
+    """获取用户的饮食记录（按 recorded_at 倒序，游标分页：下一页游标在 X-Next-Cursor 响应头）"""
+    query = select(MealRecord).where(MealRecord.user_id == current_user.id)
     
     if date_filter:
-        query = query.filter(MealRecord.recorded_at >= date_filter)
-        query = query.filter(MealRecord.recorded_at < date_filter.replace(day=date_filter.day + 1))
+        start, end = day_range(date_filter)
+        query = query.where(MealRecord.recorded_at >= start, MealRecord.recorded_at < end)
     
     if meal_type:
-        query = query.filter(MealRecord.meal_type == meal_type)
+        query = query.where(MealRecord.meal_type == meal_type)
     
-    records = query.order_by(MealRecord.recorded_at.desc()).offset(offset).limit(limit).all()
+    records, next_cursor = await keyset_page(db, query, MealRecord.recorded_at, MealRecord.id, cursor, limit, offset)
+    set_next_cursor(response, next_cursor)
     return records
 
 @router.get("/today", response_model=List[MealRecordResponse])
 async def get_today_meal_records(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取今天的饮食记录"""
-    today = date.today()
-    records = db.query(MealRecord).filter(
-        MealRecord.user_id == current_user.id,
-        MealRecord.recorded_at >= today,
-        MealRecord.recorded_at < today.replace(day=today.day + 1)
-    ).order_by(MealRecord.recorded_at.desc()).all()
+    start, end = day_range(date.today())
+    records = (await db.scalars(
+        select(MealRecord).where(
+            MealRecord.user_id == current_user.id,
+            MealRecord.recorded_at >= start,
+            MealRecord.recorded_at < end
+        ).order_by(MealRecord.recorded_at.desc())
+    )).all()
     
     return records
 
@@ -113,130 +145,70 @@ async def get_today_meal_records(
 async def get_daily_meal_stats(
     target_date: Optional[date] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取每日饮食统计"""
     if not target_date:
         target_date = date.today()
     
-    records = db.query(MealRecord).filter(
-        MealRecord.user_id == current_user.id,
-        MealRecord.recorded_at >= target_date,
-        MealRecord.recorded_at < target_date.replace(day=target_date.day + 1)
-    ).all()
-    
-    total_calories = sum(record.calories for record in records)
-    total_protein = sum(record.protein for record in records)
-    total_carbs = sum(record.carbs for record in records)
-    total_fat = sum(record.fat for record in records)
+    # 读取当日汇总行（daily_user_rollups）
+    rows = await db.run_sync(meal_rows, current_user.id, target_date, target_date)
     
     # 按餐次分组
-    meal_stats = {}
-    for record in records:
-        if record.meal_type not in meal_stats:
-            meal_stats[record.meal_type] = {
-                "calories": 0,
-                "protein": 0,
-                "carbs": 0,
-                "fat": 0,
-                "count": 0
-            }
-        
-        meal_stats[record.meal_type]["calories"] += record.calories
-        meal_stats[record.meal_type]["protein"] += record.protein
-        meal_stats[record.meal_type]["carbs"] += record.carbs
-        meal_stats[record.meal_type]["fat"] += record.fat
-        meal_stats[record.meal_type]["count"] += 1
+    meal_stats = rollup(rows, lambda row: row["type"], MEAL_FIELDS)
     
     return {
         "date": target_date,
-        "total_calories": total_calories,
-        "total_protein": total_protein,
-        "total_carbs": total_carbs,
-        "total_fat": total_fat,
-        "meal_count": len(records),
+        "total_calories": sum(row["calories"] for row in rows),
+        "total_protein": sum(row["protein"] for row in rows),
+        "total_carbs": sum(row["carbs"] for row in rows),
+        "total_fat": sum(row["fat"] for row in rows),
+        "meal_count": sum(row["count"] for row in rows),
         "meal_stats": meal_stats
     }
 
 @router.get("/stats/weekly")
 async def get_weekly_meal_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取每周饮食统计"""
-    from datetime import timedelta
-    
     end_date = date.today()
     start_date = end_date - timedelta(days=6)
     
-    records = db.query(MealRecord).filter(
-        MealRecord.user_id == current_user.id,
-        MealRecord.recorded_at >= start_date,
-        MealRecord.recorded_at <= end_date
-    ).all()
-    
-    # 按日期分组
-    daily_stats = {}
-    for record in records:
-        record_date = record.recorded_at.date()
-        if record_date not in daily_stats:
-            daily_stats[record_date] = {
-                "calories": 0,
-                "protein": 0,
-                "carbs": 0,
-                "fat": 0,
-                "meal_count": 0
-            }
-        
-        daily_stats[record_date]["calories"] += record.calories
-        daily_stats[record_date]["protein"] += record.protein
-        daily_stats[record_date]["carbs"] += record.carbs
-        daily_stats[record_date]["fat"] += record.fat
-        daily_stats[record_date]["meal_count"] += 1
-    
-    # 计算平均值
-    total_days = len(daily_stats)
-    avg_calories = sum(stats["calories"] for stats in daily_stats.values()) / total_days if total_days > 0 else 0
-    avg_protein = sum(stats["protein"] for stats in daily_stats.values()) / total_days if total_days > 0 else 0
-    avg_carbs = sum(stats["carbs"] for stats in daily_stats.values()) / total_days if total_days > 0 else 0
-    avg_fat = sum(stats["fat"] for stats in daily_stats.values()) / total_days if total_days > 0 else 0
+    # 读取 7 天的汇总行，再按日期合并
+    rows = await db.run_sync(meal_rows, current_user.id, start_date, end_date)
+    daily_stats = rollup(rows, lambda row: row["day"], MEAL_FIELDS, count_name="meal_count")
     
     return {
         "start_date": start_date,
         "end_date": end_date,
         "daily_stats": daily_stats,
-        "averages": {
-            "calories": avg_calories,
-            "protein": avg_protein,
-            "carbs": avg_carbs,
-            "fat": avg_fat
-        }
+        # 计算平均值
+        "averages": averages(daily_stats, MEAL_FIELDS)
     }
 
 @router.delete("/{meal_id}")
 async def delete_meal_record(
     meal_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除饮食记录"""
-    meal = db.query(MealRecord).filter(
+    meal = await db.scalar(select(MealRecord).where(
         MealRecord.id == meal_id,
         MealRecord.user_id == current_user.id
-    ).first()
+    ))
     
     if not meal:
         raise HTTPException(status_code=404, detail="Meal record not found")
     
-    # 删除图片文件
-    if meal.image_path and os.path.exists(meal.image_path):
-        try:
-            os.remove(meal.image_path)
-        except Exception as e:
-            logger.warning(f"Failed to delete image file: {e}")
+    image_path = meal.image_path
+    await db.delete(meal)
+    await db.commit()
     
-    db.delete(meal)
-    db.commit()
+    # 删除图片（其他记录仍引用同一图片时保留）
+    await release_image(db, image_path)
     
     logger.info(f"Meal record deleted: {meal_id}")
     return {"message": "Meal record deleted successfully"}
@@ -254,13 +226,13 @@ async def update_meal_record(
     notes: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新饮食记录"""
-    meal = db.query(MealRecord).filter(
+    meal = await db.scalar(select(MealRecord).where(
         MealRecord.id == meal_id,
         MealRecord.user_id == current_user.id
-    ).first()
+    ))
     
     if not meal:
         raise HTTPException(status_code=404, detail="Meal record not found")
@@ -276,19 +248,18 @@ async def update_meal_record(
     meal.notes = notes
     
     # 处理新图片
+    old_image_path = None
     if image:
-        # 删除旧图片
-        if meal.image_path and os.path.exists(meal.image_path):
-            try:
-                os.remove(meal.image_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete old image: {e}")
-        
-        # 保存新图片
-        meal.image_path = save_image(image, current_user.id, "meal")
+        # 先保存新图片，失败时保留旧图片
+        old_image_path = meal.image_path
+        meal.image_path = await save_image(image, current_user.id, "meal")
+    
+    await db.commit()
+    await db.refresh(meal)
     
-    db.commit()
-    db.refresh(meal)
+    # 删除不再使用的旧图片
+    if old_image_path != meal.image_path:
+        await release_image(db, old_image_path)
     
     logger.info(f"Meal record updated: {meal_id}")
     return meal
@@ -2,14 +2,17 @@
 推荐相关的 API 路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException, FastAPI, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, FastAPI, UploadFile, File, Form, Query, Response
 from fastapi.responses import StreamingResponse
-from io import BytesIO
+from starlette.concurrency import run_in_threadpool
 import base64
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
+import json
 import logging
+import os
 import sys
 from pathlib import Path
 
@@ -17,14 +20,22 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
-from config.database import get_db
+from config.database import get_async_db
+from config.settings import settings
 from models.user import User
 from models.recommendation import Recommendation
 from models.schemas import RecommendationResponse
 from utils.auth import get_current_user
+from utils.pagination import keyset_page, set_next_cursor
 from services.recommendation_service import RecommendationService
+from services.recommendation_stats import cached_recommendation_stats, invalidate_recommendation_stats
 from services.simple_food_advisor import get_food_advice
-from services.detect_motion_service import process_video_bytes, process_video_bytes_to_frames
+from services.detect_motion_service import (
+    process_video_file, process_video_bytes_to_frames, analyze_motion_file, save_upload, new_temp_path,
+    iter_frame_stream, FRAME_STREAM_BOUNDARY
+)
+from services.video_pipeline import iter_file_chunks, probe_video
+from services.frame_sampling import SAMPLING_STRATEGIES
 
 logger = logging.getLogger(__name__)
 
@@ -43,27 +54,30 @@ class RecommendationResponse:
 
 @router.get("/")
 async def get_recommendations(
+    response: Response,
     recommendation_type: Optional[str] = None,
     priority: Optional[str] = None,
     is_read: Optional[bool] = None,
-    limit: int = 20,
-    offset: int = 0,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    offset: Optional[int] = Query(None, ge=0, deprecated=True, description="旧版分页偏移量，建议改用 cursor"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取用户的推荐列表"""
-    query = db.query(Recommendation).filter(Recommendation.user_id == current_user.id)
+    """获取用户的推荐列表（按 created_at 倒序，游标分页：下一页游标在 X-Next-Cursor 响应头）"""
+    query = select(Recommendation).where(Recommendation.user_id == current_user.id)
     
     if recommendation_type:
-        query = query.filter(Recommendation.recommendation_type == recommendation_type)
+        query = query.where(Recommendation.recommendation_type == recommendation_type)
     
     if priority:
-        query = query.filter(Recommendation.priority == priority)
+        query = query.where(Recommendation.priority == priority)
     
     if is_read is not None:
-        query = query.filter(Recommendation.is_read == is_read)
+        query = query.where(Recommendation.is_read == is_read)
     
-    recommendations = query.order_by(Recommendation.created_at.desc()).offset(offset).limit(limit).all()
+    recommendations, next_cursor = await keyset_page(db, query, Recommendation.created_at, Recommendation.id, cursor, limit, offset)
+    set_next_cursor(response, next_cursor)
     
     return [
         RecommendationResponse(
@@ -80,13 +94,15 @@ async def get_recommendations(
 @router.get("/unread")
 async def get_unread_recommendations(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取未读推荐"""
-    recommendations = db.query(Recommendation).filter(
-        Recommendation.user_id == current_user.id,
-        Recommendation.is_read == False
-    ).order_by(Recommendation.created_at.desc()).all()
+    recommendations = (await db.scalars(
+        select(Recommendation).where(
+            Recommendation.user_id == current_user.id,
+            Recommendation.is_read == False
+        ).order_by(Recommendation.created_at.desc())
+    )).all()
     
     return [
         RecommendationResponse(
@@ -120,35 +136,77 @@ async def getadvice(request: dict):
     }
 
 @router.post("/process-video/")
-async def upload_video(file: UploadFile = File(...)):
+async def upload_video(file: UploadFile = File(...), sampling: Optional[str] = Form(None)):
     if not file.filename.endswith(".mp4"):
         raise HTTPException(status_code=400, detail="Only MP4 files are supported.")
-    video_bytes = await file.read()
+    if sampling and sampling not in SAMPLING_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"sampling must be one of {', '.join(SAMPLING_STRATEGIES)}")
 
+    # 上传分块落盘，处理在线程池中运行，不阻塞事件循环
+    input_path = await run_in_threadpool(save_upload, file.file)
+    output_path = new_temp_path("_processed.mp4")
     try:
-        processed_bytes = process_video_bytes(video_bytes, file.filename, max_duration=10)
+        stats = await run_in_threadpool(process_video_file, input_path, output_path, 10, sampling)
     except Exception as e:
+        for path in (input_path, output_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
         raise HTTPException(status_code=500, detail=str(e))
 
-    return StreamingResponse(BytesIO(processed_bytes), media_type="video/mp4", headers={
-        "Content-Disposition": f"attachment; filename=processed_video.mp4"
-    })
+    # mp4 的索引在编码结束时才写入，因此结果文件完成后再分块流式返回，返回完毕后删除临时文件
+    return StreamingResponse(
+        iter_file_chunks(output_path, settings.VIDEO_STREAM_CHUNK_SIZE, cleanup=(input_path,)),
+        media_type="video/mp4",
+        headers={
+            "Content-Disposition": f"attachment; filename=processed_video.mp4",
+            "Content-Length": str(os.path.getsize(output_path)),
+            # 结构化的动作 / 卡路里结果（JSON），客户端无需解析视频
+            "X-Motion-Analysis": json.dumps(stats["motion"], separators=(",", ":")),
+        },
+    )
+
+@router.post("/analyze-motion/")
+async def analyze_motion(file: UploadFile = File(...), max_duration: int = Form(10)):
+    """
+    只做动作识别和卡路里估算，返回分段 JSON（不跑姿态模型、不生成视频）
+    """
+    if not file.filename.endswith(".mp4"):
+        raise HTTPException(status_code=400, detail="Only MP4 files are supported.")
+
+    input_path = await run_in_threadpool(save_upload, file.file)
+    try:
+        motion = await run_in_threadpool(analyze_motion_file, input_path, max_duration)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        try:
+            os.remove(input_path)
+        except OSError:
+            pass
+    return {"success": True, **motion}
 
 
 @router.post("/process-video-frames/")
 async def process_video_frames(
     video_file: UploadFile = File(...),
-    max_duration: int = Form(10)
+    max_duration: int = Form(10),
+    sampling: Optional[str] = Form(None)
 ):
     """
     处理视频并返回帧列表（新增API，不影响原有接口）
+    所有帧 base64 后一次性返回；新客户端请使用 /process-video-frames/stream
     """
     try:
         video_bytes = await video_file.read()
-        frames = process_video_bytes_to_frames(video_bytes, video_file.filename, max_duration)
+        # 姿态推理和编码都是阻塞操作，放到线程池执行，避免阻塞事件循环
+        frames = await run_in_threadpool(
+            process_video_bytes_to_frames, video_bytes, video_file.filename, max_duration, sampling
+        )
         
         # 将帧转换为base64编码
-        frames_base64 = [base64.b64encode(frame).decode() for frame in frames]
+        frames_base64 = await run_in_threadpool(lambda: [base64.b64encode(frame).decode() for frame in frames])
         
         return {
             "success": True,
@@ -167,55 +225,69 @@ async def process_video_frames(
         }
         
 
+@router.post("/process-video-frames/stream")
+async def stream_video_frames(
+    video_file: UploadFile = File(...),
+    max_duration: int = Form(10),
+    sampling: Optional[str] = Form(None),
+    format: str = Form("mjpeg"),
+    max_width: int = Form(0),
+    quality: int = Form(80)
+):
+    """
+    流式返回处理后的帧：每帧编码完成立即发送，客户端收到第一帧即可开始渲染
+    - format=mjpeg: multipart/x-mixed-replace（image/jpeg 分段，最后一段为 JSON 结果）
+    - format=binary: 长度前缀二进制（1 字节类型 F/J + 4 字节大端长度 + 数据）
+    - max_width: 输出帧最大宽度（0 为不缩放），quality: JPEG 质量 1-100
+    """
+    if format not in ("mjpeg", "binary"):
+        raise HTTPException(status_code=400, detail="format must be 'mjpeg' or 'binary'")
+    if sampling and sampling not in SAMPLING_STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"sampling must be one of {', '.join(SAMPLING_STRATEGIES)}")
+    if not 1 <= quality <= 100 or max_width < 0:
+        raise HTTPException(status_code=400, detail="quality must be 1-100 and max_width >= 0")
+
+    input_path = await run_in_threadpool(save_upload, video_file.file)
+    try:
+        info = await run_in_threadpool(probe_video, input_path, max_duration)
+    except Exception as e:
+        os.remove(input_path)
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "mjpeg":
+        media_type = f"multipart/x-mixed-replace; boundary={FRAME_STREAM_BOUNDARY}"
+    else:
+        media_type = "application/octet-stream"
+    return StreamingResponse(
+        iter_frame_stream(input_path, max_duration, sampling, format, max_width, quality),
+        media_type=media_type,
+        headers={
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",  # 关闭反向代理缓冲
+            "X-Video-Fps": str(info.fps),
+            "X-Max-Frames": str(info.max_frames),
+        },
+    )
+
 @router.get("/stats")
 async def get_recommendation_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    # 有意读主库：失效后首次读取会回填按用户缓存，落后的只读副本会把旧计数缓存一个 TTL
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取推荐统计信息"""
-    total_recommendations = db.query(Recommendation).filter(
-        Recommendation.user_id == current_user.id
-    ).count()
-    
-    unread_recommendations = db.query(Recommendation).filter(
-        Recommendation.user_id == current_user.id,
-        Recommendation.is_read == False
-    ).count()
-    
-    # 按类型统计
-    type_stats = {}
-    for rec_type in ["meal", "workout", "general"]:
-        count = db.query(Recommendation).filter(
-            Recommendation.user_id == current_user.id,
-            Recommendation.recommendation_type == rec_type
-        ).count()
-        type_stats[rec_type] = count
-    
-    # 按优先级统计
-    priority_stats = {}
-    for priority in ["low", "medium", "high"]:
-        count = db.query(Recommendation).filter(
-            Recommendation.user_id == current_user.id,
-            Recommendation.priority == priority
-        ).count()
-        priority_stats[priority] = count
-    
-    return {
-        "total_recommendations": total_recommendations,
-        "unread_recommendations": unread_recommendations,
-        "read_recommendations": total_recommendations - unread_recommendations,
-        "type_stats": type_stats,
-        "priority_stats": priority_stats
-    }
+    """获取推荐统计信息（单次 GROUP BY 查询，按用户缓存）"""
+    return await cached_recommendation_stats(db, current_user.id)
 
 @router.post("/generate")
 async def generate_new_recommendations(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """生成新的推荐"""
     try:
-        recommendations = get_recommendations_for_user(current_user.id, db)
+        recommendations = await db.run_sync(
+            lambda session: RecommendationService(session).generate_recommendations(current_user)
+        )
         
         logger.info(f"Generated {len(recommendations)} new recommendations for user {current_user.username}")
         return {
@@ -230,19 +302,20 @@ async def generate_new_recommendations(
 async def mark_recommendation_as_read(
     recommendation_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """标记推荐为已读"""
-    recommendation = db.query(Recommendation).filter(
+    recommendation = await db.scalar(select(Recommendation).where(
         Recommendation.id == recommendation_id,
         Recommendation.user_id == current_user.id
-    ).first()
+    ))
     
     if not recommendation:
         raise HTTPException(status_code=404, detail="Recommendation not found")
     
     recommendation.is_read = True
-    db.commit()
+    await db.commit()
+    invalidate_recommendation_stats(current_user.id)
     
     logger.info(f"Recommendation {recommendation_id} marked as read for user {current_user.username}")
     return {"message": "Recommendation marked as read"}
@@ -250,15 +323,18 @@ async def mark_recommendation_as_read(
 @router.put("/read-all")
 async def mark_all_recommendations_as_read(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """标记所有推荐为已读"""
-    updated_count = db.query(Recommendation).filter(
-        Recommendation.user_id == current_user.id,
-        Recommendation.is_read == False
-    ).update({"is_read": True})
+    result = await db.execute(
+        update(Recommendation)
+        .where(Recommendation.user_id == current_user.id, Recommendation.is_read == False)
+        .values(is_read=True)
+    )
+    updated_count = result.rowcount
     
-    db.commit()
+    await db.commit()
+    invalidate_recommendation_stats(current_user.id)
     
     logger.info(f"Marked {updated_count} recommendations as read for user {current_user.username}")
     return {"message": f"Marked {updated_count} recommendations as read"}
@@ -267,19 +343,20 @@ async def mark_all_recommendations_as_read(
 async def delete_recommendation(
     recommendation_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除推荐"""
-    recommendation = db.query(Recommendation).filter(
+    recommendation = await db.scalar(select(Recommendation).where(
         Recommendation.id == recommendation_id,
         Recommendation.user_id == current_user.id
-    ).first()
+    ))
     
     if not recommendation:
         raise HTTPException(status_code=404, detail="Recommendation not found")
     
-    db.delete(recommendation)
-    db.commit()
+    await db.delete(recommendation)
+    await db.commit()
+    invalidate_recommendation_stats(current_user.id)
     
     logger.info(f"Recommendation {recommendation_id} deleted for user {current_user.username}")
     return {"message": "Recommendation deleted successfully"}
@@ -288,13 +365,13 @@ async def delete_recommendation(
 async def get_recommendation_detail(
     recommendation_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取推荐详情"""
-    recommendation = db.query(Recommendation).filter(
+    recommendation = await db.scalar(select(Recommendation).where(
         Recommendation.id == recommendation_id,
         Recommendation.user_id == current_user.id
-    ).first()
+    ))
     
     if not recommendation:
         raise HTTPException(status_code=404, detail="Recommendation not found")
@@ -302,7 +379,8 @@ async def get_recommendation_detail(
     # 标记为已读
     if not recommendation.is_read:
         recommendation.is_read = True
-        db.commit()
+        await db.commit()
+        invalidate_recommendation_stats(current_user.id)
     
     return RecommendationResponse(
         id=recommendation.id,
@@ -313,34 +391,3 @@ async def get_recommendation_detail(
         is_read=recommendation.is_read,
         created_at=recommendation.created_at
     )
-
-@router.post("/process-video-frames/")
-async def process_video_frames(
-    video_file: UploadFile = File(...),
-    max_duration: int = Form(10)
-):
-    """
-    处理视频并返回帧列表（新增API，不影响原有接口）
-    """
-    try:
-        video_bytes = await video_file.read()
-        frames = process_video_bytes_to_frames(video_bytes, video_file.filename, max_duration)
-        
-        # 将帧转换为base64编码
-        frames_base64 = [base64.b64encode(frame).decode() for frame in frames]
-        
-        return {
-            "success": True,
-            "frames": frames_base64,
-            "total_frames": len(frames),
-            "fps": 30,
-            "duration": max_duration,
-            "message": f"Successfully processed {len(frames)} frames"
-        }
-        
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "message": "Failed to process video frames"
-        }
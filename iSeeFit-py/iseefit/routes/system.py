@@ -0,0 +1,71 @@
+"""
+System / operations routes
+Model registry status, warm-up and unloading; database pool, password hasher, image queue and idempotency store metrics
+"""
+
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+import logging
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.database import pool_stats
+from services.model_registry import registry
+from services.password_hasher import password_hasher
+from utils.idempotency import idempotency_store
+from utils.image import image_queue_stats
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/system", tags=["system"])
+
+@router.get("/models")
+async def get_models():
+    """List registered models with load state and memory usage"""
+    return registry.status()
+
+@router.post("/models/warmup")
+async def warmup_models(models: Optional[str] = None):
+    """Load models ahead of traffic; `models` is a comma-separated list (default: all)"""
+    names = [m.strip() for m in models.split(",") if m.strip()] if models else None
+    unknown = [n for n in names or [] if n not in registry.names()]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown model(s): {', '.join(unknown)}")
+
+    results = await run_in_threadpool(registry.warmup, names)
+    logger.info(f"Warm-up finished for: {', '.join(results)}")
+    return {"models": results, "total_memory_mb": registry.status()["total_memory_mb"]}
+
+@router.post("/models/{name}/unload")
+async def unload_model(name: str):
+    """Unload a model to free memory; it is reloaded on next use"""
+    if name not in registry.names():
+        raise HTTPException(status_code=404, detail=f"Unknown model: {name}")
+    unloaded = await run_in_threadpool(registry.unload, name)
+    return {"model": name, "unloaded": unloaded}
+
+@router.get("/db/pool")
+async def get_db_pool():
+    """Connection pool occupancy, checkout wait times, overflow events and timeouts per engine"""
+    return pool_stats()
+
+@router.get("/auth/hasher")
+async def get_password_hasher():
+    """bcrypt pool load: pending and queued operations, queue wait and hash times, rejections, rehashes"""
+    return password_hasher.stats()
+
+@router.get("/images/queue")
+async def get_image_queue():
+    """Deferred image downscales: pending jobs, processed and failed counts"""
+    return image_queue_stats()
+
+@router.get("/idempotency")
+async def get_idempotency_store():
+    """Idempotency-Key store: entries, stored responses, replays, key conflicts and in-progress retries"""
+    return await run_in_threadpool(idempotency_store.stats)
@@ -6,23 +6,27 @@
 #
 
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func, and_
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, date, timedelta
 from typing import Optional, List
 import math
 import os
 
-from config.database import get_db
+from config.database import get_async_db, get_async_read_db
 from models.user import User
 from models.weight import WeightRecord
 from models.schemas import (
-    WeightRecordCreate, WeightRecordUpdate, WeightRecordResponse,
+    WeightRecordCreate, WeightRecordUpdate, WeightRecordResponse, WeightRecordBatch, BatchResponse,
     BMICalculationRequest, BMICalculationResponse,
     WeightStatsResponse, WeightHistoryResponse, WeightTrendResponse
 )
 from utils.auth import get_current_user
-from utils.image import save_image
+from utils.image import release_image, save_image
+from utils.pagination import keyset_page
+from services.stats_service import day_range
+from services.rollup_service import get_rollups, weight_summary, weight_record_count
+from services.batch_ingest import BatchItemError, ingest_batch
 
 router = APIRouter(prefix="/weight", tags=["weight"])
 
@@ -64,9 +68,8 @@ def get_bmi_category(bmi: float) -> dict:
 @router.post("/", response_model=WeightRecordResponse)
 async def create_weight_record(
     weight_data: WeightRecordCreate,
-    image: Optional[UploadFile] = File(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建体重记录"""
     try:
@@ -78,74 +81,103 @@ async def create_weight_record(
         # 计算 BMI
         bmi = calculate_bmi(weight_data.weight, user_height)
         
-        # 处理图片上传
-        image_path = None
-        if image:
-            image_path = await save_image(image, "weight", current_user.id)
-        
         # 创建体重记录
         weight_record = WeightRecord(
             user_id=current_user.id,
             weight=weight_data.weight,
             height=user_height,
             bmi=bmi,
-            notes=weight_data.notes,
-            image_path=image_path
+            notes=weight_data.notes
         )
         
         db.add(weight_record)
-        db.commit()
-        db.refresh(weight_record)
+        await db.commit()
+        await db.refresh(weight_record)
         
         print(f"DEBUG: Created weight record for user {current_user.id}: {weight_data.weight}kg, BMI: {bmi}")
         return weight_record
         
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"ERROR: Failed to create weight record: {str(e)}")
         raise HTTPException(status_code=500, detail=f"创建体重记录失败: {str(e)}")
 
+@router.post("/batch", response_model=BatchResponse)
+async def create_weight_records_batch(
+    batch: WeightRecordBatch,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量创建体重记录（离线同步：client_id 已存在的记录返回 duplicate，不会重复写入）"""
+    def build_row(item):
+        height = item.height or current_user.height
+        if not height:
+            raise BatchItemError("用户身高信息缺失，请先完善个人资料")
+        return {
+            "weight": item.weight,
+            "height": height,
+            "bmi": calculate_bmi(item.weight, height),
+            "notes": item.notes,
+        }
+    
+    return await ingest_batch(db, WeightRecord, current_user.id, batch.records, build_row)
+
 @router.get("/", response_model=WeightHistoryResponse)
 async def get_weight_history(
-    page: int = Query(1, ge=1, description="页码"),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    page: Optional[int] = Query(None, ge=1, description="页码（旧版分页，建议改用 cursor）"),
     page_size: int = Query(20, ge=1, le=100, description="每页数量"),
     start_date: Optional[date] = Query(None, description="开始日期"),
     end_date: Optional[date] = Query(None, description="结束日期"),
+    include_total: bool = Query(True, description="是否返回总数（来自每日汇总表）"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取体重历史记录"""
+    """获取体重历史记录（按 recorded_at 倒序，游标分页）"""
     try:
         # 构建查询条件
-        query = db.query(WeightRecord).filter(WeightRecord.user_id == current_user.id)
+        query = select(WeightRecord).where(WeightRecord.user_id == current_user.id)
         
         if start_date:
-            query = query.filter(WeightRecord.recorded_at >= start_date)
+            query = query.where(WeightRecord.recorded_at >= day_range(start_date)[0])
         if end_date:
-            query = query.filter(WeightRecord.recorded_at <= end_date)
-        
-        # 获取总数
-        total_count = query.count()
-        
-        # 分页查询
-        offset = (page - 1) * page_size
-        records = query.order_by(desc(WeightRecord.recorded_at)).offset(offset).limit(page_size).all()
-        
-        # 计算分页信息
-        has_next = offset + page_size < total_count
-        has_prev = page > 1
+            query = query.where(WeightRecord.recorded_at < day_range(end_date)[1])
+        
+        if cursor or not page or page == 1:
+            # 游标分页：每一页都是索引范围扫描，与翻页深度无关
+            records, next_cursor = await keyset_page(db, query, WeightRecord.recorded_at, WeightRecord.id, cursor, page_size)
+            has_next = next_cursor is not None
+            has_prev = cursor is not None
+        else:
+            # 旧版页码分页（保留给未升级的客户端）
+            offset = (page - 1) * page_size
+            records = (await db.scalars(
+                query.order_by(desc(WeightRecord.recorded_at), desc(WeightRecord.id)).offset(offset).limit(page_size + 1)
+            )).all()
+            has_next = len(records) > page_size
+            records = records[:page_size]
+            next_cursor = None
+            has_prev = True
+        
+        # 总数从每日汇总表读取（每天一行），不再对原始记录 COUNT
+        total_count = await db.run_sync(weight_record_count, current_user.id, start_date, end_date) if include_total else None
         
         print(f"DEBUG: Retrieved {len(records)} weight records for user {current_user.id}")
         
         return WeightHistoryResponse(
             records=records,
             total_count=total_count,
-            page=page,
+            page=page or 1,
             page_size=page_size,
             has_next=has_next,
-            has_prev=has_prev
+            has_prev=has_prev,
+            next_cursor=next_cursor
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"ERROR: Failed to get weight history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取体重历史失败: {str(e)}")
@@ -154,24 +186,18 @@ async def get_weight_history(
 async def get_weight_stats(
     days: int = Query(30, ge=1, le=365, description="统计天数"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取体重统计信息"""
     try:
         # 计算日期范围
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
+        end_date = date.today()
+        start_date = (datetime.now() - timedelta(days=days)).date()
         
-        # 查询指定时间范围内的体重记录
-        records = db.query(WeightRecord).filter(
-            and_(
-                WeightRecord.user_id == current_user.id,
-                WeightRecord.recorded_at >= start_date,
-                WeightRecord.recorded_at <= end_date
-            )
-        ).order_by(WeightRecord.recorded_at.desc()).all()
+        # 读取时间范围内的每日汇总行（daily_user_rollups），不再扫描全部体重记录
+        summary = weight_summary(await db.run_sync(get_rollups, current_user.id, start_date, end_date))
         
-        if not records:
+        if not summary:
             # 如果没有记录，返回默认值
             return WeightStatsResponse(
                 current_weight=current_user.weight or 0.0,
@@ -188,23 +214,22 @@ async def get_weight_stats(
             )
         
         # 计算统计数据
-        current_weight = records[0].weight
-        previous_weight = records[1].weight if len(records) > 1 else None
+        current_weight = summary["current_weight"]
+        previous_weight = summary["previous_weight"]
         
         weight_change = current_weight - previous_weight if previous_weight else 0.0
         weight_change_percentage = (weight_change / previous_weight * 100) if previous_weight else 0.0
         
-        weights = [record.weight for record in records]
-        average_weight = sum(weights) / len(weights)
-        min_weight = min(weights)
-        max_weight = max(weights)
+        average_weight = summary["average_weight"]
+        min_weight = summary["min_weight"]
+        max_weight = summary["max_weight"]
         
         # 计算当前 BMI
         user_height = current_user.height or 170.0
         current_bmi = calculate_bmi(current_weight, user_height)
         bmi_info = get_bmi_category(current_bmi)
         
-        print(f"DEBUG: Calculated weight stats for user {current_user.id}: {len(records)} records")
+        print(f"DEBUG: Calculated weight stats for user {current_user.id}: {summary['record_count']} records")
         
         return WeightStatsResponse(
             current_weight=current_weight,
@@ -214,7 +239,7 @@ async def get_weight_stats(
             average_weight=round(average_weight, 1),
             min_weight=min_weight,
             max_weight=max_weight,
-            record_count=len(records),
+            record_count=summary["record_count"],
             bmi=current_bmi,
             bmi_category=bmi_info["category"],
             period_days=days
@@ -228,7 +253,7 @@ async def get_weight_stats(
 async def get_weight_trend(
     days: int = Query(30, ge=7, le=365, description="趋势天数"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取体重趋势数据"""
     try:
@@ -237,13 +262,13 @@ async def get_weight_trend(
         start_date = end_date - timedelta(days=days)
         
         # 查询体重记录
-        records = db.query(WeightRecord).filter(
-            and_(
+        records = (await db.scalars(
+            select(WeightRecord).where(
                 WeightRecord.user_id == current_user.id,
                 WeightRecord.recorded_at >= start_date,
                 WeightRecord.recorded_at <= end_date
-            )
-        ).order_by(WeightRecord.recorded_at.asc()).all()
+            ).order_by(WeightRecord.recorded_at.asc())
+        )).all()
         
         # 构建每日数据
         daily_data = []
@@ -336,17 +361,15 @@ async def update_weight_record(
     weight_id: int,
     weight_data: WeightRecordUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新体重记录"""
     try:
         # 查找体重记录
-        weight_record = db.query(WeightRecord).filter(
-            and_(
-                WeightRecord.id == weight_id,
-                WeightRecord.user_id == current_user.id
-            )
-        ).first()
+        weight_record = await db.scalar(select(WeightRecord).where(
+            WeightRecord.id == weight_id,
+            WeightRecord.user_id == current_user.id
+        ))
         
         if not weight_record:
             raise HTTPException(status_code=404, detail="体重记录不存在")
@@ -364,8 +387,8 @@ async def update_weight_record(
             height = weight_record.height or current_user.height or 170.0
             weight_record.bmi = calculate_bmi(weight_record.weight, height)
         
-        db.commit()
-        db.refresh(weight_record)
+        await db.commit()
+        await db.refresh(weight_record)
         
         print(f"DEBUG: Updated weight record {weight_id} for user {current_user.id}")
         return weight_record
@@ -373,39 +396,69 @@ async def update_weight_record(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"ERROR: Failed to update weight record: {str(e)}")
         raise HTTPException(status_code=500, detail=f"更新体重记录失败: {str(e)}")
 
+@router.post("/{weight_id}/image", response_model=WeightRecordResponse)
+async def upload_weight_image(
+    weight_id: int,
+    image: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """上传体重照片（创建记录使用 JSON 请求体，照片单独以 multipart 上传）"""
+    try:
+        weight_record = await db.scalar(select(WeightRecord).where(
+            WeightRecord.id == weight_id,
+            WeightRecord.user_id == current_user.id
+        ))
+        
+        if not weight_record:
+            raise HTTPException(status_code=404, detail="体重记录不存在")
+        
+        # 先保存新图片，再释放旧图片
+        old_image_path = weight_record.image_path
+        weight_record.image_path = await save_image(image, current_user.id, "weight")
+        await db.commit()
+        await db.refresh(weight_record)
+        
+        if old_image_path != weight_record.image_path:
+            await release_image(db, old_image_path)
+        
+        return weight_record
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        print(f"ERROR: Failed to upload weight image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"上传体重照片失败: {str(e)}")
+
 @router.delete("/{weight_id}")
 async def delete_weight_record(
     weight_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除体重记录"""
     try:
         # 查找体重记录
-        weight_record = db.query(WeightRecord).filter(
-            and_(
-                WeightRecord.id == weight_id,
-                WeightRecord.user_id == current_user.id
-            )
-        ).first()
+        weight_record = await db.scalar(select(WeightRecord).where(
+            WeightRecord.id == weight_id,
+            WeightRecord.user_id == current_user.id
+        ))
         
         if not weight_record:
             raise HTTPException(status_code=404, detail="体重记录不存在")
         
-        # 删除关联的图片文件
-        if weight_record.image_path:
-            try:
-                os.remove(weight_record.image_path)
-            except OSError:
-                pass  # 文件不存在或无法删除，忽略错误
-        
         # 删除记录
-        db.delete(weight_record)
-        db.commit()
+        image_path = weight_record.image_path
+        await db.delete(weight_record)
+        await db.commit()
+        
+        # 删除关联的图片（其他记录仍引用同一图片时保留）
+        await release_image(db, image_path)
         
         print(f"DEBUG: Deleted weight record {weight_id} for user {current_user.id}")
         return {"message": "体重记录删除成功"}
@@ -413,20 +466,21 @@ async def delete_weight_record(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"ERROR: Failed to delete weight record: {str(e)}")
         raise HTTPException(status_code=500, detail=f"删除体重记录失败: {str(e)}")
 
 @router.get("/latest", response_model=WeightRecordResponse)
 async def get_latest_weight(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取最新的体重记录"""
     try:
-        latest_record = db.query(WeightRecord).filter(
-            WeightRecord.user_id == current_user.id
-        ).order_by(desc(WeightRecord.recorded_at)).first()
+        latest_record = await db.scalar(
+            select(WeightRecord).where(WeightRecord.user_id == current_user.id)
+            .order_by(desc(WeightRecord.recorded_at), desc(WeightRecord.id)).limit(1)
+        )
         
         if not latest_record:
             raise HTTPException(status_code=404, detail="暂无体重记录")
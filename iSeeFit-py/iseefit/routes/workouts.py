@@ -2,10 +2,11 @@
 健身记录相关的 API 路由
 """
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import logging
 
 import sys
@@ -15,17 +16,23 @@ from pathlib import Path
 parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
-from config.database import get_db
+from config.database import get_async_db, get_async_read_db
 from models.user import User
 from models.workout import WorkoutRecord
-from models.schemas import WorkoutRecordCreate, WorkoutRecordResponse
+from models.schemas import WorkoutRecordCreate, WorkoutRecordResponse, WorkoutRecordBatch, BatchResponse
 from utils.auth import get_current_user
-from utils.image import save_image
+from utils.image import release_image, save_image
+from utils.pagination import keyset_page, set_next_cursor
+from services.stats_service import day_range, WORKOUT_SUMS, rollup, averages
+from services.rollup_service import workout_rows
+from services.batch_ingest import ingest_batch
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/workouts", tags=["workouts"])
 
+WORKOUT_FIELDS = list(WORKOUT_SUMS)
+
 @router.post("/", response_model=WorkoutRecordResponse)
 async def create_workout_record(
     workout_type: str = Form(...),
@@ -38,14 +45,14 @@ async def create_workout_record(
     notes: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """创建健身记录"""
     try:
         # 保存图片
         image_path = None
         if image:
-            image_path = save_image(image, current_user.id, "workout")
+            image_path = await save_image(image, current_user.id, "workout")
         
         # 创建记录
         db_workout = WorkoutRecord(
@@ -62,50 +69,72 @@ async def create_workout_record(
         )
         
         db.add(db_workout)
-        db.commit()
-        db.refresh(db_workout)
+        await db.commit()
+        await db.refresh(db_workout)
         
         logger.info(f"Workout record created for user {current_user.username}: {workout_type}")
         return db_workout
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating workout record: {e}")
         raise HTTPException(status_code=500, detail="Failed to create workout record")
 
+@router.post("/batch", response_model=BatchResponse)
+async def create_workout_records_batch(
+    batch: WorkoutRecordBatch,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量创建健身记录（离线同步：client_id 已存在的记录返回 duplicate，不会重复写入）"""
+    def build_row(item):
+        return item.model_dump(exclude={"client_id", "recorded_at"})
+    
+    result = await ingest_batch(db, WorkoutRecord, current_user.id, batch.records, build_row)
+    logger.info(f"Workout batch for user {current_user.username}: {result['created']} created, "
+                f"{result['duplicates']} duplicates, {result['errors']} errors")
+    return result
+
 @router.get("/", response_model=List[WorkoutRecordResponse])
 async def get_workout_records(
+    response: Response,
     date_filter: Optional[date] = None,
     workout_type: Optional[str] = None,
-    limit: int = 50,
-    offset: int = 0,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 的值"),
+    offset: Optional[int] = Query(None, ge=0, deprecated=True, description="旧版分页偏移量，建议改用 cursor"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """获取用户的健身记录"""
-    query = db.query(WorkoutRecord).filter(WorkoutRecord.user_id == current_user.id)
+    """获取用户的健身记录（按 recorded_at 倒序，游标分页：下一页游标在 X-Next-Cursor 响应头）"""
+    query = select(WorkoutRecord).where(WorkoutRecord.user_id == current_user.id)
     
     if date_filter:
-        query = query.filter(WorkoutRecord.recorded_at >= date_filter)
-        query = query.filter(WorkoutRecord.recorded_at < date_filter.replace(day=date_filter.day + 1))
+        start, end = day_range(date_filter)
+        query = query.where(WorkoutRecord.recorded_at >= start, WorkoutRecord.recorded_at < end)
     
     if workout_type:
-        query = query.filter(WorkoutRecord.workout_type == workout_type)
+        query = query.where(WorkoutRecord.workout_type == workout_type)
     
-    records = query.order_by(WorkoutRecord.recorded_at.desc()).offset(offset).limit(limit).all()
+    records, next_cursor = await keyset_page(db, query, WorkoutRecord.recorded_at, WorkoutRecord.id, cursor, limit, offset)
+    set_next_cursor(response, next_cursor)
     return records
 
 @router.get("/today", response_model=List[WorkoutRecordResponse])
 async def get_today_workout_records(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取今天的健身记录"""
-    today = date.today()
-    records = db.query(WorkoutRecord).filter(
-        WorkoutRecord.user_id == current_user.id,
-        WorkoutRecord.recorded_at >= today,
-        WorkoutRecord.recorded_at < today.replace(day=today.day + 1)
-    ).order_by(WorkoutRecord.recorded_at.desc()).all()
+    start, end = day_range(date.today())
+    records = (await db.scalars(
+        select(WorkoutRecord).where(
+            WorkoutRecord.user_id == current_user.id,
+            WorkoutRecord.recorded_at >= start,
+            WorkoutRecord.recorded_at < end
+        ).order_by(WorkoutRecord.recorded_at.desc())
+    )).all()
     
     return records
 
@@ -113,170 +142,99 @@ async def get_today_workout_records(
 async def get_daily_workout_stats(
     target_date: Optional[date] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取每日健身统计"""
     if not target_date:
         target_date = date.today()
     
-    records = db.query(WorkoutRecord).filter(
-        WorkoutRecord.user_id == current_user.id,
-        WorkoutRecord.recorded_at >= target_date,
-        WorkoutRecord.recorded_at < target_date.replace(day=target_date.day + 1)
-    ).all()
-    
-    total_duration = sum(record.duration_minutes for record in records)
-    total_calories_burned = sum(record.calories_burned for record in records)
-    workout_count = len(records)
+    # 读取当日汇总行（daily_user_rollups）
+    rows = await db.run_sync(workout_rows, current_user.id, target_date, target_date)
     
     # 按运动类型分组
-    workout_stats = {}
-    for record in records:
-        if record.workout_type not in workout_stats:
-            workout_stats[record.workout_type] = {
-                "duration": 0,
-                "calories_burned": 0,
-                "count": 0
-            }
-        
-        workout_stats[record.workout_type]["duration"] += record.duration_minutes
-        workout_stats[record.workout_type]["calories_burned"] += record.calories_burned
-        workout_stats[record.workout_type]["count"] += 1
+    workout_stats = rollup(rows, lambda row: row["type"], WORKOUT_FIELDS)
     
     return {
         "date": target_date,
-        "total_duration_minutes": total_duration,
-        "total_calories_burned": total_calories_burned,
-        "workout_count": workout_count,
+        "total_duration_minutes": sum(row["duration"] for row in rows),
+        "total_calories_burned": sum(row["calories_burned"] for row in rows),
+        "workout_count": sum(row["count"] for row in rows),
         "workout_stats": workout_stats
     }
 
 @router.get("/stats/weekly")
 async def get_weekly_workout_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取每周健身统计"""
-    from datetime import timedelta
-    
     end_date = date.today()
     start_date = end_date - timedelta(days=6)
     
-    records = db.query(WorkoutRecord).filter(
-        WorkoutRecord.user_id == current_user.id,
-        WorkoutRecord.recorded_at >= start_date,
-        WorkoutRecord.recorded_at <= end_date
-    ).all()
-    
-    # 按日期分组
-    daily_stats = {}
-    for record in records:
-        record_date = record.recorded_at.date()
-        if record_date not in daily_stats:
-            daily_stats[record_date] = {
-                "duration": 0,
-                "calories_burned": 0,
-                "workout_count": 0
-            }
-        
-        daily_stats[record_date]["duration"] += record.duration_minutes
-        daily_stats[record_date]["calories_burned"] += record.calories_burned
-        daily_stats[record_date]["workout_count"] += 1
+    # 读取 7 天的汇总行，再按日期合并
+    rows = await db.run_sync(workout_rows, current_user.id, start_date, end_date)
+    daily_stats = rollup(rows, lambda row: row["day"], WORKOUT_FIELDS, count_name="workout_count")
     
     # 计算平均值
-    total_days = len(daily_stats)
-    avg_duration = sum(stats["duration"] for stats in daily_stats.values()) / total_days if total_days > 0 else 0
-    avg_calories = sum(stats["calories_burned"] for stats in daily_stats.values()) / total_days if total_days > 0 else 0
+    avg = averages(daily_stats, WORKOUT_FIELDS)
     
     return {
         "start_date": start_date,
         "end_date": end_date,
         "daily_stats": daily_stats,
         "averages": {
-            "duration_minutes": avg_duration,
-            "calories_burned": avg_calories
+            "duration_minutes": avg["duration"],
+            "calories_burned": avg["calories_burned"]
         }
     }
 
 @router.get("/stats/monthly")
 async def get_monthly_workout_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """获取每月健身统计"""
-    from datetime import timedelta
-    
     end_date = date.today()
     start_date = end_date - timedelta(days=29)  # 最近30天
     
-    records = db.query(WorkoutRecord).filter(
-        WorkoutRecord.user_id == current_user.id,
-        WorkoutRecord.recorded_at >= start_date,
-        WorkoutRecord.recorded_at <= end_date
-    ).all()
+    rows = await db.run_sync(workout_rows, current_user.id, start_date, end_date)
     
-    # 按周分组
-    weekly_stats = {}
-    for record in records:
-        # 计算是第几周
-        week_start = record.recorded_at.date() - timedelta(days=record.recorded_at.weekday())
-        if week_start not in weekly_stats:
-            weekly_stats[week_start] = {
-                "duration": 0,
-                "calories_burned": 0,
-                "workout_count": 0
-            }
-        
-        weekly_stats[week_start]["duration"] += record.duration_minutes
-        weekly_stats[week_start]["calories_burned"] += record.calories_burned
-        weekly_stats[week_start]["workout_count"] += 1
+    # 按周分组（周一为一周开始）
+    weekly_stats = rollup(rows, lambda row: row["day"] - timedelta(days=row["day"].weekday()),
+                          WORKOUT_FIELDS, count_name="workout_count")
     
     # 按运动类型统计
-    workout_type_stats = {}
-    for record in records:
-        if record.workout_type not in workout_type_stats:
-            workout_type_stats[record.workout_type] = {
-                "duration": 0,
-                "calories_burned": 0,
-                "count": 0
-            }
-        
-        workout_type_stats[record.workout_type]["duration"] += record.duration_minutes
-        workout_type_stats[record.workout_type]["calories_burned"] += record.calories_burned
-        workout_type_stats[record.workout_type]["count"] += 1
+    workout_type_stats = rollup(rows, lambda row: row["type"], WORKOUT_FIELDS)
     
     return {
         "start_date": start_date,
         "end_date": end_date,
         "weekly_stats": weekly_stats,
         "workout_type_stats": workout_type_stats,
-        "total_workouts": len(records)
+        "total_workouts": sum(row["count"] for row in rows)
     }
 
 @router.delete("/{workout_id}")
 async def delete_workout_record(
     workout_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """删除健身记录"""
-    workout = db.query(WorkoutRecord).filter(
+    workout = await db.scalar(select(WorkoutRecord).where(
         WorkoutRecord.id == workout_id,
         WorkoutRecord.user_id == current_user.id
-    ).first()
+    ))
     
     if not workout:
         raise HTTPException(status_code=404, detail="Workout record not found")
     
-    # 删除图片文件
-    if workout.image_path and os.path.exists(workout.image_path):
-        try:
-            os.remove(workout.image_path)
-        except Exception as e:
-            logger.warning(f"Failed to delete image file: {e}")
+    image_path = workout.image_path
+    await db.delete(workout)
+    await db.commit()
     
-    db.delete(workout)
-    db.commit()
+    # 删除图片（其他记录仍引用同一图片时保留）
+    await release_image(db, image_path)
     
     logger.info(f"Workout record deleted: {workout_id}")
     return {"message": "Workout record deleted successfully"}
@@ -294,13 +252,13 @@ async def update_workout_record(
     notes: Optional[str] = Form(None),
     image: Optional[UploadFile] = File(None),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新健身记录"""
-    workout = db.query(WorkoutRecord).filter(
+    workout = await db.scalar(select(WorkoutRecord).where(
         WorkoutRecord.id == workout_id,
         WorkoutRecord.user_id == current_user.id
-    ).first()
+    ))
     
     if not workout:
         raise HTTPException(status_code=404, detail="Workout record not found")
@@ -316,19 +274,18 @@ async def update_workout_record(
     workout.notes = notes
     
     # 处理新图片
+    old_image_path = None
     if image:
-        # 删除旧图片
-        if workout.image_path and os.path.exists(workout.image_path):
-            try:
-                os.remove(workout.image_path)
-            except Exception as e:
-                logger.warning(f"Failed to delete old image: {e}")
-        
-        # 保存新图片
-        workout.image_path = save_image(image, current_user.id, "workout")
+        # 先保存新图片，失败时保留旧图片
+        old_image_path = workout.image_path
+        workout.image_path = await save_image(image, current_user.id, "workout")
+    
+    await db.commit()
+    await db.refresh(workout)
     
-    db.commit()
-    db.refresh(workout)
+    # 删除不再使用的旧图片
+    if old_image_path != workout.image_path:
+        await release_image(db, old_image_path)
     
     logger.info(f"Workout record updated: {workout_id}")
     return workout
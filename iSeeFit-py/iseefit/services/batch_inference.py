@@ -0,0 +1,187 @@
+"""
+Dynamic micro-batching inference engine
+Collects concurrent prediction requests and runs them as one batched forward pass on a worker thread
+"""
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class QueueFullError(Exception):
+    """Raised when the engine cannot accept more requests"""
+
+class _PendingRequest:
+    __slots__ = ("tensor", "future", "enqueued_at")
+
+    def __init__(self, tensor, future: Future):
+        self.tensor = tensor
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+class BatchingEngine:
+    """
+    Queue-backed batching engine.
+
+    Each request submits a tensor of shape (n, C, H, W) and gets back a Future resolving
+    to the forward output for its own n rows. The worker waits for the first request,
+    then keeps collecting until `max_batch_size` images are queued or `max_wait_ms` has
+    elapsed, and runs one forward per distinct input shape.
+    """
+
+    def __init__(
+        self,
+        forward_fn: Callable[[Any], Any],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 64,
+        name: str = "batch-engine",
+    ):
+        self.forward_fn = forward_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[_PendingRequest]" = queue.Queue(maxsize=max(1, int(max_queue_size)))
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.queue_wait = Histogram()
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.forward_time = Histogram()
+        self.rejected = 0
+        self.failed_batches = 0
+
+    # ---------- lifecycle ----------
+    def start(self):
+        """Start the worker thread (idempotent)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            logger.info(f"{self.name} started (max_batch_size={self.max_batch_size}, "
+                        f"max_wait_ms={self.max_wait * 1000:.1f}, queue={self._queue.maxsize})")
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the worker thread; pending requests are failed"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        while True:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError(f"{self.name} stopped"))
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    # ---------- public API ----------
+    def submit(self, tensor) -> Future:
+        """Queue a (n, C, H, W) tensor; raises QueueFullError when the queue is at capacity"""
+        if not self.running:
+            self.start()
+        future: Future = Future()
+        try:
+            self._queue.put_nowait(_PendingRequest(tensor, future))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFullError(f"{self.name} queue is full ({self._queue.maxsize} pending)")
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        """Engine configuration and histograms"""
+        return {
+            "running": self.running,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_capacity": self._queue.maxsize,
+            "queue_depth": self._queue.qsize(),
+            "rejected": self.rejected,
+            "failed_batches": self.failed_batches,
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+            "forward_seconds": self.forward_time.snapshot(),
+        }
+
+    # ---------- worker ----------
+    def _collect(self) -> List[_PendingRequest]:
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        images = len(first.tensor)
+        deadline = time.perf_counter() + self.max_wait
+        while images < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            images += len(item.tensor)
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch: List[_PendingRequest]):
+        import torch
+
+        now = time.perf_counter()
+        live = []
+        for req in batch:
+            # Skip requests whose caller already gave up
+            if req.future.set_running_or_notify_cancel():
+                self.queue_wait.observe(now - req.enqueued_at)
+                live.append(req)
+
+        # Group by input shape so differently-sized views (e.g. auto-ratio TTA) can coexist
+        groups: Dict[tuple, List[_PendingRequest]] = {}
+        for req in live:
+            groups.setdefault(tuple(req.tensor.shape[1:]), []).append(req)
+
+        for reqs in groups.values():
+            sizes = [len(r.tensor) for r in reqs]
+            try:
+                x = torch.cat([r.tensor for r in reqs], dim=0)
+                started = time.perf_counter()
+                out = self.forward_fn(x)
+                self.forward_time.observe(time.perf_counter() - started)
+                self.batch_size.observe(len(x))
+                for req, chunk in zip(reqs, torch.split(out, sizes, dim=0)):
+                    req.future.set_result(chunk)
+            except Exception as e:
+                self.failed_batches += 1
+                logger.error(f"{self.name} batch of {sum(sizes)} failed: {e}")
+                for req in reqs:
+                    if not req.future.done():
+                        req.future.set_exception(e)
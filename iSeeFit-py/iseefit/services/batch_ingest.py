@@ -0,0 +1,110 @@
+"""
+Batch ingestion for offline sync
+Clients send up to BATCH_MAX_RECORDS meal / workout / weight records in one request, each with a
+client-generated client_id. New rows go in with one multi-row INSERT (executemany) in a single
+transaction; client_ids already stored for the user come back as duplicates, so re-sending a
+batch after a dropped response is harmless. The daily rollups of the touched days are refreshed
+in the same transaction (bulk inserts bypass the ORM flush hooks).
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+from services.rollup_service import refresh_days
+
+logger = logging.getLogger(__name__)
+
+class BatchItemError(ValueError):
+    """A single record cannot be stored; reported in its result instead of failing the batch"""
+
+def _utc_naive(value: datetime) -> datetime:
+    """Record timestamps are stored as naive UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def _existing_ids(db: AsyncSession, model, user_id: int, client_ids: Sequence[str]) -> Dict[str, int]:
+    rows = await db.execute(
+        select(model.client_id, model.id).where(model.user_id == user_id, model.client_id.in_(client_ids))
+    )
+    return {client_id: record_id for client_id, record_id in rows}
+
+async def ingest_batch(
+    db: AsyncSession,
+    model,
+    user_id: int,
+    items: Sequence[Any],
+    build_row: Callable[[Any], Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Insert the items that are new for this user; returns the BatchResponse payload.
+    build_row maps an item to column values (without user_id / client_id / recorded_at) and may
+    raise BatchItemError.
+    """
+    if len(items) > settings.BATCH_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_MAX_RECORDS} records per batch")
+
+    results: List[Dict[str, Any]] = []
+    rows: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        result = {"client_id": item.client_id, "status": "created", "id": None, "error": None}
+        results.append(result)
+        if item.client_id in rows:
+            result["status"] = "duplicate"
+            continue
+        try:
+            row = build_row(item)
+        except BatchItemError as e:
+            result.update(status="error", error=str(e))
+            continue
+        row.update(user_id=user_id, client_id=item.client_id, recorded_at=_utc_naive(item.recorded_at or datetime.utcnow()))
+        rows[item.client_id] = row
+
+    # Two attempts: a concurrent sync of the same backlog can win the unique (user_id, client_id) race
+    for attempt in range(2):
+        existing = await _existing_ids(db, model, user_id, list(rows)) if rows else {}
+        new_rows = [row for client_id, row in rows.items() if client_id not in existing]
+        try:
+            if new_rows:
+                await db.execute(insert(model), new_rows)
+                keys = {(row["user_id"], row["recorded_at"].date()) for row in new_rows}
+                await db.run_sync(lambda session: refresh_days(session.connection(), keys))
+            created = await _existing_ids(db, model, user_id, [row["client_id"] for row in new_rows]) if new_rows else {}
+            await db.commit()
+            break
+        except IntegrityError:
+            await db.rollback()
+            if attempt:
+                raise
+            logger.info(f"Concurrent batch insert for user {user_id}; retrying against stored client_ids")
+
+    for result in results:
+        client_id = result["client_id"]
+        if result["status"] == "error":
+            continue
+        if client_id in created and result["status"] == "created":
+            result["id"] = created[client_id]
+        else:
+            result["status"] = "duplicate"
+            result["id"] = existing.get(client_id, created.get(client_id))
+
+    return {
+        "created": sum(r["status"] == "created" for r in results),
+        "duplicates": sum(r["status"] == "duplicate" for r in results),
+        "errors": sum(r["status"] == "error" for r in results),
+        "results": results,
+    }
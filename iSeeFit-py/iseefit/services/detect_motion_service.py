@@ -1,20 +1,49 @@
 import os
+import json
+import struct
+import shutil
+import tempfile
 import cv2
-from ultralytics import YOLO
-from transformers import pipeline
 from PIL import Image
-import torch
 
-model = YOLO("yolov8n-pose.pt")  # load once
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+from services.model_registry import registry
+from services.video_pipeline import (
+    FrameSink, VideoFileSink, JpegQueueSink, iter_stream, open_video, run_pipeline
+)
+from services.frame_sampling import Pose, create_sampler, interpolate_pose, draw_pose
+
+POSE_MODEL = "yolov8n_pose"
+ACTION_CLASSIFIER_MODEL = "action_classifier"
+
 SAVE_DIR = "processed_videos"  # folder to save videos
 os.makedirs(SAVE_DIR, exist_ok=True)
-# Initialize the model pipeline
-device = 0 if torch.cuda.is_available() else -1  # use GPU if available
-classifier = pipeline(
-    "image-classification",
-    model="rvv-karma/Human-Action-Recognition-VIT-Base-patch16-224",
-    device=device
-)
+
+def load_pose_model():
+    from ultralytics import YOLO
+    return YOLO("yolov8n-pose.pt")
+
+def load_action_classifier():
+    import torch
+    from transformers import pipeline
+
+    device = 0 if torch.cuda.is_available() else -1  # use GPU if available
+    return pipeline(
+        "image-classification",
+        model="rvv-karma/Human-Action-Recognition-VIT-Base-patch16-224",
+        device=device
+    )
+
+registry.register(POSE_MODEL, load_pose_model, description="Ultralytics YOLOv8n-pose")
+registry.register(ACTION_CLASSIFIER_MODEL, load_action_classifier,
+                  description="HuggingFace ViT human-action-recognition pipeline")
 
 calories_dict = {
         "Calling": 1,  # light activity
@@ -34,165 +63,352 @@ calories_dict = {
         "Using Laptop": 1  # sedentary
     }
 
-def process_video_bytes(video_bytes: bytes, filename: str, max_duration: int = 10) -> bytes:
-    """
-    Process video and return as bytes for streaming.
-    Adds a counter that increases every second.
+def display_action(label: str) -> str:
+    """Label shown to users ("Fighting" is shown as "Dancing")"""
+    return "Dancing" if label == "Fighting" else label
+
+class ActionRecognizer:
     """
-    input_path = os.path.join(SAVE_DIR, f"input_{filename}")
-    with open(input_path, "wb") as f:
-        f.write(video_bytes)
+    Action recognition + calories overlay.
 
-    output_path = os.path.join(SAVE_DIR, f"processed_{filename}")
+    Schedules one sampled frame every `classify_every` frames inside the first `window`
+    frames (default: frames 0, 5, ..., 25) and classifies them in a single batched
+    classifier call when the window closes. With window=0 the whole clip is scheduled
+    and each segment is classified in one call as soon as it ends.
+    Scores are softmax probabilities averaged over frames (per segment and overall);
+    from frame `window` on the overlay shows the averaged top action.
+    observe() must be called in frame order (the pipeline's inference stage guarantees it).
+    """
 
-    cap = cv2.VideoCapture(input_path)
-    if not cap.isOpened():
-        raise Exception("Cannot open video file")
+    def __init__(self, classifier, fps: int, classify_every: int = 5, window: int = 30,
+                 segment_seconds: float = 1.0):
+        self.classifier = classifier
+        self.fps = max(1, fps)
+        self.classify_every = max(1, classify_every)
+        self.window = max(0, window)
+        self.segment_frames = max(1, int(round(segment_seconds * self.fps)))
+        self.scores = []  # (frame_count, {label: probability})
+        self.batches = 0
+        self._pending = []  # (frame_count, PIL image)
+        self._next_due = 0
+        try:
+            # Ask for every label so averaging sees the full distribution
+            self._top_k = len(classifier.model.config.id2label)
+        except AttributeError:
+            self._top_k = len(calories_dict)
 
-    fps = int(cap.get(cv2.CAP_PROP_FPS) or 30)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    max_frames = min(total_frames, int(max_duration * fps))
+    def observe(self, frame_count: int, frame):
+        if self.window and frame_count >= self.window:
+            self.flush()
+            return
+        if not self.window and self._pending \
+                and frame_count // self.segment_frames != self._pending[0][0] // self.segment_frames:
+            self.flush()
+        # Take the first sampled frame at or after each scheduled index
+        if frame_count >= self._next_due:
+            img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            self._pending.append((frame_count, img))
+            while self._next_due <= frame_count:
+                self._next_due += self.classify_every
 
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    def due(self, frame_count: int) -> bool:
+        """Whether observe() would schedule this frame for classification"""
+        if self.window and frame_count >= self.window:
+            return False
+        return frame_count >= self._next_due
 
-    frame_count = 0
-    action_predictions = []
+    def flush(self):
+        """Classify all pending frames in one batched call"""
+        if not self._pending:
+            return
+        images = [img for _, img in self._pending]
+        outputs = self.classifier(images, batch_size=len(images), top_k=self._top_k)
+        if len(images) == 1 and outputs and isinstance(outputs[0], dict):
+            outputs = [outputs]
+        for (frame_count, _), predictions in zip(self._pending, outputs):
+            probs = {p["label"]: float(p["score"]) for p in predictions}
+            total = sum(probs.values()) or 1.0
+            self.scores.append((frame_count, {label: p / total for label, p in probs.items()}))
+        self.batches += 1
+        self._pending = []
 
-    while cap.isOpened() and frame_count < max_frames:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        # Run your model (assuming `model` is defined elsewhere)
-        results = model(frame, verbose=False)
-        annotated_frame = results[0].plot()
+    @staticmethod
+    def _average(entries):
+        """(action, confidence, frames) from the mean probability of each label"""
+        if not entries:
+            return None, 0.0, 0
+        totals = {}
+        for _, probs in entries:
+            for label, p in probs.items():
+                totals[label] = totals.get(label, 0.0) + p
+        action = max(totals, key=totals.get)
+        return action, totals[action] / len(entries), len(entries)
 
+    def text(self, frame_count: int):
+        if frame_count < self.window or not self.scores:
+            return None
+        action, _, _ = self._average(self.scores)
         # Calculate seconds elapsed
-        seconds_elapsed = frame_count // fps
+        seconds_elapsed = frame_count // self.fps
+        return f"Motion: {display_action(action)}, Calories burned: {calories_dict.get(action, 1) * seconds_elapsed}"
 
-        # Update prediction once every second
-        if frame_count % 5 == 0 and frame_count < 30:
-            img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            results = classifier(img)
-            label = results[0]['label']
-            score = results[0]['score']
-            action_predictions.append(label)
-            print(f"{label} {score}")
-
-        if frame_count >= 30 and action_predictions:
-            action = max(set(action_predictions), key=action_predictions.count)
-            action1 = ""
-            if action == "Fighting":
-                action1 = "Dancing"
-            else:
-                action1 = action
+    def summary(self, total_frames: int) -> dict:
+        """Structured result: overall and per-segment action, confidence and kcal/sec"""
+        self.flush()
+        segments = {}
+        for frame_count, probs in self.scores:
+            segments.setdefault(frame_count // self.segment_frames, []).append((frame_count, probs))
+        segment_list = []
+        for seg, entries in sorted(segments.items()):
+            action, confidence, frames = self._average(entries)
+            segment_list.append({
+                "start_seconds": round(seg * self.segment_frames / self.fps, 3),
+                "end_seconds": round(min((seg + 1) * self.segment_frames, max(total_frames, 1)) / self.fps, 3),
+                "action": display_action(action),
+                "confidence": round(confidence, 4),
+                "kcal_per_sec": calories_dict.get(action, 1),
+                "frames_classified": frames,
+            })
+        action, confidence, frames = self._average(self.scores)
+        rate = calories_dict.get(action, 1) if action else 0
+        duration_seconds = total_frames / self.fps
+        return {
+            "action": display_action(action) if action else None,
+            "confidence": round(confidence, 4),
+            "kcal_per_sec": rate,
+            "duration_seconds": round(duration_seconds, 3),
+            # Same figure as the overlay on the last frame
+            "calories_burned": rate * (max(total_frames - 1, 0) // self.fps),
+            "frames_classified": frames,
+            "classifier_batches": self.batches,
+            "segments": segment_list,
+        }
+
+def _new_recognizer(classifier, fps: int) -> ActionRecognizer:
+    return ActionRecognizer(
+        classifier, fps,
+        classify_every=settings.VIDEO_CLASSIFY_EVERY_FRAMES,
+        window=settings.VIDEO_CLASSIFY_WINDOW_FRAMES,
+        segment_seconds=settings.VIDEO_SEGMENT_SECONDS,
+    )
+
+def make_sampler(info, strategy=None):
+    """Frame sampler from settings (strategy overrides VIDEO_SAMPLING_STRATEGY)"""
+    return create_sampler(
+        strategy or settings.VIDEO_SAMPLING_STRATEGY,
+        info.fps,
+        stride=settings.VIDEO_SAMPLE_STRIDE,
+        interval_ms=settings.VIDEO_SAMPLE_INTERVAL_MS,
+        motion_threshold=settings.VIDEO_MOTION_THRESHOLD,
+        motion_max_gap=settings.VIDEO_MOTION_MAX_GAP,
+    )
+
+def _run_pose_pipeline(input_path: str, max_duration: float, sink: FrameSink, resize=None,
+                       sampling=None) -> dict:
+    """Decode -> sampled, batched YOLO pose + action classifier -> plot/overlay -> sink"""
+    model = registry.get(POSE_MODEL)
+    classifier = registry.get(ACTION_CLASSIFIER_MODEL)
+    overlay = {}
+
+    def on_open(info):
+        overlay["action"] = _new_recognizer(classifier, info.fps)
 
+    def infer(indices, frames):
+        # One YOLO call for the whole batch of sampled frames
+        results = model(frames, verbose=False)
+        payloads = []
+        for frame_count, frame, result in zip(indices, frames, results):
+            overlay["action"].observe(frame_count, frame)
+            payloads.append({
+                "result": result,
+                "pose": Pose.from_result(result),
+                "text": overlay["action"].text(frame_count),
+            })
+        return payloads
+
+    def interpolate(frame_count, prev, nxt, t):
+        return {
+            "result": None,
+            "pose": interpolate_pose(prev and prev["pose"], nxt and nxt["pose"], t),
+            "text": overlay["action"].text(frame_count),
+        }
+
+    def annotate(frame_count, frame, payload):
+        if payload["result"] is not None:
+            annotated_frame = payload["result"].plot()
+        else:
+            # Skipped frame: draw the interpolated pose
+            annotated_frame = draw_pose(frame, payload["pose"])
+        if payload["text"]:
             # Add text overlay
-            text = f"Motion: {action1}, Calories burned: {calories_dict.get(action, 1) * seconds_elapsed}"
-            print(text)
             cv2.putText(
-                annotated_frame, text, (50, 50),
+                annotated_frame, payload["text"], (50, 50),
                 cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA
             )
+        return annotated_frame
+
+    stats = run_pipeline(
+        input_path, max_duration, infer, annotate, sink,
+        resize=resize,
+        batch_size=settings.VIDEO_INFER_BATCH_SIZE,
+        queue_size=settings.VIDEO_PIPELINE_QUEUE_SIZE,
+        on_open=on_open,
+        make_sampler=lambda info: make_sampler(info, sampling),
+        interpolate=interpolate,
+    )
+    stats["motion"] = overlay["action"].summary(stats["frames"])
+    return stats
+
+def analyze_motion_file(input_path: str, max_duration: int = 10) -> dict:
+    """
+    Action / calories analysis only (no pose model, no annotated video).
+    Only the scheduled frames are retrieved; the rest are grab()'ed, and decoding stops
+    once the classification window is complete.
+    """
+    classifier = registry.get(ACTION_CLASSIFIER_MODEL)
+    cap, info = open_video(input_path, max_duration)
+    recognizer = _new_recognizer(classifier, info.fps)
+    frame_count = 0
+    try:
+        while frame_count < info.max_frames:
+            if recognizer.window and frame_count >= recognizer.window:
+                break
+            if recognizer.due(frame_count):
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                recognizer.observe(frame_count, frame)
+            elif not cap.grab():
+                break
+            frame_count += 1
+    finally:
+        cap.release()
+    total_frames = info.max_frames if info.total_frames > 0 else frame_count
+    return recognizer.summary(total_frames)
+
+def new_temp_path(suffix: str) -> str:
+    """Unique file under SAVE_DIR (concurrent uploads with the same filename no longer collide)"""
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=SAVE_DIR)
+    os.close(fd)
+    return path
 
-        out.write(annotated_frame)
-        frame_count += 1
+def save_upload(fileobj, suffix: str = ".mp4") -> str:
+    """Copy an upload stream to disk in chunks instead of reading it into memory"""
+    path = new_temp_path(suffix)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(fileobj, f, settings.VIDEO_STREAM_CHUNK_SIZE)
+    return path
 
-    cap.release()
-    out.release()
+def process_video_file(input_path: str, output_path: str, max_duration: int = 10, sampling=None) -> dict:
+    """
+    Process a video file into an annotated mp4 at output_path.
+    Adds a counter that increases every second.
+    Returns pipeline stats; stats["motion"] is the structured action/calories result.
+    `sampling` overrides VIDEO_SAMPLING_STRATEGY (all, stride, time, motion, grab-stride).
+    """
+    return _run_pose_pipeline(input_path, max_duration, VideoFileSink(output_path), sampling=sampling)
 
-    with open(output_path, "rb") as f:
-        processed_bytes = f.read()
+def process_video_bytes(video_bytes: bytes, filename: str, max_duration: int = 10) -> bytes:
+    """
+    Process video and return as bytes (kept for callers that need the whole file;
+    the /process-video/ route streams from process_video_file instead).
+    """
+    input_path = new_temp_path(f"_input_{filename}")
+    output_path = new_temp_path(f"_processed_{filename}")
+    try:
+        with open(input_path, "wb") as f:
+            f.write(video_bytes)
+        process_video_file(input_path, output_path, max_duration)
+        with open(output_path, "rb") as f:
+            return f.read()
+    finally:
+        for path in (input_path, output_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
 
-    os.remove(input_path)
-    os.remove(output_path)
+class _JpegListSink(FrameSink):
+    def __init__(self):
+        self.frames = []
 
-    return processed_bytes
+    def write(self, index, frame):
+        # 编码为JPEG
+        _, buffer = cv2.imencode('.jpg', frame)
+        self.frames.append(buffer.tobytes())
 
-def process_video_bytes_to_frames(video_bytes: bytes, filename: str, max_duration: int = 10) -> list:
+def process_video_bytes_to_frames(video_bytes: bytes, filename: str, max_duration: int = 10,
+                                  sampling=None) -> list:
     """
     处理视频并返回帧列表（新增函数，不影响原有接口）
     """
     # 保存到临时文件进行处理
-    import tempfile
     with tempfile.NamedTemporaryFile(suffix='.mp4', delete=False) as temp_file:
         temp_file.write(video_bytes)
         temp_path = temp_file.name
-    
+
     try:
-        cap = cv2.VideoCapture(temp_path)
-        
-        if not cap.isOpened():
-            raise Exception("Cannot open video file")
-        
-        fps = int(cap.get(cv2.CAP_PROP_FPS) or 30)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        max_frames = min(total_frames, int(max_duration * fps))
-        
-        # 优化参数
-        width = 640
-        height = 480
-        
-        frames = []
-        frame_count = 0
-        action_predictions = []
-        
-        while cap.isOpened() and frame_count < max_frames:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # 调整帧大小
-            frame = cv2.resize(frame, (width, height))
-            
-            # 姿势检测
-            results = model(frame, verbose=False)
-            annotated_frame = results[0].plot()
-            
-            # Calculate seconds elapsed
-            seconds_elapsed = frame_count // fps
-
-            # Update prediction once every second
-            if frame_count % 5 == 0 and frame_count < 30:
-                img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                results = classifier(img)
-                label = results[0]['label']
-                score = results[0]['score']
-                action_predictions.append(label)
-                print(f"{label} {score}")
-
-            if frame_count >= 30 and action_predictions:
-                action = max(set(action_predictions), key=action_predictions.count)
-                action1 = ""
-                if action == "Fighting":
-                    action1 = "Dancing"
-                else:
-                    action1 = action
-
-                # Add text overlay
-                text = f"Motion: {action1}, Calories burned: {calories_dict.get(action, 1) * seconds_elapsed}"
-                print(text)
-                cv2.putText(
-                    annotated_frame, text, (50, 50),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2, cv2.LINE_AA
-                )
-
-            # 编码为JPEG
-            _, buffer = cv2.imencode('.jpg', annotated_frame)
-            frames.append(buffer.tobytes())
-            
-            frame_count += 1
-        
-        cap.release()
-        return frames
-        
+        sink = _JpegListSink()
+        # 优化参数：调整帧大小为 640x480
+        _run_pose_pipeline(temp_path, max_duration, sink, resize=(640, 480), sampling=sampling)
+        return sink.frames
     finally:
         # 清理临时文件
-        import os
         try:
             os.unlink(temp_path)
-        except:
+        except OSError:
             pass
 
+FRAME_STREAM_BOUNDARY = "frame"
+
+def _multipart_part(content_type: str, body: bytes, index=None) -> bytes:
+    header = f"--{FRAME_STREAM_BOUNDARY}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+    if index is not None:
+        header += f"X-Frame-Index: {index}\r\n"
+    return header.encode() + b"\r\n" + body + b"\r\n"
+
+def _binary_record(kind: bytes, body: bytes) -> bytes:
+    # 1-byte type (F = JPEG frame, J = JSON summary/error) + 4-byte big-endian length + payload
+    return kind + struct.pack(">I", len(body)) + body
+
+def iter_frame_stream(input_path: str, max_duration: int = 10, sampling=None, fmt: str = "mjpeg",
+                      max_width: int = 0, quality: int = 80):
+    """
+    Annotated frames as a byte stream, emitted as soon as each frame is encoded.
+
+    fmt="mjpeg":  multipart/x-mixed-replace parts (image/jpeg), closed by an
+                  application/json part with the motion summary (or the error)
+    fmt="binary": length-prefixed records, see _binary_record()
+    The input file is deleted when the stream ends or the client disconnects.
+    """
+    sink = JpegQueueSink(
+        max_width=max_width,
+        quality=quality,
+        queue_size=settings.VIDEO_STREAM_QUEUE_SIZE,
+        stall_seconds=settings.VIDEO_STREAM_STALL_SECONDS,
+    )
+
+    def run(frame_sink):
+        stats = _run_pose_pipeline(input_path, max_duration, frame_sink, resize=(640, 480), sampling=sampling)
+        return {"success": True, "total_frames": stats["frames"], "fps": stats["fps"], "motion": stats["motion"]}
+
+    try:
+        for item in iter_stream(run, sink):
+            if item[0] == "frame":
+                _, index, jpeg = item
+                yield _multipart_part("image/jpeg", jpeg, index) if fmt == "mjpeg" else _binary_record(b"F", jpeg)
+                continue
+            if item[0] == "done":
+                summary = item[1]
+            else:
+                summary = {"success": False, "error": item[1], "message": "Failed to process video frames"}
+            body = json.dumps(summary).encode()
+            if fmt == "mjpeg":
+                yield _multipart_part("application/json", body) + f"--{FRAME_STREAM_BOUNDARY}--\r\n".encode()
+            else:
+                yield _binary_record(b"J", body)
+    finally:
+        try:
+            os.remove(input_path)
+        except OSError:
+            pass
@@ -6,13 +6,27 @@ Integrates OpenAI Vision and Food-101 classifier to provide food recognition and
 import os
 import io
 import json
+import asyncio
 import base64
+from collections import deque
 from datetime import datetime
 from typing import Any, Dict, List, Tuple, Optional
 
 from PIL import Image
 import logging
 
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+from services.model_registry import registry
+from services.result_cache import create_analysis_cache
+from services.vision_client import AsyncVisionClient, CircuitBreaker, CircuitOpenError
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
@@ -29,7 +43,7 @@ openai_error_msg = None
 if USE_OPENAI:
     try:
         from openai import OpenAI
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=settings.OPENAI_BASE_URL or None)
         logger.info("OpenAI client initialized successfully")
     except Exception as e:
         USE_OPENAI = False
@@ -39,6 +53,15 @@ if USE_OPENAI:
 else:
     logger.warning("OPENAI_API_KEY not set, will use Food-101 classifier as fallback")
 
+# ============== Result cache ==============
+analysis_cache = create_analysis_cache(
+    backend=settings.ANALYSIS_CACHE_BACKEND,
+    path=settings.ANALYSIS_CACHE_PATH,
+    max_entries=settings.ANALYSIS_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANALYSIS_CACHE_TTL_SECONDS,
+    phash_max_distance=settings.ANALYSIS_CACHE_PHASH_DISTANCE,
+) if settings.ANALYSIS_CACHE_ENABLED else None
+
 # ============== Nutrition (per 100 g) ==============
 NUTRITION_PER_100G: Dict[str, Dict[str, float]] = {
     # Fruits
@@ -177,14 +200,47 @@ def openai_detect(img: Image.Image) -> Tuple[List[Dict[str, Any]], str, Optional
     except Exception as e:
         return [], "", f"OpenAI call failed: {e}"
 
+# Async, pooled client used by the /api/food/analyze handler
+vision_client = AsyncVisionClient(
+    api_key=OPENAI_API_KEY,
+    model=MODEL_NAME,
+    prompt=VISION_PROMPT,
+    base_url=settings.OPENAI_BASE_URL,
+    timeout=settings.OPENAI_TIMEOUT_SECONDS,
+    max_retries=settings.OPENAI_MAX_RETRIES,
+    backoff_base=settings.OPENAI_BACKOFF_BASE_SECONDS,
+    backoff_max=settings.OPENAI_BACKOFF_MAX_SECONDS,
+    max_concurrency=settings.OPENAI_MAX_CONCURRENCY,
+    max_connections=settings.OPENAI_MAX_CONNECTIONS,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.OPENAI_CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=settings.OPENAI_CIRCUIT_RESET_SECONDS,
+    ),
+) if USE_OPENAI else None
+
+def prepare_vision_payload(img: Image.Image) -> str:
+    """Downscale and encode the photo as a data URL (CPU work, run off the event loop)"""
+    return img_to_data_url(resize_for_vision(img))
+
+async def openai_detect_async(img: Image.Image) -> Tuple[List[Dict[str, Any]], str, Optional[str]]:
+    """Async variant of openai_detect; raises CircuitOpenError when the upstream is marked degraded"""
+    if vision_client is None:
+        return [], "", "OpenAI not configured."
+    data_url = await asyncio.to_thread(prepare_vision_payload, img)
+    return await vision_client.detect(data_url)
+
 # ============== Food-101 fallback ==============
-clf = None
+FOOD101_PIPELINE_MODEL = "food101_pipeline"
+
+def load_food101_pipeline():
+    from transformers import pipeline   # requires transformers, torch, torchvision
+    return pipeline("image-classification", model="nateraw/food101", top_k=5)
+
+registry.register(FOOD101_PIPELINE_MODEL, load_food101_pipeline,
+                  description="HuggingFace nateraw/food101 image-classification pipeline")
+
 def ensure_classifier():
-    global clf
-    if clf is None:
-        from transformers import pipeline   # requires transformers, torch, torchvision
-        clf = pipeline("image-classification", model="nateraw/food101", top_k=5)
-    return clf
+    return registry.get(FOOD101_PIPELINE_MODEL)
 
 def classifier_top1(img: Image.Image) -> Tuple[str, float]:
     try:
@@ -197,6 +253,97 @@ def classifier_top1(img: Image.Image) -> Tuple[str, float]:
         return "", 0.0
 
 # ============== Core ==============
+def _cache_lookup(image: Optional[Image.Image], use_ai_portions: bool, manual_override: str,
+                  portion_slider: float) -> Tuple[Optional[Dict[str, Any]], Optional[tuple]]:
+    """Return (cached_result, cache_entry); cache_entry is passed to _cache_store on a miss"""
+    if analysis_cache is None or image is None:
+        return None, None
+    params_key = analysis_cache.params_key(
+        use_ai_portions=bool(use_ai_portions),
+        manual_override=manual_override.strip(),
+        portion_slider=float(portion_slider),
+    )
+    cached, cache_key, phash = analysis_cache.lookup(image, params_key)
+    if cached is not None:
+        logger.info(f"Analysis cache {cached['cache']}")
+        return cached, None
+    return None, (cache_key, phash, params_key)
+
+def _cache_store(cache_entry: Optional[tuple], result: Dict[str, Any], degraded: bool):
+    # Don't pin a fallback answer produced while the vision API was failing
+    if cache_entry is None or degraded or "error" in result:
+        return
+    cache_key, phash, params_key = cache_entry
+    analysis_cache.store(cache_key, phash, params_key, result)
+
+def _classifier_items(image: Image.Image, portion_slider: float, debug_lines: List[str]) -> List[Dict[str, Any]]:
+    lbl, conf = classifier_top1(image)
+    if lbl:
+        debug_lines.append(f"Using classifier fallback: {lbl} (conf {conf:.2f})")
+        return [{"name": lbl, "grams": float(portion_slider), "confidence": conf}]
+    debug_lines.append("Classifier fallback unavailable or returned nothing. "
+                       "Install transformers/torch to enable it.")
+    return []
+
+def _build_result(items: List[Dict[str, Any]], notes: str, debug_lines: List[str],
+                  use_ai_portions: bool, portion_slider: float) -> Dict[str, Any]:
+    """Turn detected items into per-item nutrition rows and totals"""
+    # Enforce slider grams if AI portions are off
+    if items and not use_ai_portions:
+        items = [dict(items[0], grams=float(portion_slider))]
+        debug_lines.append("Forced manual grams (AI portions off).")
+
+    # Build rows
+    rows = []
+    for it in items:
+        name_raw = str(it.get("name", "")).strip()
+        grams = float(it.get("grams", 0.0))
+        conf = float(it.get("confidence", 0.0))
+        key = map_label_to_key(name_raw)
+        per100 = NUTRITION_PER_100G.get(key, FALLBACK_PER_100G)
+        scaled = scale_nutrition(per100, grams)
+        rows.append({
+            "Food (detected)": key or name_raw or "unknown",
+            "Portion (g)": grams,
+            "Confidence": round(conf, 3),
+            "Calories (kcal)": scaled["kcal"],
+            "Protein (g)": scaled["protein_g"],
+            "Carbs (g)": scaled["carb_g"],
+            "Fat (g)": scaled["fat_g"],
+            "Source": "built_in" if per100 is not FALLBACK_PER_100G else "fallback",
+        })
+
+    if not rows:
+        debug_text = "\n".join(debug_lines) if (DEBUG or debug_lines) else ""
+        return {
+            "error": "Could not detect food in the image.",
+            "debug": debug_text
+        }
+
+    totals = {
+        "Portion (g)": round(float(sum(r["Portion (g)"] for r in rows)), 1),
+        "Calories (kcal)": round(float(sum(r["Calories (kcal)"] for r in rows)), 1),
+        "Protein (g)": round(float(sum(r["Protein (g)"] for r in rows)), 2),
+        "Carbs (g)": round(float(sum(r["Carbs (g)"] for r in rows)), 2),
+        "Fat (g)": round(float(sum(r["Fat (g)"] for r in rows)), 2),
+    }
+
+    # Build final result
+    result = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "mode": "openai_generative" if USE_OPENAI else "food101_classifier",
+        "per_item": rows,
+        "totals": totals,
+    }
+
+    if notes:
+        result["notes"] = notes
+
+    if DEBUG or debug_lines:
+        result["debug"] = "\n".join(debug_lines)
+
+    return result
+
 def analyze_food_image(
     image: Image.Image,
     use_ai_portions: bool = True,
@@ -213,9 +360,15 @@ def analyze_food_image(
                 "debug": "(hint) Upload a photo or type a food name."
             }
 
+        # 0) Result cache (same decoded photo + same parameters)
+        cached, cache_entry = _cache_lookup(image, use_ai_portions, manual_override, portion_slider)
+        if cached is not None:
+            return cached
+
         debug_lines = []
         if openai_error_msg:
             debug_lines.append(openai_error_msg)
+        degraded = False
 
         # 1) Manual override
         items: List[Dict[str, Any]] = []
@@ -229,70 +382,218 @@ def analyze_food_image(
                 items, notes, err = openai_detect(image)
                 if err:
                     debug_lines.append(err)
+                    degraded = True
             # 3) Fallback if needed
             if not items and image is not None:
-                lbl, conf = classifier_top1(image)
-                if lbl:
-                    items = [{"name": lbl, "grams": float(portion_slider), "confidence": conf}]
-                    debug_lines.append(f"Using classifier fallback: {lbl} (conf {conf:.2f})")
+                items = _classifier_items(image, portion_slider, debug_lines)
+
+        result = _build_result(items, notes, debug_lines, use_ai_portions, portion_slider)
+        _cache_store(cache_entry, result, degraded)
+        return result
+
+    except Exception as e:
+        msg = f"Something went wrong: {e}"
+        return {
+            "error": msg,
+            "debug": str(e)
+        }
+
+# ============== Hedged detection ==============
+class HedgeStats:
+    """Counters for hedged analysis: who won, budget overruns, and loser/winner agreement"""
+
+    def __init__(self):
+        self.wins = {"openai": 0, "classifier": 0, "none": 0}
+        self.budget_exceeded = 0
+        self.compared = 0
+        self.agreed = 0
+        self.recent: deque = deque(maxlen=50)
+
+    def record_comparison(self, winner: str, openai_items: List[Dict[str, Any]],
+                          classifier_items: List[Dict[str, Any]]):
+        if not openai_items or not classifier_items:
+            return
+        openai_labels = {map_label_to_key(str(it.get("name", ""))) for it in openai_items}
+        classifier_label = map_label_to_key(str(classifier_items[0].get("name", "")))
+        agreed = classifier_label in openai_labels
+        self.compared += 1
+        self.agreed += int(agreed)
+        self.recent.append({
+            "winner": winner,
+            "openai": sorted(openai_labels),
+            "classifier": classifier_label,
+            "agreed": agreed,
+        })
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "mode": settings.ANALYSIS_HEDGE_MODE,
+            "delay_ms": settings.ANALYSIS_HEDGE_DELAY_MS,
+            "latency_budget_ms": settings.ANALYSIS_LATENCY_BUDGET_MS,
+            "loser_policy": settings.ANALYSIS_HEDGE_LOSER,
+            "wins": dict(self.wins),
+            "budget_exceeded": self.budget_exceeded,
+            "compared": self.compared,
+            "agreement_rate": round(self.agreed / self.compared, 3) if self.compared else None,
+            "recent": list(self.recent),
+        }
+
+hedge_stats = HedgeStats()
+
+async def _hedged_detect(image: Image.Image, portion_slider: float,
+                         debug_lines: List[str]) -> Tuple[List[Dict[str, Any]], str, bool]:
+    """
+    Race OpenAI against the local Food-101 classifier.
+
+    The classifier starts immediately ("parallel") or after ANALYSIS_HEDGE_DELAY_MS ("delayed").
+    OpenAI's answer is preferred while it arrives within ANALYSIS_LATENCY_BUDGET_MS; past the
+    budget, or if OpenAI fails, whichever usable answer arrives first is returned. The loser is
+    cancelled, or left to finish and compared with the winner ("record").
+    Returns (items, notes, degraded).
+    """
+    budget = max(settings.ANALYSIS_LATENCY_BUDGET_MS, 0) / 1000.0
+    delay = 0.0 if settings.ANALYSIS_HEDGE_MODE == "parallel" else max(settings.ANALYSIS_HEDGE_DELAY_MS, 0) / 1000.0
+    classifier_lines: List[str] = []
+
+    async def run_openai():
+        try:
+            return await openai_detect_async(image)
+        except CircuitOpenError as e:
+            return [], "", str(e)
+        except Exception as e:
+            return [], "", f"OpenAI call failed: {e}"
+
+    async def run_classifier():
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await asyncio.to_thread(_classifier_items, image, portion_slider, classifier_lines)
+
+    openai_task = asyncio.create_task(run_openai())
+    classifier_task = asyncio.create_task(run_classifier())
+
+    items: List[Dict[str, Any]] = []
+    notes = ""
+    winner = "none"
+    degraded = False
+
+    # Phase 1: give OpenAI the latency budget
+    done, _ = await asyncio.wait({openai_task}, timeout=budget)
+    if openai_task in done:
+        items, notes, err = openai_task.result()
+        if items:
+            winner = "openai"
+        elif err:
+            debug_lines.append(err)
+            degraded = True
+    else:
+        hedge_stats.budget_exceeded += 1
+        degraded = True
+        debug_lines.append(f"OpenAI exceeded latency budget ({budget:.1f}s), hedging with classifier.")
+
+    # Phase 2: first usable answer wins
+    pending = {classifier_task}
+    if not openai_task.done():
+        pending.add(openai_task)
+    while winner == "none" and pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if classifier_task in done:
+            clf_items = classifier_task.result()
+            if clf_items:
+                items, notes, winner = clf_items, "", "classifier"
+                debug_lines.extend(classifier_lines)
+        if winner == "none" and openai_task in done:
+            oa_items, oa_notes, err = openai_task.result()
+            if oa_items:
+                items, notes, winner = oa_items, oa_notes, "openai"
+            elif err:
+                debug_lines.append(err)
+    if winner == "none":
+        debug_lines.extend(classifier_lines)
+
+    hedge_stats.wins[winner] += 1
+    debug_lines.append(f"Hedged analysis winner: {winner}")
+
+    # Loser handling
+    loser = classifier_task if winner == "openai" else openai_task if winner == "classifier" else None
+    if loser is not None and not loser.done():
+        if settings.ANALYSIS_HEDGE_LOSER == "record":
+            winner_items = items
+
+            def _compare(task: asyncio.Task):
+                if task.cancelled() or task.exception() is not None:
+                    return
+                if winner == "openai":
+                    hedge_stats.record_comparison(winner, winner_items, task.result())
                 else:
-                    debug_lines.append("Classifier fallback unavailable or returned nothing. "
-                                       "Install transformers/torch to enable it.")
-
-        # Enforce slider grams if AI portions are off
-        if items and not use_ai_portions:
-            items = [dict(items[0], grams=float(portion_slider))]
-            debug_lines.append("Forced manual grams (AI portions off).")
-
-        # Build rows
-        rows = []
-        for it in items:
-            name_raw = str(it.get("name", "")).strip()
-            grams = float(it.get("grams", 0.0))
-            conf = float(it.get("confidence", 0.0))
-            key = map_label_to_key(name_raw)
-            per100 = NUTRITION_PER_100G.get(key, FALLBACK_PER_100G)
-            scaled = scale_nutrition(per100, grams)
-            rows.append({
-                "Food (detected)": key or name_raw or "unknown",
-                "Portion (g)": grams,
-                "Confidence": round(conf, 3),
-                "Calories (kcal)": scaled["kcal"],
-                "Protein (g)": scaled["protein_g"],
-                "Carbs (g)": scaled["carb_g"],
-                "Fat (g)": scaled["fat_g"],
-                "Source": "built_in" if per100 is not FALLBACK_PER_100G else "fallback",
-            })
-
-        if not rows:
-            debug_text = "\n".join(debug_lines) if (DEBUG or debug_lines) else ""
+                    hedge_stats.record_comparison(winner, task.result()[0], winner_items)
+
+            loser.add_done_callback(_compare)
+        else:
+            loser.cancel()
+    elif loser is not None and not loser.cancelled() and loser.exception() is None:
+        if winner == "openai":
+            hedge_stats.record_comparison(winner, items, loser.result())
+        else:
+            hedge_stats.record_comparison(winner, loser.result()[0], items)
+
+    return items, notes, degraded
+
+async def analyze_food_image_async(
+    image: Image.Image,
+    use_ai_portions: bool = True,
+    manual_override: str = "",
+    portion_slider: float = 250.0,
+) -> Dict[str, Any]:
+    """
+    Non-blocking version of analyze_food_image for async handlers.
+    The OpenAI call goes through the pooled async client; hashing, encoding and the
+    Food-101 classifier run in worker threads. When the circuit breaker is open the
+    classifier is used directly.
+    """
+    try:
+        if image is None and not manual_override.strip():
             return {
-                "error": "Could not detect food in the image.",
-                "debug": debug_text
+                "error": "Please upload a food photo or type a manual name.",
+                "debug": "(hint) Upload a photo or type a food name."
             }
 
-        totals = {
-            "Portion (g)": round(float(sum(r["Portion (g)"] for r in rows)), 1),
-            "Calories (kcal)": round(float(sum(r["Calories (kcal)"] for r in rows)), 1),
-            "Protein (g)": round(float(sum(r["Protein (g)"] for r in rows)), 2),
-            "Carbs (g)": round(float(sum(r["Carbs (g)"] for r in rows)), 2),
-            "Fat (g)": round(float(sum(r["Fat (g)"] for r in rows)), 2),
-        }
+        # 0) Result cache (same decoded photo + same parameters)
+        cached, cache_entry = await asyncio.to_thread(
+            _cache_lookup, image, use_ai_portions, manual_override, portion_slider
+        )
+        if cached is not None:
+            return cached
 
-        # Build final result
-        result = {
-            "timestamp": datetime.utcnow().isoformat() + "Z",
-            "mode": "openai_generative" if USE_OPENAI else "food101_classifier",
-            "per_item": rows,
-            "totals": totals,
-        }
-        
-        if notes:
-            result["notes"] = notes
-            
-        if DEBUG or debug_lines:
-            result["debug"] = "\n".join(debug_lines)
+        debug_lines = []
+        if openai_error_msg:
+            debug_lines.append(openai_error_msg)
+        degraded = False
+
+        # 1) Manual override
+        items: List[Dict[str, Any]] = []
+        notes = ""
+        if manual_override.strip():
+            items = [{"name": manual_override.strip(), "grams": float(portion_slider), "confidence": 1.0}]
+            debug_lines.append("Using manual override.")
+        else:
+            # 2) Hedged: race OpenAI against the classifier
+            if USE_OPENAI and image is not None and settings.ANALYSIS_HEDGE_MODE in ("parallel", "delayed"):
+                items, notes, degraded = await _hedged_detect(image, portion_slider, debug_lines)
+            # 2) Try OpenAI
+            elif USE_OPENAI and image is not None:
+                try:
+                    items, notes, err = await openai_detect_async(image)
+                except CircuitOpenError as e:
+                    items, notes, err = [], "", str(e)
+                if err:
+                    debug_lines.append(err)
+                    degraded = True
+            # 3) Fallback if needed
+            if not items and image is not None:
+                items = await asyncio.to_thread(_classifier_items, image, portion_slider, debug_lines)
 
+        result = _build_result(items, notes, debug_lines, use_ai_portions, portion_slider)
+        _cache_store(cache_entry, result, degraded)
         return result
 
     except Exception as e:
@@ -0,0 +1,194 @@
+"""
+Frame sampling strategies for motion analysis
+Decide which decoded frames go through pose inference; skipped frames are filled in by
+interpolating the pose of the neighbouring sampled frames.
+
+Strategies:
+- all:      every frame (previous behaviour)
+- stride:   every Nth frame
+- time:     one frame per interval (ms), independent of the source fps
+- motion:   frames whose difference to the last sampled frame exceeds a threshold
+            (with a max gap so slow movement is still tracked)
+- grab-stride: every Nth frame, chosen before the frame is retrieved. For sinks that do not
+            write frames the ones in between are only grab()'ed (still decoded by the codec,
+            never converted to BGR or resized); sinks that write every frame (annotated video,
+            streams) still retrieve them, so there it behaves like stride. OpenCV does not
+            expose the keyframe flag, so this is not a keyframe-only decode
+"""
+
+from typing import Optional
+
+import cv2
+import numpy as np
+
+SAMPLING_STRATEGIES = ("all", "stride", "time", "motion", "grab-stride")
+
+class FrameSampler:
+    """Base sampler: samples every frame"""
+
+    name = "all"
+    # When True the decoder asks select() before decoding and only grab()s skipped frames
+    skip_decode = False
+
+    def select(self, index: int, frame: Optional[np.ndarray]) -> bool:
+        return True
+
+    def describe(self) -> dict:
+        return {"strategy": self.name}
+
+class StrideSampler(FrameSampler):
+    name = "stride"
+
+    def __init__(self, stride: int):
+        self.stride = max(1, int(stride))
+
+    def select(self, index, frame):
+        return index % self.stride == 0
+
+    def describe(self):
+        return {"strategy": self.name, "stride": self.stride}
+
+class TimeSampler(FrameSampler):
+    name = "time"
+
+    def __init__(self, interval_ms: float, fps: int):
+        self.interval_ms = max(1.0, float(interval_ms))
+        self.fps = max(1, fps)
+        self._next_ms = 0.0
+
+    def select(self, index, frame):
+        timestamp_ms = index * 1000.0 / self.fps
+        if timestamp_ms + 1e-6 < self._next_ms:
+            return False
+        self._next_ms += self.interval_ms
+        # Catch up if the interval is shorter than the frame duration
+        while self._next_ms <= timestamp_ms:
+            self._next_ms += self.interval_ms
+        return True
+
+    def describe(self):
+        return {"strategy": self.name, "interval_ms": self.interval_ms}
+
+class MotionSampler(FrameSampler):
+    """Motion-energy trigger: mean absolute difference of a small grayscale thumbnail"""
+
+    name = "motion"
+
+    def __init__(self, threshold: float, max_gap: int, thumb_size: int = 64):
+        self.threshold = float(threshold)
+        self.max_gap = max(1, int(max_gap))
+        self.thumb_size = thumb_size
+        self._last_thumb = None
+        self._last_index = None
+
+    def _thumb(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (self.thumb_size, self.thumb_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def select(self, index, frame):
+        thumb = self._thumb(frame)
+        if self._last_thumb is not None and index - self._last_index < self.max_gap:
+            energy = float(np.mean(np.abs(thumb - self._last_thumb)))
+            if energy < self.threshold:
+                return False
+        self._last_thumb = thumb
+        self._last_index = index
+        return True
+
+    def describe(self):
+        return {"strategy": self.name, "threshold": self.threshold, "max_gap": self.max_gap}
+
+class GrabStrideSampler(StrideSampler):
+    """
+    Stride sampling decided before decode. Skipped frames are only grab()'ed when the sink does
+    not write frames (FrameSink.writes_frames); grab() still decodes them, the saving is the
+    retrieve / colour conversion / resize. Annotated outputs retrieve every frame so the
+    interpolated pose is never drawn over a stale image.
+    """
+
+    name = "grab-stride"
+    skip_decode = True
+
+def create_sampler(strategy: str, fps: int, stride: int = 3, interval_ms: float = 100,
+                   motion_threshold: float = 4.0, motion_max_gap: int = 15) -> FrameSampler:
+    """Build a sampler by name; raises ValueError for unknown strategies"""
+    strategy = (strategy or "all").strip().lower()
+    if strategy == "all":
+        return FrameSampler()
+    if strategy == "stride":
+        return StrideSampler(stride)
+    if strategy == "time":
+        return TimeSampler(interval_ms, fps)
+    if strategy == "motion":
+        return MotionSampler(motion_threshold, motion_max_gap)
+    if strategy == "grab-stride":
+        return GrabStrideSampler(stride)
+    raise ValueError(f"Unknown sampling strategy '{strategy}' (expected one of {', '.join(SAMPLING_STRATEGIES)})")
+
+# ============== Pose interpolation / drawing ==============
+# COCO-17 skeleton (keypoint index pairs)
+COCO_SKELETON = (
+    (15, 13), (13, 11), (16, 14), (14, 12), (11, 12), (5, 11), (6, 12), (5, 6), (5, 7),
+    (6, 8), (7, 9), (8, 10), (1, 2), (0, 1), (0, 2), (1, 3), (2, 4), (3, 5), (4, 6),
+)
+
+class Pose:
+    """Per-frame pose arrays: boxes (N,4) xyxy, keypoints (N,17,2) xy, conf (N,17)"""
+
+    __slots__ = ("boxes", "keypoints", "conf")
+
+    def __init__(self, boxes: np.ndarray, keypoints: np.ndarray, conf: Optional[np.ndarray]):
+        self.boxes = boxes
+        self.keypoints = keypoints
+        self.conf = conf
+
+    @classmethod
+    def from_result(cls, result) -> "Pose":
+        """Extract arrays from an ultralytics pose Results object"""
+        boxes = result.boxes.xyxy.cpu().numpy() if result.boxes is not None else np.zeros((0, 4))
+        if result.keypoints is None:
+            return cls(boxes, np.zeros((0, 17, 2)), None)
+        keypoints = result.keypoints.xy.cpu().numpy()
+        conf = result.keypoints.conf.cpu().numpy() if result.keypoints.conf is not None else None
+        return cls(boxes, keypoints, conf)
+
+def interpolate_pose(prev: Optional[Pose], nxt: Optional[Pose], t: float) -> Optional[Pose]:
+    """
+    Linear interpolation between two sampled poses (t in [0, 1]).
+    People are matched by detection order; when the counts differ the nearer pose is held.
+    """
+    if prev is None or nxt is None:
+        return prev if prev is not None else nxt
+    if prev.keypoints.shape != nxt.keypoints.shape or prev.boxes.shape != nxt.boxes.shape:
+        return prev if t < 0.5 else nxt
+    conf = None
+    if prev.conf is not None and nxt.conf is not None:
+        conf = np.minimum(prev.conf, nxt.conf)
+    return Pose(
+        prev.boxes + (nxt.boxes - prev.boxes) * t,
+        prev.keypoints + (nxt.keypoints - prev.keypoints) * t,
+        conf,
+    )
+
+def draw_pose(frame: np.ndarray, pose: Optional[Pose], kpt_conf: float = 0.5) -> np.ndarray:
+    """Draw boxes, skeleton and keypoints on a copy of `frame`"""
+    canvas = frame.copy()
+    if pose is None:
+        return canvas
+    for box in pose.boxes:
+        x1, y1, x2, y2 = (int(v) for v in box)
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (56, 56, 255), 2)
+    for person, keypoints in enumerate(pose.keypoints):
+        visible = [
+            (x > 0 or y > 0) and (pose.conf is None or pose.conf[person][k] >= kpt_conf)
+            for k, (x, y) in enumerate(keypoints)
+        ]
+        for a, b in COCO_SKELETON:
+            if visible[a] and visible[b]:
+                pa = (int(keypoints[a][0]), int(keypoints[a][1]))
+                pb = (int(keypoints[b][0]), int(keypoints[b][1]))
+                cv2.line(canvas, pa, pb, (255, 128, 0), 2, cv2.LINE_AA)
+        for k, (x, y) in enumerate(keypoints):
+            if visible[k]:
+                cv2.circle(canvas, (int(x), int(y)), 4, (0, 255, 0), -1, cv2.LINE_AA)
+    return canvas
@@ -0,0 +1,219 @@
+"""
+Idempotency-Key store
+Keeps, per (caller, Idempotency-Key), the fingerprint of the first request and the response it
+produced. reserve() atomically claims a key: the first request runs and its response is stored
+with complete(); retries get the stored record back instead of running again. A request that
+fails (or never finishes within the lock timeout) releases its key so the client can retry.
+"""
+
+import time
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+Headers = List[Tuple[str, str]]
+
+# ============== Backends ==============
+class MemoryIdempotencyBackend:
+    """In-process store with TTL; entries beyond max_entries are dropped oldest first"""
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 86400, lock_seconds: float = 120):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.lock_seconds = float(lock_seconds)
+        self._data: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, record: Dict[str, Any], now: float) -> bool:
+        if record["status"] is None:
+            return now - record["created_at"] < self.lock_seconds
+        return now - record["created_at"] < self.ttl
+
+    def reserve(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            record = self._data.get(key)
+            if record is not None and self._live(record, now):
+                return dict(record)
+            self._data[key] = {"fingerprint": fingerprint, "status": None, "headers": [], "body": b"", "created_at": now}
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+            return None
+
+    def complete(self, key: str, status: int, headers: Headers, body: bytes):
+        with self._lock:
+            record = self._data.get(key)
+            if record is not None:
+                record.update(status=status, headers=headers, body=body)
+
+    def release(self, key: str):
+        with self._lock:
+            record = self._data.get(key)
+            if record is not None and record["status"] is None:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SqliteIdempotencyBackend:
+    """On-disk store shared by all workers on a host, so a retry can land on any worker"""
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl_seconds: float = 86400, lock_seconds: float = 120):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.lock_seconds = float(lock_seconds)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+                " key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, status INTEGER,"
+                " headers TEXT NOT NULL DEFAULT '', body BLOB, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+
+    @staticmethod
+    def _encode_headers(headers: Headers) -> str:
+        return "\n".join(f"{name}:{value}" for name, value in headers)
+
+    @staticmethod
+    def _decode_headers(text: str) -> Headers:
+        return [tuple(line.split(":", 1)) for line in text.split("\n") if line]
+
+    def reserve(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            # IMMEDIATE takes the write lock up front: two workers cannot both claim the key
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT fingerprint, status, headers, body, created_at FROM idempotency_keys WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    limit = self.lock_seconds if row[1] is None else self.ttl
+                    if now - row[4] < limit:
+                        conn.execute("COMMIT")
+                        return {"fingerprint": row[0], "status": row[1], "headers": self._decode_headers(row[2]),
+                                "body": row[3] or b"", "created_at": row[4]}
+                conn.execute(
+                    "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, status, headers, body, created_at)"
+                    " VALUES (?, ?, NULL, '', NULL, ?)",
+                    (key, fingerprint, now),
+                )
+                conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (now - max(self.ttl, self.lock_seconds),))
+                conn.execute(
+                    "DELETE FROM idempotency_keys WHERE key IN ("
+                    " SELECT key FROM idempotency_keys ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return None
+
+    def complete(self, key: str, status: int, headers: Headers, body: bytes):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE idempotency_keys SET status = ?, headers = ?, body = ? WHERE key = ?",
+                (status, self._encode_headers(headers), body, key),
+            )
+
+    def release(self, key: str):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM idempotency_keys WHERE key = ? AND status IS NULL", (key,))
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM idempotency_keys")
+
+    def __len__(self) -> int:
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0]
+
+# ============== Store front ==============
+class IdempotencyStore:
+    """Async front over a backend (sqlite calls run in the threadpool) with hit / conflict counters"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.stored = 0
+        self.replays = 0
+        self.conflicts = 0
+        self.in_progress = 0
+        self.released = 0
+
+    async def _call(self, method, *args):
+        if self.backend.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    async def reserve(self, key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """None when the caller now owns the key, otherwise the existing record"""
+        record = await self._call(self.backend.reserve, key, fingerprint)
+        if record is not None:
+            if record["fingerprint"] != fingerprint:
+                self.conflicts += 1
+            elif record["status"] is None:
+                self.in_progress += 1
+            else:
+                self.replays += 1
+        return record
+
+    async def complete(self, key: str, status: int, headers: Headers, body: bytes):
+        try:
+            await self._call(self.backend.complete, key, status, headers, body)
+            self.stored += 1
+        except Exception as e:
+            logger.warning(f"Idempotency store write failed: {e}")
+            await self.release(key)
+
+    async def release(self, key: str):
+        try:
+            await self._call(self.backend.release, key)
+            self.released += 1
+        except Exception as e:
+            logger.warning(f"Idempotency store release failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            entries = len(self.backend)
+        except Exception:
+            entries = None
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": entries,
+            "stored": self.stored,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+            "in_progress": self.in_progress,
+            "released": self.released,
+            "ttl_seconds": self.backend.ttl,
+        }
+
+def create_idempotency_store(backend: str, path: str, max_entries: int, ttl_seconds: float,
+                             lock_seconds: float) -> IdempotencyStore:
+    """Build the store from settings; `backend` is 'memory' or 'sqlite'"""
+    if backend == "sqlite":
+        store = SqliteIdempotencyBackend(path, max_entries=max_entries, ttl_seconds=ttl_seconds, lock_seconds=lock_seconds)
+    else:
+        store = MemoryIdempotencyBackend(max_entries=max_entries, ttl_seconds=ttl_seconds, lock_seconds=lock_seconds)
+    return IdempotencyStore(store)
@@ -0,0 +1,259 @@
+"""
+Content-addressed image storage
+Uploads are keyed by the SHA-256 of their bytes, so uploading the same photo again stores and
+processes nothing. One decode produces every derivative (thumb, list, full) as JPEG plus the
+optional IMAGE_EXTRA_FORMATS (webp, avif); a manifest written last marks the image complete.
+
+Records keep "sha256:<hex>" in image_path; objects live under images/<hex[:2]>/<hex>/ on the
+configured backend (local directory or an S3-compatible bucket such as MinIO).
+"""
+
+import io
+import os
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Largest first: each derivative is downscaled from the previous one
+VARIANTS = (
+    ("full", (800, 600)),
+    ("list", (400, 300)),
+    ("thumb", (160, 160)),
+)
+FORMATS = {
+    "jpeg": {"ext": "jpg", "content_type": "image/jpeg", "save": {"quality": 85, "optimize": True}},
+    "webp": {"ext": "webp", "content_type": "image/webp", "save": {"quality": 80, "method": 4}},
+    "avif": {"ext": "avif", "content_type": "image/avif", "save": {"quality": 60}},
+}
+REF_PREFIX = "sha256:"
+
+# ============== Keys and references ==============
+def image_ref(digest: str) -> str:
+    """Value stored in a record's image_path"""
+    return f"{REF_PREFIX}{digest}"
+
+def parse_image_ref(image_path: Optional[str]) -> Optional[str]:
+    """Digest of a content-addressed image_path, None for legacy file paths"""
+    if image_path and image_path.startswith(REF_PREFIX):
+        digest = image_path[len(REF_PREFIX):]
+        if len(digest) == 64 and all(c in "0123456789abcdef" for c in digest):
+            return digest
+    return None
+
+def image_prefix(digest: str) -> str:
+    return f"images/{digest[:2]}/{digest}/"
+
+def variant_key(digest: str, variant: str, fmt: str = "jpeg") -> str:
+    return f"{image_prefix(digest)}{variant}.{FORMATS[fmt]['ext']}"
+
+def manifest_key(digest: str) -> str:
+    return f"{image_prefix(digest)}manifest.json"
+
+def output_formats() -> List[str]:
+    """JPEG plus the configured extra formats this Pillow build can encode"""
+    from PIL import features
+
+    formats = ["jpeg"]
+    for fmt in (f.strip().lower() for f in settings.IMAGE_EXTRA_FORMATS.split(",")):
+        if fmt not in FORMATS or fmt in formats:
+            continue
+        if features.check(fmt):
+            formats.append(fmt)
+        else:
+            logger.warning(f"Pillow cannot encode {fmt}; skipping it")
+    return formats
+
+# ============== Backends ==============
+class StorageBackend(ABC):
+    """Minimal object store interface (blocking; call from worker threads)"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def put(self, key: str, data: bytes, content_type: str):
+        ...
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        ...
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of an object, when the backend has one (lets responses use sendfile)"""
+        return None
+
+class LocalStorageBackend(StorageBackend):
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Key outside storage root: {key}")
+        return path
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, data: bytes, content_type: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def delete_prefix(self, prefix: str):
+        directory = self._path(prefix)
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+class S3StorageBackend(StorageBackend):
+    """S3-compatible bucket (AWS S3, MinIO); needs boto3"""
+
+    def __init__(self, bucket: str, endpoint_url: str = "", access_key_id: str = "",
+                 secret_access_key: str = "", region: str = "us-east-1"):
+        try:
+            import boto3
+        except ImportError as e:
+            raise RuntimeError("IMAGE_STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from e
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+            region_name=region,
+        )
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key: str, data: bytes, content_type: str):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType=content_type,
+                               CacheControl="public, max-age=31536000, immutable")
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def delete_prefix(self, prefix: str):
+        listing = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
+        objects = [{"Key": obj["Key"]} for obj in listing.get("Contents", [])]
+        if objects:
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": objects})
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+def get_storage() -> StorageBackend:
+    """Backend selected by IMAGE_STORAGE_BACKEND (created on first use)"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if settings.IMAGE_STORAGE_BACKEND == "s3":
+                _storage = S3StorageBackend(
+                    bucket=settings.S3_BUCKET,
+                    endpoint_url=settings.S3_ENDPOINT_URL,
+                    access_key_id=settings.S3_ACCESS_KEY_ID,
+                    secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+                    region=settings.S3_REGION,
+                )
+            else:
+                _storage = LocalStorageBackend(settings.IMAGE_STORAGE_DIR)
+        return _storage
+
+# ============== Derivatives ==============
+def generate_derivatives(source_path: str, formats: List[str]) -> Dict[str, Any]:
+    """
+    Decode the upload once and encode every variant in every format.
+    Returns {"width", "height", "files": {(variant, fmt): (bytes, width, height)}}
+    """
+    files = {}
+    with Image.open(source_path) as img:
+        width, height = img.size
+        # JPEG: let the decoder scale by 1/2, 1/4 or 1/8 while decoding (no-op for other formats)
+        img.draft("RGB", VARIANTS[0][1])
+        current = img.convert("RGB") if img.mode not in ("RGB", "L") else img.copy()
+
+    for variant, size in VARIANTS:
+        current.thumbnail(size, Image.Resampling.LANCZOS)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            current.save(buffer, fmt.upper(), **FORMATS[fmt]["save"])
+            files[(variant, fmt)] = (buffer.getvalue(), current.width, current.height)
+    return {"width": width, "height": height, "files": files}
+
+def has_image(digest: str) -> bool:
+    return get_storage().exists(manifest_key(digest))
+
+def store_image(source_path: str, digest: str) -> Dict[str, Any]:
+    """Generate and upload the derivatives of a staged upload, then write its manifest"""
+    storage = get_storage()
+    formats = output_formats()
+    result = generate_derivatives(source_path, formats)
+    variants: Dict[str, Dict[str, Any]] = {}
+    for (variant, fmt), (data, width, height) in result["files"].items():
+        storage.put(variant_key(digest, variant, fmt), data, FORMATS[fmt]["content_type"])
+        entry = variants.setdefault(variant, {"width": width, "height": height, "bytes": {}})
+        entry["bytes"][fmt] = len(data)
+
+    manifest = {
+        "digest": digest,
+        "source": {"width": result["width"], "height": result["height"], "bytes": os.path.getsize(source_path)},
+        "formats": formats,
+        "variants": variants,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    storage.put(manifest_key(digest), json.dumps(manifest).encode("utf-8"), "application/json")
+    return manifest
+
+def load_manifest(digest: str) -> Optional[Dict[str, Any]]:
+    storage = get_storage()
+    key = manifest_key(digest)
+    if not storage.exists(key):
+        return None
+    return json.loads(storage.get(key))
+
+def delete_image_content(digest: str):
+    get_storage().delete_prefix(image_prefix(digest))
@@ -0,0 +1,231 @@
+"""
+Central model registry
+Models are registered with a loader at import time (cheap) and only built on first use.
+Tracks memory per model and can unload idle / least-recently-used models.
+"""
+
+import gc
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+def estimate_memory_bytes(obj: Any, _depth: int = 0) -> int:
+    """Best-effort size of a model's parameters and buffers in bytes"""
+    if obj is None or _depth > 3:
+        return 0
+    try:
+        import torch.nn as nn
+        if isinstance(obj, nn.Module):
+            params = sum(p.numel() * p.element_size() for p in obj.parameters())
+            buffers = sum(b.numel() * b.element_size() for b in obj.buffers())
+            return params + buffers
+    except ImportError:
+        return 0
+    # Wrappers such as transformers pipelines and ultralytics YOLO keep the network on `.model`
+    inner = getattr(obj, "model", None)
+    if inner is not None and inner is not obj:
+        return estimate_memory_bytes(inner, _depth + 1)
+    return 0
+
+class _ModelEntry:
+    def __init__(self, name: str, loader: Callable[[], Any], description: str, pinned: bool):
+        self.name = name
+        self.loader = loader
+        self.description = description
+        self.pinned = pinned
+        self.instance: Any = None
+        self.lock = threading.Lock()
+        self.memory_bytes = 0
+        self.load_seconds = 0.0
+        self.load_count = 0
+        self.hits = 0
+        self.last_used = 0.0
+        self.last_error: Optional[str] = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "description": self.description,
+            "loaded": self.instance is not None,
+            "pinned": self.pinned,
+            "memory_mb": round(self.memory_bytes / (1024 * 1024), 1),
+            "load_seconds": round(self.load_seconds, 3),
+            "load_count": self.load_count,
+            "hits": self.hits,
+            "idle_seconds": round(time.time() - self.last_used, 1) if self.last_used else None,
+            "last_error": self.last_error,
+        }
+
+class ModelRegistry:
+    """
+    Lazy model registry.
+
+    - `register()` only records a loader; nothing is imported or built.
+    - `get()` loads on first use (one loader run per model, even under concurrency).
+    - When `memory_limit_mb` is set, least-recently-used unpinned models are unloaded
+      to make room; when `idle_unload_seconds` is set, a reaper thread unloads idle models.
+    """
+
+    def __init__(self, memory_limit_mb: float = 0, idle_unload_seconds: float = 0):
+        self.memory_limit_bytes = int(memory_limit_mb * 1024 * 1024)
+        self.idle_unload_seconds = float(idle_unload_seconds)
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[], Any], description: str = "", pinned: bool = False):
+        """Register a loader under `name` (re-registering replaces the loader)"""
+        with self._lock:
+            self._entries[name] = _ModelEntry(name, loader, description, pinned)
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def is_loaded(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return bool(entry and entry.instance is not None)
+
+    def get(self, name: str) -> Any:
+        """Return the model, loading it on first use"""
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Model '{name}' is not registered")
+
+        instance = entry.instance
+        loaded = False
+        if instance is None:
+            with entry.lock:
+                instance = entry.instance
+                if instance is None:
+                    instance = self._load(entry)
+                    loaded = True
+
+        entry.hits += 1
+        entry.last_used = time.time()
+        with self._lock:
+            self._lru[name] = None
+            self._lru.move_to_end(name)
+        if loaded:
+            # Outside entry.lock: evicting takes other entries' locks, and two threads loading
+            # different models must never hold one entry lock while waiting for another
+            self._enforce_memory_limit(keep=name)
+            self._ensure_reaper()
+        return instance
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Load the given models (default: all registered) and report per-model status"""
+        results = {}
+        for name in (list(names) if names else self.names()):
+            try:
+                self.get(name)
+                results[name] = self._entries[name].status()
+            except Exception as e:
+                results[name] = {"loaded": False, "error": str(e)}
+        return results
+
+    def unload(self, name: str) -> bool:
+        """Drop a loaded model; returns False if it was not loaded"""
+        entry = self._entries.get(name)
+        if entry is None or entry.instance is None:
+            return False
+        with entry.lock:
+            entry.instance = None
+            freed = entry.memory_bytes
+            entry.memory_bytes = 0
+        with self._lock:
+            self._lru.pop(name, None)
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+        logger.info(f"Model '{name}' unloaded ({freed / (1024 * 1024):.1f} MB)")
+        return True
+
+    def unload_idle(self, max_idle_seconds: Optional[float] = None) -> List[str]:
+        """Unload unpinned models idle for longer than `max_idle_seconds`"""
+        max_idle = self.idle_unload_seconds if max_idle_seconds is None else max_idle_seconds
+        if max_idle <= 0:
+            return []
+        now = time.time()
+        unloaded = []
+        for name, entry in list(self._entries.items()):
+            if entry.instance is not None and not entry.pinned and now - entry.last_used > max_idle:
+                if self.unload(name):
+                    unloaded.append(name)
+        return unloaded
+
+    def total_memory_bytes(self) -> int:
+        return sum(e.memory_bytes for e in self._entries.values() if e.instance is not None)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "memory_limit_mb": round(self.memory_limit_bytes / (1024 * 1024), 1) or None,
+            "idle_unload_seconds": self.idle_unload_seconds or None,
+            "total_memory_mb": round(self.total_memory_bytes() / (1024 * 1024), 1),
+            "models": {name: entry.status() for name, entry in self._entries.items()},
+        }
+
+    # ---------- internals ----------
+    def _load(self, entry: _ModelEntry) -> Any:
+        logger.info(f"Loading model '{entry.name}'...")
+        started = time.perf_counter()
+        try:
+            instance = entry.loader()
+        except Exception as e:
+            entry.last_error = str(e)
+            logger.error(f"Failed to load model '{entry.name}': {e}")
+            raise
+        entry.load_seconds = time.perf_counter() - started
+        entry.load_count += 1
+        entry.last_error = None
+        entry.memory_bytes = estimate_memory_bytes(instance)
+        entry.instance = instance
+        logger.info(f"Model '{entry.name}' loaded in {entry.load_seconds:.2f}s "
+                    f"({entry.memory_bytes / (1024 * 1024):.1f} MB)")
+        return instance
+
+    def _enforce_memory_limit(self, keep: str):
+        if self.memory_limit_bytes <= 0:
+            return
+        with self._lock:
+            candidates = [n for n in self._lru if n != keep and not self._entries[n].pinned]
+        for name in candidates:
+            if self.total_memory_bytes() <= self.memory_limit_bytes:
+                break
+            self.unload(name)
+
+    def _ensure_reaper(self):
+        if self.idle_unload_seconds <= 0 or (self._reaper and self._reaper.is_alive()):
+            return
+        self._reaper = threading.Thread(target=self._reap_forever, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_forever(self):
+        interval = max(self.idle_unload_seconds / 4, 5.0)
+        while True:
+            time.sleep(interval)
+            try:
+                self.unload_idle()
+            except Exception as e:
+                logger.warning(f"Idle model reaper failed: {e}")
+
+registry = ModelRegistry(
+    memory_limit_mb=settings.MODEL_MEMORY_LIMIT_MB,
+    idle_unload_seconds=settings.MODEL_IDLE_UNLOAD_SECONDS,
+)
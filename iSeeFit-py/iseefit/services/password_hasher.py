@@ -0,0 +1,163 @@
+"""
+Password hashing off the event loop
+bcrypt at cost 12 takes roughly 250 ms of CPU per hash or check. Running it inside an async
+route blocks every other request on the worker, so hashing and verification go through a small
+dedicated executor instead. Work beyond the worker count queues in the executor up to
+PASSWORD_HASH_MAX_PENDING, after which callers get PasswordHasherBusy (HTTP 503) rather than an
+ever-growing backlog.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import bcrypt
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+from utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+class PasswordHasherBusy(Exception):
+    """Too many hash / verify operations pending"""
+
+# ============== Worker functions ==============
+# Module-level so they can be pickled into a process pool. Each returns (result, started, elapsed)
+# with time.monotonic() timestamps, which are comparable across processes.
+def _hash_worker(password: bytes, rounds: int) -> Tuple[bytes, float, float]:
+    started = time.monotonic()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+    return hashed, started, time.monotonic() - started
+
+def _verify_worker(password: bytes, hashed: bytes) -> Tuple[bool, float, float]:
+    started = time.monotonic()
+    try:
+        ok = bcrypt.checkpw(password, hashed)
+    except ValueError:
+        # Malformed or non-bcrypt hash stored for the user
+        ok = False
+    return ok, started, time.monotonic() - started
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """Cost parameter of a bcrypt hash ("$2b$12$..." -> 12), None if it is not a bcrypt hash"""
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+# ============== Hasher ==============
+class PasswordHasher:
+    """bcrypt hashing and verification on a bounded thread or process pool"""
+
+    def __init__(self, rounds: int = 12, max_workers: int = 2, max_pending: int = 64, executor: str = "thread"):
+        self.rounds = int(rounds)
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(self.max_workers, int(max_pending))
+        self.executor_kind = "process" if executor == "process" else "thread"
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.queue_wait = Histogram()
+        self.hash_seconds = Histogram()
+        self.verify_seconds = Histogram()
+        self.hashes = 0
+        self.verifications = 0
+        self.rejected = 0
+        self.rehashes = 0
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.executor_kind == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    # bcrypt releases the GIL while hashing, so threads run in parallel
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+            return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy(f"{self.pending} password hash operations pending")
+            self.pending += 1
+
+    def _release(self):
+        with self._lock:
+            self.pending -= 1
+
+    async def _run(self, fn, *args) -> Tuple[Any, float]:
+        """Run a worker function; returns (result, seconds spent hashing)"""
+        self._acquire()
+        try:
+            submitted = time.monotonic()
+            loop = asyncio.get_running_loop()
+            result, started, elapsed = await loop.run_in_executor(self._get_executor(), fn, *args)
+            self.queue_wait.observe(max(0.0, started - submitted))
+            return result, elapsed
+        finally:
+            self._release()
+
+    async def hash(self, password: str) -> str:
+        hashed, elapsed = await self._run(_hash_worker, password.encode("utf-8"), self.rounds)
+        self.hash_seconds.observe(elapsed)
+        with self._lock:
+            self.hashes += 1
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        ok, elapsed = await self._run(_verify_worker, password.encode("utf-8"), hashed_password.encode("utf-8"))
+        self.verify_seconds.observe(elapsed)
+        with self._lock:
+            self.verifications += 1
+        return ok
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """True when the stored hash was made with a different cost than BCRYPT_ROUNDS"""
+        return hash_rounds(hashed_password) != self.rounds
+
+    def record_rehash(self):
+        with self._lock:
+            self.rehashes += 1
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {
+                "executor": self.executor_kind,
+                "rounds": self.rounds,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "queued": max(0, self.pending - self.max_workers),
+                "hashes": self.hashes,
+                "verifications": self.verifications,
+                "rejected": self.rejected,
+                "rehashes": self.rehashes,
+            }
+        counters["queue_wait_seconds"] = self.queue_wait.snapshot()
+        counters["hash_seconds"] = self.hash_seconds.snapshot()
+        counters["verify_seconds"] = self.verify_seconds.snapshot()
+        return counters
+
+password_hasher = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    executor=settings.PASSWORD_HASH_EXECUTOR,
+)
@@ -2,6 +2,7 @@
 Recommendation service for generating personalized recommendations
 """
 
+import json
 import logging
 from typing import List
 from datetime import datetime, date, timedelta
@@ -14,9 +15,10 @@ parent_dir = Path(__file__).parent.parent
 sys.path.append(str(parent_dir))
 
 from models.user import User
-from models.meal import MealRecord
-from models.workout import WorkoutRecord
 from models.recommendation import Recommendation
+from models.rollup import DailyUserRollup
+from services.rollup_service import get_rollups
+from services.recommendation_stats import invalidate_recommendation_stats
 
 logger = logging.getLogger(__name__)
 
@@ -28,20 +30,19 @@ class RecommendationService:
         """Generate personalized recommendations for user"""
         recommendations = []
         
-        # Get user's recent data
-        recent_meals = self._get_recent_meals(user.id, days=7)
-        recent_workouts = self._get_recent_workouts(user.id, days=7)
+        # Get user's recent data (one rollup row per active day)
+        recent_days = self._get_recent_rollups(user.id, days=7)
         
         # Generate meal recommendations
-        meal_recs = self._generate_meal_recommendations(user, recent_meals)
+        meal_recs = self._generate_meal_recommendations(user, recent_days)
         recommendations.extend(meal_recs)
         
         # Generate workout recommendations
-        workout_recs = self._generate_workout_recommendations(user, recent_workouts)
+        workout_recs = self._generate_workout_recommendations(user, recent_days)
         recommendations.extend(workout_recs)
         
         # Generate general health recommendations
-        general_recs = self._generate_general_recommendations(user, recent_meals, recent_workouts)
+        general_recs = self._generate_general_recommendations(user, recent_days)
         recommendations.extend(general_recs)
         
         # Save recommendations to database
@@ -49,32 +50,22 @@ class RecommendationService:
             self.db.add(rec)
         
         self.db.commit()
+        invalidate_recommendation_stats(user.id)
         
         logger.info(f"Generated {len(recommendations)} recommendations for user {user.username}")
         return recommendations
     
-    def _get_recent_meals(self, user_id: int, days: int = 7) -> List[MealRecord]:
-        """Get user's recent meal records"""
-        start_date = datetime.now() - timedelta(days=days)
-        return self.db.query(MealRecord).filter(
-            MealRecord.user_id == user_id,
-            MealRecord.recorded_at >= start_date
-        ).all()
+    def _get_recent_rollups(self, user_id: int, days: int = 7) -> List[DailyUserRollup]:
+        """Get user's daily rollup rows for the last `days` days"""
+        start_date = (datetime.now() - timedelta(days=days)).date()
+        return get_rollups(self.db, user_id, start_date, date.today())
     
-    def _get_recent_workouts(self, user_id: int, days: int = 7) -> List[WorkoutRecord]:
-        """Get user's recent workout records"""
-        start_date = datetime.now() - timedelta(days=days)
-        return self.db.query(WorkoutRecord).filter(
-            WorkoutRecord.user_id == user_id,
-            WorkoutRecord.recorded_at >= start_date
-        ).all()
-    
-    def _generate_meal_recommendations(self, user: User, recent_meals: List[MealRecord]) -> List[Recommendation]:
+    def _generate_meal_recommendations(self, user: User, recent_days: List[DailyUserRollup]) -> List[Recommendation]:
         """Generate meal-related recommendations"""
         recommendations = []
         
         # Calculate daily average calories
-        daily_calories = self._calculate_daily_calories(recent_meals)
+        daily_calories = self._calculate_daily_calories(recent_days)
         target_calories = self._calculate_target_calories(user)
         
         # Calorie intake recommendations
@@ -96,7 +87,7 @@ class RecommendationService:
             ))
         
         # Protein intake recommendations
-        daily_protein = self._calculate_daily_protein(recent_meals)
+        daily_protein = self._calculate_daily_protein(recent_days)
         target_protein = self._calculate_target_protein(user)
         
         if daily_protein < target_protein * 0.8:
@@ -110,12 +101,12 @@ class RecommendationService:
         
         return recommendations
     
-    def _generate_workout_recommendations(self, user: User, recent_workouts: List[WorkoutRecord]) -> List[Recommendation]:
+    def _generate_workout_recommendations(self, user: User, recent_days: List[DailyUserRollup]) -> List[Recommendation]:
         """Generate workout-related recommendations"""
         recommendations = []
         
         # Calculate weekly exercise duration
-        weekly_duration = sum(workout.duration_minutes for workout in recent_workouts)
+        weekly_duration = sum(day.workout_minutes for day in recent_days)
         target_duration = 150  # WHO recommendation: 150 minutes per week
         
         if weekly_duration < target_duration * 0.5:
@@ -136,7 +127,9 @@ class RecommendationService:
             ))
         
         # Exercise variety recommendations
-        workout_types = set(workout.workout_type for workout in recent_workouts)
+        workout_types = set()
+        for day in recent_days:
+            workout_types.update(json.loads(day.workout_breakdown or "{}"))
         if len(workout_types) < 2:
             recommendations.append(Recommendation(
                 user_id=user.id,
@@ -148,7 +141,7 @@ class RecommendationService:
         
         return recommendations
     
-    def _generate_general_recommendations(self, user: User, recent_meals: List[MealRecord], recent_workouts: List[WorkoutRecord]) -> List[Recommendation]:
+    def _generate_general_recommendations(self, user: User, recent_days: List[DailyUserRollup]) -> List[Recommendation]:
         """Generate general health recommendations"""
         recommendations = []
         
@@ -172,33 +165,15 @@ class RecommendationService:
         
         return recommendations
     
-    def _calculate_daily_calories(self, meals: List[MealRecord]) -> float:
-        """Calculate daily average calorie intake"""
-        if not meals:
-            return 0
-        
-        daily_calories = {}
-        for meal in meals:
-            meal_date = meal.recorded_at.date()
-            if meal_date not in daily_calories:
-                daily_calories[meal_date] = 0
-            daily_calories[meal_date] += meal.calories
-        
-        return sum(daily_calories.values()) / len(daily_calories) if daily_calories else 0
+    def _calculate_daily_calories(self, recent_days: List[DailyUserRollup]) -> float:
+        """Calculate daily average calorie intake (over days with meals)"""
+        meal_days = [day for day in recent_days if day.meal_count]
+        return sum(day.kcal_in for day in meal_days) / len(meal_days) if meal_days else 0
     
-    def _calculate_daily_protein(self, meals: List[MealRecord]) -> float:
-        """Calculate daily average protein intake"""
-        if not meals:
-            return 0
-        
-        daily_protein = {}
-        for meal in meals:
-            meal_date = meal.recorded_at.date()
-            if meal_date not in daily_protein:
-                daily_protein[meal_date] = 0
-            daily_protein[meal_date] += meal.protein
-        
-        return sum(daily_protein.values()) / len(daily_protein) if daily_protein else 0
+    def _calculate_daily_protein(self, recent_days: List[DailyUserRollup]) -> float:
+        """Calculate daily average protein intake (over days with meals)"""
+        meal_days = [day for day in recent_days if day.meal_count]
+        return sum(day.protein for day in meal_days) / len(meal_days) if meal_days else 0
     
     def _calculate_target_calories(self, user: User) -> float:
         """Calculate target daily calorie intake"""
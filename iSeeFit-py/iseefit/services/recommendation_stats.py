@@ -0,0 +1,88 @@
+"""
+Recommendation statistics
+All counters (total / unread / per type / per priority) come from one
+GROUP BY recommendation_type, priority, is_read query; the result is cached per user
+and invalidated whenever that user's recommendations are generated, read or deleted.
+The cache is per process: invalidation only reaches the worker that handled the write, so
+other workers can serve counts up to RECOMMENDATION_STATS_CACHE_TTL_SECONDS old after a write.
+"""
+
+import logging
+from typing import Any, Dict
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+from models.recommendation import Recommendation
+from services.ttl_cache import KeyedTTLCache
+
+logger = logging.getLogger(__name__)
+
+# Buckets always present in the response (other values only count towards the totals)
+RECOMMENDATION_TYPES = ("meal", "workout", "general")
+RECOMMENDATION_PRIORITIES = ("low", "medium", "high")
+
+# ============== Query ==============
+def stats_stmt(user_id: int):
+    """SELECT type, priority, is_read, COUNT(*) ... GROUP BY type, priority, is_read"""
+    return (
+        select(
+            Recommendation.recommendation_type,
+            Recommendation.priority,
+            Recommendation.is_read,
+            func.count(Recommendation.id).label("count"),
+        )
+        .where(Recommendation.user_id == user_id)
+        .group_by(Recommendation.recommendation_type, Recommendation.priority, Recommendation.is_read)
+    )
+
+def compute_stats(db: Session, user_id: int) -> Dict[str, Any]:
+    """Fold the grouped rows into the /recommendations/stats response"""
+    total = unread = 0
+    type_stats = {t: 0 for t in RECOMMENDATION_TYPES}
+    priority_stats = {p: 0 for p in RECOMMENDATION_PRIORITIES}
+    for rec_type, priority, is_read, count in db.execute(stats_stmt(user_id)):
+        total += count
+        if not is_read:
+            unread += count
+        if rec_type in type_stats:
+            type_stats[rec_type] += count
+        if priority in priority_stats:
+            priority_stats[priority] += count
+    return {
+        "total_recommendations": total,
+        "unread_recommendations": unread,
+        "read_recommendations": total - unread,
+        "type_stats": type_stats,
+        "priority_stats": priority_stats,
+    }
+
+# ============== Cache ==============
+stats_cache = KeyedTTLCache(
+    ttl_seconds=settings.RECOMMENDATION_STATS_CACHE_TTL_SECONDS,
+    max_entries=settings.RECOMMENDATION_STATS_CACHE_MAX_ENTRIES,
+)
+
+async def cached_recommendation_stats(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+    """Cached stats for one user (one grouped query on a miss, none on a hit)"""
+    if not stats_cache.enabled:
+        return await db.run_sync(compute_stats, user_id)
+    cached, generation = stats_cache.get(user_id)
+    if cached is not None:
+        return cached
+    result = await db.run_sync(compute_stats, user_id)
+    stats_cache.set(user_id, result, generation)
+    return result
+
+def invalidate_recommendation_stats(user_id: int):
+    """Call after committing any change to the user's recommendations"""
+    stats_cache.invalidate(user_id)
@@ -0,0 +1,158 @@
+"""
+Rotating refresh tokens and session revocation
+Login issues a refresh token next to the 30-minute access token; /auth/refresh exchanges it for a
+new pair, so clients stay signed in without sending the password (and paying for bcrypt) again.
+
+Every refresh token belongs to a family (one per login). Exchanging a token marks it rotated;
+presenting a rotated token again means it leaked, so the whole family is revoked. Access tokens
+carry the family as their sid claim and are checked against an in-memory set of revoked families,
+synced from the table every TOKEN_REVOCATION_SYNC_SECONDS, so revocation costs no query per request.
+"""
+
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+from models.refresh_token import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+class InvalidRefreshToken(Exception):
+    """Unknown, expired, rotated or revoked refresh token"""
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+# ============== Revocation list ==============
+SYNC_OVERLAP = timedelta(seconds=60)
+
+class RevocationList:
+    """
+    Families revoked recently enough that access tokens carrying them may still be valid.
+    Entries older than the access token lifetime are dropped, so the set stays small.
+    """
+
+    def __init__(self, retention_seconds: float, sync_seconds: float):
+        self.retention = timedelta(seconds=retention_seconds)
+        self.sync_seconds = float(sync_seconds)
+        self._revoked: Dict[str, datetime] = {}
+        self._synced_until: Optional[datetime] = None
+        self._next_sync = 0.0
+        self._sync_lock: Optional[asyncio.Lock] = None
+        self.syncs = 0
+
+    def add(self, family_id: str, revoked_at: Optional[datetime] = None):
+        self._revoked[family_id] = revoked_at or datetime.utcnow()
+
+    def is_revoked(self, family_id: str) -> bool:
+        return family_id in self._revoked
+
+    def needs_sync(self) -> bool:
+        return time.monotonic() >= self._next_sync
+
+    async def sync(self, db: AsyncSession):
+        """Pick up families revoked by other workers since the last sync"""
+        if self._sync_lock is None:
+            self._sync_lock = asyncio.Lock()
+        async with self._sync_lock:
+            if not self.needs_sync():
+                return
+            cutoff = datetime.utcnow() - self.retention
+            # Overlap so a revocation committed late with an earlier timestamp is not missed
+            since = max(self._synced_until - SYNC_OVERLAP if self._synced_until else cutoff, cutoff)
+            rows = (await db.execute(
+                select(RefreshToken.family_id, RefreshToken.revoked_at)
+                .where(RefreshToken.revoked_at >= since)
+                .distinct()
+            )).all()
+            for family_id, revoked_at in rows:
+                self.add(family_id, revoked_at)
+                if self._synced_until is None or revoked_at > self._synced_until:
+                    self._synced_until = revoked_at
+            self._synced_until = self._synced_until or cutoff
+            self._revoked = {f: at for f, at in self._revoked.items() if at >= cutoff}
+            self._next_sync = time.monotonic() + self.sync_seconds
+            self.syncs += 1
+
+    def clear(self):
+        self._revoked.clear()
+        self._synced_until = None
+        self._next_sync = 0.0
+
+    def stats(self) -> Dict[str, int]:
+        return {"revoked_families": len(self._revoked), "syncs": self.syncs}
+
+revocation_list = RevocationList(
+    retention_seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    sync_seconds=settings.TOKEN_REVOCATION_SYNC_SECONDS,
+)
+
+# ============== Issue / rotate / revoke ==============
+def issue_refresh_token(db: AsyncSession, user_id: int, family_id: Optional[str] = None) -> Tuple[str, str]:
+    """Add a new refresh token (caller commits); returns (token, family_id)"""
+    token = secrets.token_urlsafe(32)
+    family_id = family_id or uuid.uuid4().hex
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id,
+        expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token, family_id
+
+async def revoke_family(db: AsyncSession, family_id: str):
+    """Revoke every token of a login session (commits)"""
+    now = datetime.utcnow()
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    await db.commit()
+    revocation_list.add(family_id, now)
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Tuple[int, str, str]:
+    """
+    Exchange a refresh token for a new one in the same family (commits).
+    Returns (user_id, new_token, family_id); raises InvalidRefreshToken.
+    """
+    row = await db.scalar(select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(token)))
+    if row is None:
+        raise InvalidRefreshToken("unknown refresh token")
+    if row.revoked_at is not None:
+        raise InvalidRefreshToken("refresh token revoked")
+
+    now = datetime.utcnow()
+    if row.expires_at <= now:
+        raise InvalidRefreshToken("refresh token expired")
+
+    # Conditional update: of two requests presenting the same token only one can rotate it
+    rotated = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.rotated_at.is_(None), RefreshToken.revoked_at.is_(None))
+        .values(rotated_at=now)
+    )
+    if rotated.rowcount != 1:
+        logger.warning(f"Refresh token reuse detected for user {row.user_id}; revoking session {row.family_id}")
+        await revoke_family(db, row.family_id)
+        raise InvalidRefreshToken("refresh token reused")
+
+    new_token, family_id = issue_refresh_token(db, row.user_id, row.family_id)
+    await db.commit()
+    return row.user_id, new_token, family_id
@@ -0,0 +1,237 @@
+"""
+Content-addressed result cache for food image analysis
+Results are keyed by a hash of the decoded pixels plus the analysis parameters, with optional
+perceptual-hash matching so re-encoded / near-duplicate photos also hit.
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# ============== Hashing ==============
+def image_digest(img: Image.Image) -> str:
+    """SHA-256 of the decoded RGB pixels (independent of file encoding / EXIF)"""
+    rgb = img if img.mode == "RGB" else img.convert("RGB")
+    h = hashlib.sha256()
+    h.update(f"{rgb.width}x{rgb.height}".encode())
+    h.update(rgb.tobytes())
+    return h.hexdigest()
+
+def perceptual_hash(img: Image.Image, hash_size: int = 8) -> int:
+    """64-bit difference hash (dHash): robust to re-encoding, resizing and small edits"""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+# ============== Backends ==============
+class MemoryCacheBackend:
+    """In-process LRU cache with TTL"""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 86400):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self._data: "OrderedDict[str, Tuple[float, str, Optional[int], Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0]):
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[3]
+
+    def find_similar(self, phash: int, params_key: str, max_distance: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            best_key, best_dist = None, max_distance + 1
+            for key, (created_at, pkey, ph, _) in self._data.items():
+                if ph is None or pkey != params_key or self._expired(created_at):
+                    continue
+                dist = hamming_distance(ph, phash)
+                if dist < best_dist:
+                    best_key, best_dist = key, dist
+            if best_key is None:
+                return None
+            self._data.move_to_end(best_key)
+            return self._data[best_key][3]
+
+    def set(self, key: str, value: Dict[str, Any], phash: Optional[int], params_key: str):
+        with self._lock:
+            self._data[key] = (time.time(), params_key, phash, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SqliteCacheBackend:
+    """On-disk cache shared by all workers on a host (sqlite, LRU by last access, TTL)"""
+
+    def __init__(self, path: str, max_entries: int = 1000, ttl_seconds: float = 86400):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                " key TEXT PRIMARY KEY, params_key TEXT NOT NULL, phash TEXT NOT NULL,"
+                " value TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_params ON analysis_cache (params_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_access ON analysis_cache (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+
+    def _min_created(self) -> float:
+        return time.time() - self.ttl if self.ttl > 0 else 0.0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM analysis_cache WHERE key = ? AND created_at >= ?",
+                (key, self._min_created()),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE analysis_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            return json.loads(row[0])
+
+    def find_similar(self, phash: int, params_key: str, max_distance: int) -> Optional[Dict[str, Any]]:
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, phash FROM analysis_cache WHERE params_key = ? AND created_at >= ? AND phash != ''",
+                (params_key, self._min_created()),
+            ).fetchall()
+            best_key, best_dist = None, max_distance + 1
+            for key, ph in rows:
+                dist = hamming_distance(int(ph, 16), phash)
+                if dist < best_dist:
+                    best_key, best_dist = key, dist
+            if best_key is None:
+                return None
+            row = conn.execute("SELECT value FROM analysis_cache WHERE key = ?", (best_key,)).fetchone()
+            conn.execute("UPDATE analysis_cache SET last_access = ? WHERE key = ?", (time.time(), best_key))
+            return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict[str, Any], phash: Optional[int], params_key: str):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, params_key, phash, value, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, params_key, "" if phash is None else f"{phash:016x}", json.dumps(value), now, now),
+            )
+            conn.execute("DELETE FROM analysis_cache WHERE created_at < ?", (self._min_created(),))
+            conn.execute(
+                "DELETE FROM analysis_cache WHERE key IN ("
+                " SELECT key FROM analysis_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM analysis_cache")
+
+    def __len__(self) -> int:
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+
+# ============== Cache front ==============
+class AnalysisResultCache:
+    """Exact (pixel digest) lookup first, then optional perceptual near-duplicate lookup"""
+
+    def __init__(self, backend, phash_max_distance: int = 0):
+        self.backend = backend
+        self.phash_max_distance = max(0, int(phash_max_distance))
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def params_key(**params: Any) -> str:
+        return json.dumps(params, sort_keys=True, default=str)
+
+    def lookup(self, img: Image.Image, params_key: str) -> Tuple[Optional[Dict[str, Any]], str, Optional[int]]:
+        """Return (cached_result_or_None, key, phash); key/phash are reused by store()
+
+        The perceptual hash is only computed after an exact miss with near-duplicate matching
+        enabled; otherwise phash is None and the entry is stored without one.
+        """
+        key = hashlib.sha256(f"{image_digest(img)}|{params_key}".encode()).hexdigest()
+        phash = None
+        try:
+            result = self.backend.get(key)
+            if result is not None:
+                self.hits += 1
+                return dict(result, cache="hit"), key, phash
+            if self.phash_max_distance > 0:
+                phash = perceptual_hash(img)
+                result = self.backend.find_similar(phash, params_key, self.phash_max_distance)
+                if result is not None:
+                    self.near_hits += 1
+                    return dict(result, cache="near_hit"), key, phash
+        except Exception as e:
+            logger.warning(f"Analysis cache lookup failed: {e}")
+        self.misses += 1
+        return None, key, phash
+
+    def store(self, key: str, phash: Optional[int], params_key: str, result: Dict[str, Any]):
+        try:
+            self.backend.set(key, result, phash, params_key)
+        except Exception as e:
+            logger.warning(f"Analysis cache store failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.near_hits + self.misses
+        try:
+            entries = len(self.backend)
+        except Exception:
+            entries = None
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": entries,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.near_hits) / lookups, 3) if lookups else 0.0,
+            "phash_max_distance": self.phash_max_distance,
+        }
+
+def create_analysis_cache(backend: str, path: str, max_entries: int, ttl_seconds: float,
+                          phash_max_distance: int) -> AnalysisResultCache:
+    """Build the cache from settings; `backend` is 'memory' or 'sqlite'"""
+    if backend == "sqlite":
+        store = SqliteCacheBackend(path, max_entries=max_entries, ttl_seconds=ttl_seconds)
+    else:
+        store = MemoryCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds)
+    return AnalysisResultCache(store, phash_max_distance=phash_max_distance)
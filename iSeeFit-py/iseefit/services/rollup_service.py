@@ -0,0 +1,268 @@
+"""
+Daily user rollup maintenance and reads
+Whenever a meal / workout / weight record is created, updated or deleted, the affected
+(user, day) rows of daily_user_rollups are recomputed inside the same transaction
+(after flush), so dashboards and recommendations read a handful of rollup rows instead
+of scanning raw records.
+"""
+
+import json
+import logging
+from datetime import date, datetime
+from itertools import chain
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from models.meal import MealRecord
+from models.workout import WorkoutRecord
+from models.weight import WeightRecord
+from models.rollup import DailyUserRollup
+from services.stats_service import (
+    MEAL_SUMS, WORKOUT_SUMS, day_range, grouped_totals_stmt, normalize_rows
+)
+
+logger = logging.getLogger(__name__)
+
+TRACKED_MODELS = (MealRecord, WorkoutRecord, WeightRecord)
+
+# ============== Recompute ==============
+def _to_day(value) -> Optional[date]:
+    if value is None:
+        return None
+    return value.date() if isinstance(value, datetime) else value
+
+def compute_day(conn, user_id: int, day: date) -> Optional[Dict[str, Any]]:
+    """Column values of the rollup row for (user_id, day); None when the day has no records"""
+    meals = normalize_rows(conn.execute(
+        grouped_totals_stmt(MealRecord, MEAL_SUMS, MealRecord.meal_type, user_id, day, day)
+    ).all(), MEAL_SUMS)
+    workouts = normalize_rows(conn.execute(
+        grouped_totals_stmt(WorkoutRecord, WORKOUT_SUMS, WorkoutRecord.workout_type, user_id, day, day)
+    ).all(), WORKOUT_SUMS)
+
+    start, end = day_range(day)
+    weight_filter = (
+        WeightRecord.user_id == user_id,
+        WeightRecord.recorded_at >= start,
+        WeightRecord.recorded_at < end,
+    )
+    weight_count, weight_sum, weight_min, weight_max = conn.execute(
+        select(
+            func.count(WeightRecord.id), func.coalesce(func.sum(WeightRecord.weight), 0),
+            func.min(WeightRecord.weight), func.max(WeightRecord.weight),
+        ).where(*weight_filter)
+    ).one()
+    latest = conn.execute(
+        select(WeightRecord.weight).where(*weight_filter)
+        .order_by(WeightRecord.recorded_at.desc(), WeightRecord.id.desc())
+        .limit(2)
+    ).scalars().all()
+
+    if not meals and not workouts and not weight_count:
+        return None
+
+    meal_breakdown = {
+        row["type"]: {f: row[f] for f in list(MEAL_SUMS) + ["count"]} for row in meals
+    }
+    workout_breakdown = {
+        row["type"]: {f: row[f] for f in list(WORKOUT_SUMS) + ["count"]} for row in workouts
+    }
+    return {
+        "user_id": user_id,
+        "day": day,
+        "kcal_in": sum(row["calories"] for row in meals),
+        "protein": sum(row["protein"] for row in meals),
+        "carbs": sum(row["carbs"] for row in meals),
+        "fat": sum(row["fat"] for row in meals),
+        "meal_count": sum(row["count"] for row in meals),
+        "meal_breakdown": json.dumps(meal_breakdown),
+        "kcal_out": sum(row["calories_burned"] for row in workouts),
+        "workout_minutes": sum(row["duration"] for row in workouts),
+        "workout_count": sum(row["count"] for row in workouts),
+        "workout_breakdown": json.dumps(workout_breakdown),
+        "weight_count": int(weight_count),
+        "weight_sum": float(weight_sum),
+        "weight_min": weight_min,
+        "weight_max": weight_max,
+        "last_weight": latest[0] if latest else None,
+        "prev_weight": latest[1] if len(latest) > 1 else None,
+        "updated_at": datetime.utcnow(),
+    }
+
+def _upsert(conn, values: Dict[str, Any]):
+    table = DailyUserRollup.__table__
+    dialect = conn.dialect.name
+    update_cols = {k: v for k, v in values.items() if k not in ("user_id", "day")}
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table).values(**values).on_duplicate_key_update(**update_cols)
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table).values(**values).on_conflict_do_update(
+            index_elements=["user_id", "day"], set_=update_cols
+        )
+    else:
+        conn.execute(delete(table).where(table.c.user_id == values["user_id"], table.c.day == values["day"]))
+        stmt = table.insert().values(**values)
+    conn.execute(stmt)
+
+def refresh_day(conn, user_id: int, day: date):
+    """Recompute one (user, day) rollup row from the raw records"""
+    values = compute_day(conn, user_id, day)
+    table = DailyUserRollup.__table__
+    if values is None:
+        conn.execute(delete(table).where(table.c.user_id == user_id, table.c.day == day))
+    else:
+        _upsert(conn, values)
+
+def refresh_days(conn, keys: Iterable[Tuple[int, date]]):
+    for user_id, day in sorted(set(keys)):
+        refresh_day(conn, user_id, day)
+
+# ============== Incremental maintenance (session events) ==============
+_OLD_KEYS = "rollup_old_keys"
+
+def _record_key(obj) -> Optional[Tuple[int, date]]:
+    day = _to_day(obj.recorded_at)
+    if obj.user_id is None or day is None:
+        return None
+    return obj.user_id, day
+
+def _changed_records(session: Session, objects):
+    for obj in objects:
+        if isinstance(obj, TRACKED_MODELS) and (obj in session.deleted or session.is_modified(obj)):
+            yield obj
+
+def _before_flush(session: Session, flush_context, instances):
+    # Attributes are usually expired after commit, so the ORM history does not know the
+    # old recorded_at / user_id; read them from the row before it is updated or deleted
+    old_keys: Set[Tuple[int, date]] = set()
+    conn = None
+    for obj in _changed_records(session, chain(session.dirty, session.deleted)):
+        identity = inspect(obj).identity
+        if not identity:
+            continue
+        model = type(obj)
+        conn = conn or session.connection()
+        row = conn.execute(
+            select(model.user_id, model.recorded_at).where(model.id == identity[0])
+        ).first()
+        if row is not None and row.recorded_at is not None:
+            old_keys.add((row.user_id, _to_day(row.recorded_at)))
+    session.info[_OLD_KEYS] = old_keys
+
+def _after_flush(session: Session, flush_context):
+    keys: Set[Tuple[int, date]] = set(session.info.pop(_OLD_KEYS, set()))
+    for obj in _changed_records(session, chain(session.new, session.dirty)):
+        key = _record_key(obj)
+        if key is not None:
+            keys.add(key)
+    if keys:
+        refresh_days(session.connection(), keys)
+
+_hooks_installed = False
+
+def install_rollup_hooks():
+    """Maintain daily_user_rollups on every ORM session flush (idempotent)"""
+    global _hooks_installed
+    if not _hooks_installed:
+        event.listen(Session, "before_flush", _before_flush)
+        event.listen(Session, "after_flush", _after_flush)
+        _hooks_installed = True
+
+install_rollup_hooks()
+
+# ============== Backfill ==============
+def backfill_rollups(conn, user_id: Optional[int] = None, since: Optional[date] = None) -> int:
+    """Recompute rollups from raw records on a connection (the caller commits); returns the row count"""
+    table = DailyUserRollup.__table__
+    stmt = delete(table)
+    if user_id is not None:
+        stmt = stmt.where(table.c.user_id == user_id)
+    if since is not None:
+        stmt = stmt.where(table.c.day >= since)
+    conn.execute(stmt)
+
+    keys: Set[Tuple[int, date]] = set()
+    for model in TRACKED_MODELS:
+        day = func.date(model.recorded_at)
+        query = select(model.user_id, day).distinct()
+        if user_id is not None:
+            query = query.where(model.user_id == user_id)
+        if since is not None:
+            query = query.where(model.recorded_at >= day_range(since)[0])
+        for uid, value in conn.execute(query):
+            keys.add((uid, value if isinstance(value, date) else date.fromisoformat(str(value))))
+    refresh_days(conn, keys)
+    return len(keys)
+
+def rebuild_rollups(db: Session, user_id: Optional[int] = None, since: Optional[date] = None) -> int:
+    """Recompute rollups from raw records (all users / one user, optionally from a day on)"""
+    days = backfill_rollups(db.connection(), user_id=user_id, since=since)
+    db.commit()
+    return days
+
+# ============== Reads ==============
+def get_rollups(db: Session, user_id: int, start: date, end: date) -> List[DailyUserRollup]:
+    """Rollup rows for [start, end] (days without records have no row)"""
+    return db.execute(
+        select(DailyUserRollup)
+        .where(DailyUserRollup.user_id == user_id, DailyUserRollup.day >= start, DailyUserRollup.day <= end)
+        .order_by(DailyUserRollup.day)
+    ).scalars().all()
+
+def weight_record_count(db: Session, user_id: int, start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """Number of weight records in [start, end], summed from one rollup row per day"""
+    query = select(func.coalesce(func.sum(DailyUserRollup.weight_count), 0)).where(DailyUserRollup.user_id == user_id)
+    if start is not None:
+        query = query.where(DailyUserRollup.day >= start)
+    if end is not None:
+        query = query.where(DailyUserRollup.day <= end)
+    return int(db.execute(query).scalar_one())
+
+def _breakdown_rows(rollups: List[DailyUserRollup], attr: str, fields) -> List[Dict[str, Any]]:
+    rows = []
+    for r in rollups:
+        for type_name, values in json.loads(getattr(r, attr) or "{}").items():
+            row = {"day": r.day, "type": type_name, "count": values.get("count", 0)}
+            row.update({f: values.get(f, 0) for f in fields})
+            if row["count"]:
+                rows.append(row)
+    return rows
+
+def meal_rows(db: Session, user_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+    """Same shape as stats_service.meal_totals(), read from the rollup table"""
+    return _breakdown_rows(get_rollups(db, user_id, start, end), "meal_breakdown", list(MEAL_SUMS))
+
+def workout_rows(db: Session, user_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+    """Same shape as stats_service.workout_totals(), read from the rollup table"""
+    return _breakdown_rows(get_rollups(db, user_id, start, end), "workout_breakdown", list(WORKOUT_SUMS))
+
+def weight_summary(rollups: List[DailyUserRollup]) -> Optional[Dict[str, Any]]:
+    """Latest / previous / average / min / max weight over rollup rows (oldest first)"""
+    days = [r for r in rollups if r.weight_count]
+    if not days:
+        return None
+    latest_day = days[-1]
+    if latest_day.prev_weight is not None:
+        previous = latest_day.prev_weight
+    else:
+        previous = days[-2].last_weight if len(days) > 1 else None
+    count = sum(r.weight_count for r in days)
+    return {
+        "current_weight": latest_day.last_weight,
+        "previous_weight": previous,
+        "average_weight": sum(r.weight_sum for r in days) / count,
+        "min_weight": min(r.weight_min for r in days),
+        "max_weight": max(r.weight_max for r in days),
+        "record_count": count,
+    }
@@ -0,0 +1,104 @@
+"""
+Shared SQL aggregation layer for meal / workout statistics
+SUM / COUNT are computed by the database with GROUP BY DATE(recorded_at), <type column>;
+only aggregate rows (at most days x types) come back to Python.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, func, select
+from sqlalchemy.sql import Select
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from models.meal import MealRecord
+from models.workout import WorkoutRecord
+
+# Summed columns per record type (output name -> column)
+MEAL_SUMS = {
+    "calories": MealRecord.calories,
+    "protein": MealRecord.protein,
+    "carbs": MealRecord.carbs,
+    "fat": MealRecord.fat,
+}
+WORKOUT_SUMS = {
+    "duration": WorkoutRecord.duration_minutes,
+    "calories_burned": WorkoutRecord.calories_burned,
+}
+
+def day_range(start: date, end: Optional[date] = None) -> Tuple[datetime, datetime]:
+    """Half-open [start 00:00, end + 1 day 00:00) range; safe across month / year ends"""
+    end = end or start
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+def grouped_totals_stmt(model, sums: Dict[str, Any], type_column, user_id: int,
+                        start: date, end: date) -> Select:
+    """SELECT DATE(recorded_at), type, SUM(...), COUNT(*) ... GROUP BY day, type"""
+    day = func.date(model.recorded_at).label("day")
+    columns = [day, type_column.label("type")]
+    columns += [func.coalesce(func.sum(col), 0).label(name) for name, col in sums.items()]
+    columns.append(func.count(model.id).label("count"))
+    range_start, range_end = day_range(start, end)
+    return (
+        select(*columns)
+        .where(
+            model.user_id == user_id,
+            model.recorded_at >= range_start,
+            model.recorded_at < range_end,
+        )
+        .group_by(day, type_column)
+        .order_by(day)
+    )
+
+def _to_date(value) -> date:
+    # MySQL returns a date, SQLite returns 'YYYY-MM-DD'
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+def normalize_rows(rows, sums: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Aggregate rows -> dicts with plain int / float values (MySQL SUM returns Decimal)"""
+    result = []
+    for row in rows:
+        item = {"day": _to_date(row.day), "type": row.type, "count": int(row.count)}
+        for name, col in sums.items():
+            value = getattr(row, name) or 0
+            item[name] = int(value) if isinstance(col.type, Integer) else float(value)
+        result.append(item)
+    return result
+
+def grouped_totals(db, model, sums: Dict[str, Any], type_column, user_id: int,
+                   start: date, end: date) -> List[Dict[str, Any]]:
+    stmt = grouped_totals_stmt(model, sums, type_column, user_id, start, end)
+    return normalize_rows(db.execute(stmt).all(), sums)
+
+def meal_totals(db, user_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+    """Per (day, meal_type) sums of calories / protein / carbs / fat and meal count"""
+    return grouped_totals(db, MealRecord, MEAL_SUMS, MealRecord.meal_type, user_id, start, end)
+
+def workout_totals(db, user_id: int, start: date, end: date) -> List[Dict[str, Any]]:
+    """Per (day, workout_type) sums of duration / calories burned and workout count"""
+    return grouped_totals(db, WorkoutRecord, WORKOUT_SUMS, WorkoutRecord.workout_type, user_id, start, end)
+
+def rollup(rows: List[Dict[str, Any]], key, fields, count_name: str = "count") -> Dict[Any, Dict[str, Any]]:
+    """Re-group aggregate rows in Python (e.g. by day or by type); key is a row -> key function"""
+    grouped: Dict[Any, Dict[str, Any]] = {}
+    for row in rows:
+        entry = grouped.setdefault(key(row), dict({f: 0 for f in fields}, **{count_name: 0}))
+        for f in fields:
+            entry[f] += row[f]
+        entry[count_name] += row["count"]
+    return grouped
+
+def averages(per_day: Dict[Any, Dict[str, Any]], fields) -> Dict[str, float]:
+    """Average of each field over the days that have records"""
+    days = len(per_day)
+    return {f: (sum(stats[f] for stats in per_day.values()) / days if days > 0 else 0) for f in fields}
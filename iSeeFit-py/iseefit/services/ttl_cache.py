@@ -0,0 +1,85 @@
+"""
+In-process keyed TTL cache
+Used for small per-user values (recommendation stats, user snapshots). An invalidation
+sequence stops a value that was computed while the key was being invalidated from being stored.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+class KeyedTTLCache:
+    """Thread-safe TTL cache with per-key invalidation; ttl_seconds <= 0 disables caching"""
+
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 10000):
+        self.ttl = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries))
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        # key -> (sequence, monotonic time) of its last invalidation, oldest first. Records older
+        # than the TTL are pruned; _floor then rejects values computed before a pruned invalidation
+        self._invalidations: "OrderedDict[Hashable, Tuple[int, float]]" = OrderedDict()
+        self._sequence = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _prune_invalidations(self, now: float):
+        while self._invalidations:
+            key, (sequence, invalidated_at) = next(iter(self._invalidations.items()))
+            if now - invalidated_at < self.ttl and len(self._invalidations) <= self.max_entries:
+                break
+            del self._invalidations[key]
+            self._floor = max(self._floor, sequence)
+
+    def get(self, key: Hashable) -> Tuple[Optional[Any], int]:
+        """Return (cached value or None, generation to pass to set())"""
+        with self._lock:
+            generation = self._sequence
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() < entry[0]:
+                self.hits += 1
+                return entry[1], generation
+            self._data.pop(key, None)
+            self.misses += 1
+            return None, generation
+
+    def set(self, key: Hashable, value: Any, generation: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._prune_invalidations(now)
+            invalidated = self._invalidations.get(key)
+            if generation < self._floor or (invalidated is not None and invalidated[0] > generation):
+                return
+            if len(self._data) >= self.max_entries and key not in self._data:
+                # Drop the entry closest to expiry
+                self._data.pop(min(self._data, key=lambda k: self._data[k][0]))
+            self._data[key] = (now + self.ttl, value)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+            self._sequence += 1
+            now = time.monotonic()
+            self._invalidations.pop(key, None)
+            self._invalidations[key] = (self._sequence, now)
+            self._prune_invalidations(now)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._invalidations.clear()
+            # Values computed before the clear must not be stored afterwards
+            self._sequence += 1
+            self._floor = self._sequence
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl}
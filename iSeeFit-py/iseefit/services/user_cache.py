@@ -0,0 +1,91 @@
+"""
+Authenticated user snapshot cache
+get_current_user resolves the user from the token's uid claim through this per-process cache,
+so authenticated requests normally run no user query. A snapshot is only used when its
+profile_version is at least the token's pv claim; users updated or deleted through the ORM
+are invalidated after the commit.
+"""
+
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+from models.user import User
+from services.ttl_cache import KeyedTTLCache
+
+logger = logging.getLogger(__name__)
+
+user_cache = KeyedTTLCache(
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS,
+    max_entries=settings.USER_CACHE_MAX_ENTRIES,
+)
+
+_COLUMN_KEYS = tuple(attr.key for attr in User.__mapper__.column_attrs)
+
+def snapshot_user(user: User) -> Dict[str, Any]:
+    """Plain column values of a loaded user"""
+    return {key: getattr(user, key) for key in _COLUMN_KEYS}
+
+def user_from_snapshot(snapshot: Dict[str, Any]) -> User:
+    """A fresh detached User per request (column attributes only, no relationships loaded)"""
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return user
+
+def get_cached_user(user_id: int, min_profile_version: Optional[int]) -> Tuple[Optional[User], int]:
+    """
+    (cached user or None, cache generation). None when the snapshot is missing, expired or
+    older than the token's profile version; pass the generation to cache_user() after reloading.
+    """
+    snapshot, generation = user_cache.get(user_id)
+    if snapshot is None:
+        return None, generation
+    if min_profile_version is not None and snapshot["profile_version"] < min_profile_version:
+        return None, generation
+    return user_from_snapshot(snapshot), generation
+
+def cache_user(user: User, generation: int):
+    """Store a snapshot of a user just loaded from the database"""
+    user_cache.set(user.id, snapshot_user(user), generation)
+
+def invalidate_user(user_id: int):
+    user_cache.invalidate(user_id)
+
+# ============== Invalidation (session events) ==============
+_CHANGED_USERS = "user_cache_changed_ids"
+
+def _after_flush(session: Session, flush_context):
+    changed = session.info.setdefault(_CHANGED_USERS, set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+def _after_commit(session: Session):
+    for user_id in session.info.pop(_CHANGED_USERS, ()):
+        invalidate_user(user_id)
+
+def _after_soft_rollback(session: Session, previous_transaction):
+    session.info.pop(_CHANGED_USERS, None)
+
+_hooks_installed = False
+
+def install_user_cache_hooks():
+    """Invalidate cached snapshots of users changed through any ORM session (idempotent)"""
+    global _hooks_installed
+    if not _hooks_installed:
+        event.listen(Session, "after_flush", _after_flush)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_soft_rollback", _after_soft_rollback)
+        _hooks_installed = True
+
+install_user_cache_hooks()
@@ -0,0 +1,404 @@
+"""
+Staged video processing pipeline
+decode thread -> bounded queue -> batched inference (caller thread) -> bounded queue -> annotate/encode thread
+Decode, model inference and annotation/encoding overlap instead of running serially per frame.
+An optional frame sampler limits inference to a subset of frames; the rest are interpolated.
+"""
+
+import os
+import time
+import queue
+import threading
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+class VideoInfo:
+    """Basic properties of the decoded stream"""
+
+    def __init__(self, fps: int, width: int, height: int, total_frames: int, max_frames: int):
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.total_frames = total_frames
+        self.max_frames = max_frames
+
+class FrameSink:
+    """Receives annotated frames in order on the encode thread"""
+
+    # Whether write() needs the real image of every frame. When False, frames skipped by a
+    # grab-only sampler are never retrieved and are annotated on the last sampled image
+    writes_frames = True
+
+    def open(self, info: VideoInfo):
+        pass
+
+    def write(self, index: int, frame):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class VideoFileSink(FrameSink):
+    """Encode annotated frames into an mp4 file"""
+
+    def __init__(self, output_path: str, fourcc: str = "mp4v"):
+        self.output_path = output_path
+        self.fourcc = fourcc
+        self._writer = None
+
+    def open(self, info: VideoInfo):
+        self._writer = cv2.VideoWriter(
+            self.output_path, cv2.VideoWriter_fourcc(*self.fourcc), info.fps, (info.width, info.height)
+        )
+
+    def write(self, index: int, frame):
+        self._writer.write(frame)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+
+class StreamCancelled(Exception):
+    """Raised inside the pipeline when the streaming consumer has gone away"""
+
+class JpegQueueSink(FrameSink):
+    """
+    JPEG-encode frames into a small bounded queue read by a streaming response.
+    A slow client fills the queue, which blocks the encode stage and, through the
+    pipeline's own bounded queues, decode and inference (backpressure).
+    """
+
+    def __init__(self, max_width: int = 0, quality: int = 80, queue_size: int = 8,
+                 stall_seconds: float = 30.0):
+        self.max_width = max(0, int(max_width))
+        self.quality = min(100, max(1, int(quality)))
+        self.stall_seconds = float(stall_seconds)
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self.cancelled = threading.Event()
+
+    def write(self, index: int, frame):
+        if self.max_width and frame.shape[1] > self.max_width:
+            height = int(round(frame.shape[0] * self.max_width / frame.shape[1]))
+            frame = cv2.resize(frame, (self.max_width, height), interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        self.put(("frame", index, buffer.tobytes()))
+
+    def put(self, item):
+        """Blocking put; gives up when the consumer is gone or has stalled too long"""
+        deadline = time.monotonic() + self.stall_seconds
+        while True:
+            if self.cancelled.is_set():
+                raise StreamCancelled()
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self.stall_seconds > 0 and time.monotonic() > deadline:
+                    self.cancelled.set()
+                    raise StreamCancelled()
+
+def iter_stream(run: Callable[[FrameSink], Any], sink: JpegQueueSink) -> Iterator[tuple]:
+    """
+    Run `run(sink)` on a background thread and yield its output as it is produced:
+    ("frame", index, jpeg_bytes) ... then ("done", result) or ("error", message).
+    Closing the iterator (client disconnect) cancels the pipeline.
+    """
+    def producer():
+        try:
+            item = ("done", run(sink))
+        except StreamCancelled:
+            return
+        except Exception as e:
+            logger.error(f"Frame stream failed: {e}")
+            item = ("error", str(e))
+        try:
+            sink.put(item)
+        except StreamCancelled:
+            pass
+
+    thread = threading.Thread(target=producer, name="video-stream", daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                item = sink.queue.get(timeout=0.5)
+            except queue.Empty:
+                if not thread.is_alive() and sink.queue.empty():
+                    return
+                continue
+            yield item
+            if item[0] != "frame":
+                return
+    finally:
+        sink.cancelled.set()
+
+def _put(q: "queue.Queue", item: Any, stop: threading.Event) -> bool:
+    """Blocking put that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q: "queue.Queue", stop: threading.Event) -> Any:
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+def open_video(video_path: str, max_duration: float, resize: Optional[Tuple[int, int]] = None
+               ) -> Tuple[Any, VideoInfo]:
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise Exception("Cannot open video file")
+    fps = int(cap.get(cv2.CAP_PROP_FPS) or 30)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    max_frames = min(total_frames, int(max_duration * fps)) if total_frames > 0 else int(max_duration * fps)
+    if resize:
+        width, height = resize
+    else:
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    return cap, VideoInfo(fps, width, height, total_frames, max_frames)
+
+class _Pending:
+    __slots__ = ("index", "frame", "sampled", "payload", "done")
+
+    def __init__(self, index: int, frame, sampled: bool):
+        self.index = index
+        self.frame = frame
+        self.sampled = sampled
+        self.payload = None
+        self.done = False
+
+def probe_video(video_path: str, max_duration: float) -> VideoInfo:
+    """Open the video only to read its properties (raises if it cannot be decoded)"""
+    cap, info = open_video(video_path, max_duration)
+    cap.release()
+    return info
+
+def run_pipeline(
+    video_path: str,
+    max_duration: float,
+    infer: Callable[[List[int], List[Any]], List[Any]],
+    annotate: Callable[[int, Any, Any], Any],
+    sink: FrameSink,
+    resize: Optional[Tuple[int, int]] = None,
+    batch_size: int = 4,
+    queue_size: int = 32,
+    on_open: Optional[Callable[[VideoInfo], None]] = None,
+    make_sampler: Optional[Callable[[VideoInfo], Any]] = None,
+    interpolate: Optional[Callable[[int, Any, Any, float], Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Run the staged pipeline over `video_path`.
+
+    - infer(indices, frames) runs on the calling thread with up to `batch_size` sampled
+      frames, in frame order, and returns one payload per frame.
+    - make_sampler(info) returns a FrameSampler (services.frame_sampling); without one
+      every frame is sampled.
+    - interpolate(index, prev_payload, next_payload, t) builds the payload of a skipped
+      frame from its sampled neighbours (either may be None at the clip edges).
+    - annotate(index, frame, payload) runs on the encode thread and returns the frame to write.
+    - sink receives every frame (sampled or not) in order.
+    Raises the first error raised by any stage.
+    """
+    cap, info = open_video(video_path, max_duration, resize)
+    if on_open:
+        on_open(info)
+    sampler = make_sampler(info) if make_sampler else None
+
+    decoded: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    inferred: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    timings = {"decode": 0.0, "infer": 0.0, "encode": 0.0}
+
+    def decode_stage():
+        try:
+            index = 0
+            last_frame = None
+            while index < info.max_frames and not stop.is_set():
+                started = time.perf_counter()
+                # The first frame is always sampled, but the sampler still sees it (stateful samplers)
+                if sampler is not None and sampler.skip_decode \
+                        and not (sampler.select(index, None) or index == 0):
+                    if not cap.grab():
+                        break
+                    if sink.writes_frames:
+                        # The output shows every frame: retrieve it so the interpolated pose is
+                        # drawn on its own image (only inference is skipped)
+                        ret, frame = cap.retrieve()
+                        if not ret:
+                            break
+                        if resize:
+                            frame = cv2.resize(frame, resize)
+                        item = (index, frame, False)
+                    else:
+                        # Nothing is written: advance without retrieving / converting the frame
+                        item = (index, last_frame, False)
+                else:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    if resize:
+                        frame = cv2.resize(frame, resize)
+                    if sampler is None or sampler.skip_decode:
+                        sampled = True
+                    else:
+                        sampled = sampler.select(index, frame) or index == 0
+                    last_frame = frame
+                    item = (index, frame, sampled)
+                timings["decode"] += time.perf_counter() - started
+                if not _put(decoded, item, stop):
+                    return
+                index += 1
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            cap.release()
+            _put(decoded, _END, stop)
+
+    def encode_stage():
+        try:
+            sink.open(info)
+            while True:
+                item = _get(inferred, stop)
+                if item is _END:
+                    break
+                index, frame, payload = item
+                started = time.perf_counter()
+                sink.write(index, annotate(index, frame, payload))
+                timings["encode"] += time.perf_counter() - started
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            sink.close()
+
+    started_at = time.perf_counter()
+    decoder = threading.Thread(target=decode_stage, name="video-decode", daemon=True)
+    encoder = threading.Thread(target=encode_stage, name="video-encode", daemon=True)
+    decoder.start()
+    encoder.start()
+
+    # Frames wait here (in order) until their payload is known; skipped frames wait for
+    # the next sampled frame so they can be interpolated
+    pending: "deque[_Pending]" = deque()
+    batch: List[_Pending] = []
+    counts = {"frames": 0, "inferred": 0}
+    prev: List[Optional[_Pending]] = [None]
+
+    def emit(entry: _Pending) -> bool:
+        counts["frames"] += 1
+        return _put(inferred, (entry.index, entry.frame, entry.payload), stop)
+
+    def emit_ready(final: bool):
+        while pending and not stop.is_set():
+            entry = pending[0]
+            if entry.sampled:
+                if not entry.done:
+                    return
+                prev[0] = entry
+            else:
+                nxt = next((e for e in pending if e.sampled), None)
+                if nxt is None and not final:
+                    return
+                if nxt is not None and not nxt.done:
+                    return
+                before = prev[0]
+                if interpolate is not None:
+                    if before is not None and nxt is not None:
+                        t = (entry.index - before.index) / float(nxt.index - before.index)
+                    else:
+                        t = 0.0
+                    entry.payload = interpolate(
+                        entry.index,
+                        before.payload if before is not None else None,
+                        nxt.payload if nxt is not None else None,
+                        t,
+                    )
+            pending.popleft()
+            if not emit(entry):
+                return
+
+    def run_batch():
+        if batch:
+            t0 = time.perf_counter()
+            payloads = infer([e.index for e in batch], [e.frame for e in batch])
+            timings["infer"] += time.perf_counter() - t0
+            for entry, payload in zip(batch, payloads):
+                entry.payload = payload
+                entry.done = True
+            counts["inferred"] += len(batch)
+            batch.clear()
+        emit_ready(final=False)
+
+    try:
+        while not stop.is_set():
+            item = _get(decoded, stop)
+            if item is _END:
+                break
+            entry = _Pending(*item)
+            pending.append(entry)
+            if entry.sampled:
+                batch.append(entry)
+            # Run as soon as the batch is full or nothing else is decoded yet
+            if len(batch) >= batch_size or decoded.empty():
+                run_batch()
+        if not stop.is_set():
+            run_batch()
+            emit_ready(final=True)
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        _put(inferred, _END, stop)
+        decoder.join()
+        encoder.join()
+
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - started_at
+    frames_done = counts["frames"]
+    stats = {
+        "frames": frames_done,
+        "inferred_frames": counts["inferred"],
+        "fps": info.fps,
+        "sampling": sampler.describe() if sampler is not None else {"strategy": "all"},
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_fps": round(frames_done / elapsed, 2) if elapsed > 0 else 0.0,
+        "stage_seconds": {k: round(v, 3) for k, v in timings.items()},
+    }
+    logger.info(f"Video pipeline processed {frames_done} frames ({counts['inferred']} inferred) "
+                f"in {elapsed:.2f}s {stats['stage_seconds']}")
+    return stats
+
+def iter_file_chunks(path: str, chunk_size: int = 64 * 1024, cleanup: Tuple[str, ...] = ()) -> Iterator[bytes]:
+    """Stream a file in chunks, deleting `cleanup` paths (and the file) when done or aborted"""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        for p in (path,) + tuple(cleanup):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
@@ -0,0 +1,243 @@
+"""
+Async OpenAI vision client
+Shared HTTP connection pool, per-call timeout, jittered exponential backoff, a global
+concurrency cap on in-flight upstream calls and a circuit breaker.
+Point OPENAI_BASE_URL at a local OpenAI-compatible server to test without the real API.
+"""
+
+import json
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is rejecting upstream calls"""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    closed    -> calls go through; `failure_threshold` consecutive failures open the circuit
+    open      -> calls are rejected until `reset_timeout` seconds have passed
+    half_open -> a single trial call is let through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def cancel_trial(self):
+        """Release a half-open trial slot whose call was cancelled before finishing"""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.warning(f"Vision circuit opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+        }
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class AsyncVisionClient:
+    """Pooled AsyncOpenAI wrapper used by the /api/food/analyze path"""
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str,
+        prompt: str,
+        base_url: Optional[str] = None,
+        timeout: float = 20.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_concurrency: int = 8,
+        max_connections: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+        transport=None,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.prompt = prompt
+        self.base_url = base_url or None
+        self.timeout = float(timeout)
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_connections = max(1, int(max_connections))
+        self.breaker = breaker or CircuitBreaker()
+        self.transport = transport  # httpx transport override (tests use httpx.MockTransport)
+        self._client = None
+        self._http_client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                timeout=httpx.Timeout(self.timeout),
+                transport=self.transport,
+            )
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=self._http_client,
+                timeout=self.timeout,
+                max_retries=0,  # retries are handled here, with jitter and the breaker
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._client = None
+        self._http_client = None
+
+    @staticmethod
+    def _is_retryable(exc: Exception) -> bool:
+        import openai
+
+        if isinstance(exc, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError,
+                            openai.RateLimitError, openai.InternalServerError)):
+            return True
+        status = getattr(exc, "status_code", None)
+        return bool(status and status >= 500)
+
+    async def _create(self, data_url: str):
+        client = self._get_client()
+        return await asyncio.wait_for(
+            client.chat.completions.create(
+                model=self.model,
+                temperature=0.2,
+                response_format={"type": "json_object"},  # force JSON
+                messages=[
+                    {"role": "system", "content": self.prompt},
+                    {"role": "user", "content": [
+                        {"type": "text", "text": "Identify foods and estimate portions in grams."},
+                        {"type": "image_url", "image_url": {"url": data_url}},
+                    ]},
+                ],
+            ),
+            timeout=self.timeout,
+        )
+
+    async def detect(self, data_url: str) -> Tuple[List[Dict[str, Any]], str, Optional[str]]:
+        """Return (items, notes, error_msg); raises CircuitOpenError when the breaker is open"""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError("OpenAI circuit is open (upstream degraded)")
+        try:
+            return await self._detect_with_retries(data_url)
+        except asyncio.CancelledError:
+            self.breaker.cancel_trial()
+            raise
+
+    async def _detect_with_retries(self, data_url: str) -> Tuple[List[Dict[str, Any]], str, Optional[str]]:
+        self._get_client()
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(backoff_delay(attempt - 1, self.backoff_base, self.backoff_max))
+            try:
+                async with self._semaphore:
+                    self.in_flight += 1
+                    self.calls += 1
+                    try:
+                        resp = await self._create(data_url)
+                    finally:
+                        self.in_flight -= 1
+            except Exception as e:
+                last_error = e
+                if not self._is_retryable(e):
+                    break
+                logger.warning(f"OpenAI vision call failed (attempt {attempt + 1}): {e!r}")
+                continue
+
+            self.breaker.record_success()
+            raw = resp.choices[0].message.content or ""
+            try:
+                data = json.loads(raw) if raw.strip().startswith("{") else {}
+            except ValueError as e:
+                return [], "", f"OpenAI returned invalid JSON: {e}"
+            items = data.get("items", []) if isinstance(data, dict) else []
+            notes = data.get("notes", "") if isinstance(data, dict) else ""
+            if not isinstance(items, list):
+                items = []
+            return items, notes, None
+
+        self.failures += 1
+        if last_error is not None and self._is_retryable(last_error):
+            # Only upstream degradation (timeouts, 429, 5xx) counts against the breaker
+            self.breaker.record_failure()
+        else:
+            # Our request was rejected (400 / 401 ...): says nothing about upstream health,
+            # so keep the failure count and state; just free a half-open trial slot
+            self.breaker.cancel_trial()
+        return [], "", f"OpenAI call failed: {last_error!r}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url or "https://api.openai.com/v1",
+            "timeout_seconds": self.timeout,
+            "max_retries": self.max_retries,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "rejected_by_circuit": self.rejected,
+            "circuit": self.breaker.status(),
+        }
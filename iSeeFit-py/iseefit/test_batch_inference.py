@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Batch Inference Test
+Drives BatchingEngine with a fake model (no checkpoint) and checks that concurrent requests
+share one forward, batches respect max_batch_size / max_wait_ms, shapes are grouped, each
+caller gets its own rows back, cancelled requests are skipped, a full queue is rejected
+(503 from /api/food/predict) and stop() fails what is still queued
+"""
+
+import sys
+import time
+import threading
+from pathlib import Path
+
+# 添加当前目录到 Python 路径
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+import torch
+
+from services.batch_inference import BatchingEngine, QueueFullError
+
+class FakeModel:
+    """Doubles its input; records every batch shape and can be held inside forward"""
+
+    def __init__(self, blocking: bool = False, fail: bool = False):
+        self.shapes = []
+        self.fail = fail
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        if not blocking:
+            self.release.set()
+
+    def __call__(self, x):
+        self.shapes.append(tuple(x.shape))
+        self.entered.set()
+        self.release.wait(timeout=5)
+        if self.fail:
+            raise RuntimeError("fake model failure")
+        return x * 2
+
+def make_engine(model: FakeModel, **kwargs) -> BatchingEngine:
+    kwargs.setdefault("max_batch_size", 8)
+    kwargs.setdefault("max_wait_ms", 200)
+    kwargs.setdefault("max_queue_size", 16)
+    engine = BatchingEngine(model, name="test-batcher", **kwargs)
+    engine.start()
+    return engine
+
+def tensor(value: float, rows: int = 1, size: int = 4):
+    return torch.full((rows, 3, size, size), float(value))
+
+def test_concurrent_requests_share_one_forward():
+    """Requests queued within max_wait_ms run as one batch; each future gets its own rows"""
+    model = FakeModel()
+    engine = make_engine(model)
+    try:
+        inputs = [tensor(i) for i in range(4)]
+        futures = [engine.submit(x) for x in inputs]
+        for x, future in zip(inputs, futures):
+            assert torch.equal(future.result(timeout=5), x * 2)
+        assert model.shapes == [(4, 3, 4, 4)], model.shapes
+        assert engine.stats()["batch_size"]["count"] == 1
+    finally:
+        engine.stop()
+
+def test_max_batch_size_splits_batches():
+    """Collection stops once max_batch_size images are queued; the rest form the next batch"""
+    model = FakeModel()
+    engine = make_engine(model, max_batch_size=4)
+    try:
+        futures = [engine.submit(tensor(i, rows=2)) for i in range(3)]
+        for i, future in enumerate(futures):
+            assert torch.equal(future.result(timeout=5), tensor(i, rows=2) * 2)
+        assert [shape[0] for shape in model.shapes] == [4, 2], model.shapes
+    finally:
+        engine.stop()
+
+def test_collect_times_out():
+    """A lone request runs after max_wait_ms instead of waiting for a full batch"""
+    model = FakeModel()
+    engine = make_engine(model, max_batch_size=64, max_wait_ms=20)
+    try:
+        started = time.perf_counter()
+        engine.submit(tensor(1)).result(timeout=5)
+        assert time.perf_counter() - started < 1.0
+        time.sleep(0.1)
+        engine.submit(tensor(2)).result(timeout=5)
+        assert [shape[0] for shape in model.shapes] == [1, 1], model.shapes
+    finally:
+        engine.stop()
+
+def test_groups_by_shape():
+    """Differently-sized inputs in one batch get one forward per shape, results still routed"""
+    model = FakeModel()
+    engine = make_engine(model)
+    try:
+        inputs = [tensor(1, size=4), tensor(2, rows=2, size=6), tensor(3, size=4)]
+        futures = [engine.submit(x) for x in inputs]
+        for x, future in zip(inputs, futures):
+            assert torch.equal(future.result(timeout=5), x * 2)
+        assert sorted(model.shapes) == [(2, 3, 4, 4), (2, 3, 6, 6)], model.shapes
+    finally:
+        engine.stop()
+
+def test_queue_full_rejects():
+    """With the worker busy and the queue at capacity, submit raises QueueFullError"""
+    model = FakeModel(blocking=True)
+    engine = make_engine(model, max_wait_ms=0, max_queue_size=1)
+    try:
+        running = engine.submit(tensor(1))
+        assert model.entered.wait(timeout=5)
+        queued = engine.submit(tensor(2))
+        try:
+            engine.submit(tensor(3))
+        except QueueFullError:
+            pass
+        else:
+            raise AssertionError("full queue accepted a request")
+        assert engine.rejected == 1 and engine.stats()["rejected"] == 1
+
+        model.release.set()
+        assert torch.equal(running.result(timeout=5), tensor(1) * 2)
+        assert torch.equal(queued.result(timeout=5), tensor(2) * 2)
+    finally:
+        model.release.set()
+        engine.stop()
+
+def test_cancelled_request_is_skipped():
+    """A request cancelled while queued never reaches the model"""
+    model = FakeModel(blocking=True)
+    engine = make_engine(model, max_wait_ms=0)
+    try:
+        running = engine.submit(tensor(1))
+        assert model.entered.wait(timeout=5)
+        cancelled = engine.submit(tensor(2))
+        assert cancelled.cancel()
+        model.release.set()
+        running.result(timeout=5)
+        time.sleep(0.2)
+        assert model.shapes == [(1, 3, 4, 4)], model.shapes
+    finally:
+        model.release.set()
+        engine.stop()
+
+def test_failed_batch_fails_its_requests():
+    """A forward exception is set on that batch's futures; the engine keeps serving"""
+    model = FakeModel(fail=True)
+    engine = make_engine(model, max_wait_ms=0)
+    try:
+        try:
+            engine.submit(tensor(1)).result(timeout=5)
+        except RuntimeError as e:
+            assert "fake model failure" in str(e)
+        else:
+            raise AssertionError("failed forward returned a result")
+        assert engine.failed_batches == 1
+
+        model.fail = False
+        assert torch.equal(engine.submit(tensor(2)).result(timeout=5), tensor(2) * 2)
+        assert engine.running
+    finally:
+        engine.stop()
+
+def test_stop_fails_pending_requests():
+    """stop() fails queued requests; the batch already running still completes"""
+    model = FakeModel(blocking=True)
+    engine = make_engine(model, max_wait_ms=0)
+    running = engine.submit(tensor(1))
+    assert model.entered.wait(timeout=5)
+    queued = engine.submit(tensor(2))
+
+    engine.stop(timeout=0.1)
+    try:
+        queued.result(timeout=5)
+    except RuntimeError as e:
+        assert "stopped" in str(e)
+    else:
+        raise AssertionError("queued request survived stop()")
+
+    model.release.set()
+    assert torch.equal(running.result(timeout=5), tensor(1) * 2)
+    deadline = time.monotonic() + 5
+    while engine.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not engine.running
+
+def test_predict_returns_503_when_queue_full():
+    """/api/food/predict answers 503 when the engine rejects the request"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    import routes.food_analysis as food_analysis
+
+    model = FakeModel(blocking=True)
+    engine = make_engine(model, max_wait_ms=0, max_queue_size=1)
+    original_engine, original_preprocess = food_analysis._batch_engine, food_analysis._preprocess
+    food_analysis._batch_engine = engine
+    food_analysis._preprocess = lambda img_bytes, tta_views=None: [tensor(1)]
+    try:
+        running = engine.submit(tensor(0))
+        assert model.entered.wait(timeout=5)
+        engine.submit(tensor(0))
+
+        app = FastAPI()
+        app.include_router(food_analysis.router)
+        response = TestClient(app).post("/api/food/predict", files={"file": ("a.jpg", b"jpeg", "image/jpeg")})
+        assert response.status_code == 503, response.text
+        assert engine.rejected == 1
+
+        model.release.set()
+        running.result(timeout=5)
+    finally:
+        food_analysis._batch_engine, food_analysis._preprocess = original_engine, original_preprocess
+        model.release.set()
+        engine.stop()
+
+def main():
+    print("🚀 Starting batch inference test")
+    print("=" * 50)
+    tests = [test_concurrent_requests_share_one_forward, test_max_batch_size_splits_batches,
+             test_collect_times_out, test_groups_by_shape, test_queue_full_rejects,
+             test_cancelled_request_is_skipped, test_failed_batch_fails_its_requests,
+             test_stop_fails_pending_requests, test_predict_returns_503_when_queue_full]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+
+    print("\n" + "=" * 50)
+    if failed:
+        print(f"❌ {failed} batch inference checks failed")
+        sys.exit(1)
+    print("🎉 All batch inference checks passed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Query Plan Regression Test
+Builds a schema through the migrations and checks that the per-user record and
+recommendation queries are served by the composite indexes (EXPLAIN QUERY PLAN on SQLite,
+or EXPLAIN on the configured MySQL database with --mysql)
+"""
+
+import os
+import sys
+import tempfile
+import argparse
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# 添加当前目录到 Python 路径
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+from sqlalchemy import create_engine, select, text
+
+from migrations import run_migrations
+from models import MealRecord, WorkoutRecord, WeightRecord, Recommendation, User
+from services.stats_service import MEAL_SUMS, WORKOUT_SUMS, grouped_totals_stmt, day_range
+from utils.pagination import keyset_condition
+from services.recommendation_stats import stats_stmt
+
+def expected_plans():
+    """(name, statement, index that must be used)"""
+    today = date.today()
+    week_ago = today - timedelta(days=6)
+    start, end = day_range(week_ago, today)
+    last_seen = datetime.combine(week_ago, datetime.min.time())
+    return [
+        ("meal stats by day / meal_type",
+         grouped_totals_stmt(MealRecord, MEAL_SUMS, MealRecord.meal_type, 1, week_ago, today),
+         "ix_meal_records_user_recorded"),
+        ("workout stats by day / workout_type",
+         grouped_totals_stmt(WorkoutRecord, WORKOUT_SUMS, WorkoutRecord.workout_type, 1, week_ago, today),
+         "ix_workout_records_user_recorded"),
+        ("meal list for a day",
+         select(MealRecord).where(MealRecord.user_id == 1, MealRecord.recorded_at >= start,
+                                  MealRecord.recorded_at < end).order_by(MealRecord.recorded_at.desc()),
+         "ix_meal_records_user_recorded"),
+        ("weight records in range",
+         select(WeightRecord.weight).where(WeightRecord.user_id == 1, WeightRecord.recorded_at >= start,
+                                           WeightRecord.recorded_at < end)
+         .order_by(WeightRecord.recorded_at.desc()).limit(2),
+         "ix_weight_records_user_recorded"),
+        ("workout list, deep cursor page",
+         select(WorkoutRecord).where(WorkoutRecord.user_id == 1,
+                                     keyset_condition(WorkoutRecord.recorded_at, WorkoutRecord.id, last_seen, 100))
+         .order_by(WorkoutRecord.recorded_at.desc(), WorkoutRecord.id.desc()).limit(51),
+         "ix_workout_records_user_recorded"),
+        ("weight history, deep cursor page",
+         select(WeightRecord).where(WeightRecord.user_id == 1,
+                                    keyset_condition(WeightRecord.recorded_at, WeightRecord.id, last_seen, 100))
+         .order_by(WeightRecord.recorded_at.desc(), WeightRecord.id.desc()).limit(21),
+         "ix_weight_records_user_recorded"),
+        ("recommendation list, deep cursor page",
+         select(Recommendation).where(Recommendation.user_id == 1,
+                                      keyset_condition(Recommendation.created_at, Recommendation.id, last_seen, 100))
+         .order_by(Recommendation.created_at.desc(), Recommendation.id.desc()).limit(21),
+         "ix_recommendations_user_created"),
+        ("recommendation list",
+         select(Recommendation).where(Recommendation.user_id == 1)
+         .order_by(Recommendation.created_at.desc()).limit(20),
+         "ix_recommendations_user_created"),
+        ("unread recommendations",
+         select(Recommendation).where(Recommendation.user_id == 1, Recommendation.is_read == False)
+         .order_by(Recommendation.created_at.desc()),
+         "ix_recommendations_user_read_created"),
+        ("recommendations by type / priority",
+         select(Recommendation.id).where(Recommendation.user_id == 1,
+                                         Recommendation.recommendation_type == "meal",
+                                         Recommendation.priority == "high"),
+         "ix_recommendations_user_type_priority"),
+        ("recommendation stats (one GROUP BY)",
+         stats_stmt(1),
+         "ix_recommendations_user_type_priority"),
+    ]
+
+def seed(engine):
+    """A few users with some history so the planner has something to choose between"""
+    with engine.begin() as conn:
+        if conn.execute(select(User.id).limit(1)).first():
+            return
+        now = datetime.utcnow()
+        for uid in range(1, 6):
+            conn.execute(User.__table__.insert().values(
+                id=uid, username=f"plan_user_{uid}", email=f"plan{uid}@example.com", hashed_password="x"))
+            for d in range(60):
+                ts = now - timedelta(days=d)
+                conn.execute(MealRecord.__table__.insert().values(
+                    user_id=uid, meal_type="lunch", food_name="rice", calories=500, recorded_at=ts))
+                conn.execute(WorkoutRecord.__table__.insert().values(
+                    user_id=uid, workout_type="run", duration_minutes=30, calories_burned=300, recorded_at=ts))
+                conn.execute(WeightRecord.__table__.insert().values(user_id=uid, weight=70, recorded_at=ts))
+                conn.execute(Recommendation.__table__.insert().values(
+                    user_id=uid, recommendation_type="meal", title="t", content="c",
+                    priority="high", is_read=d % 2 == 0, created_at=ts))
+        conn.execute(text("ANALYZE"))
+
+def explain(conn, stmt) -> str:
+    compiled = stmt.compile(dialect=conn.dialect)
+    if conn.dialect.name == "sqlite":
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+        return " | ".join(str(row[-1]) for row in rows)
+    rows = conn.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params).mappings().all()
+    return " | ".join(f"{row['table']}: key={row['key']}" for row in rows)
+
+def check_query_plans(engine) -> bool:
+    """Every expected statement must use its composite index"""
+    print("🔍 Checking query plans...")
+    ok = True
+    with engine.connect() as conn:
+        for name, stmt, index in expected_plans():
+            plan = explain(conn, stmt)
+            if index in plan:
+                print(f"✅ {name}: {index}")
+            else:
+                ok = False
+                print(f"❌ {name}: expected {index}")
+                print(f"   Plan: {plan}")
+    return ok
+
+def check_migrations_idempotent(engine) -> bool:
+    """A second run must apply nothing"""
+    print("\n🔍 Re-running migrations...")
+    applied = run_migrations(engine)
+    if applied:
+        print(f"❌ Migrations re-applied: {applied}")
+        return False
+    print("✅ No pending migrations on second run")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Query plan regression test")
+    parser.add_argument("--mysql", action="store_true", help="使用配置的 MySQL 数据库（需已执行迁移）")
+    args = parser.parse_args()
+
+    print("🚀 Starting query plan test")
+    print("=" * 50)
+    tmpdir = None
+    if args.mysql:
+        from config.database import engine
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        engine = create_engine(f"sqlite:///{os.path.join(tmpdir.name, 'plans.sqlite3')}")
+    try:
+        applied = run_migrations(engine)
+        print(f"✅ Migrations applied: {applied or 'none pending'}")
+        if not args.mysql:
+            seed(engine)
+        results = [check_query_plans(engine), check_migrations_idempotent(engine)]
+    finally:
+        engine.dispose()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    print("\n" + "=" * 50)
+    if all(results):
+        print("🎉 All query plan checks passed")
+    else:
+        print("❌ Query plan checks failed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Vision Client Test
+Runs AsyncVisionClient against a stub httpx transport (no network, no API key) and checks
+retries, the circuit breaker opening, the half-open trial, and that rejected requests
+(400) leave the breaker alone
+"""
+
+import sys
+import json
+import time
+import asyncio
+from pathlib import Path
+
+# 添加当前目录到 Python 路径
+current_dir = Path(__file__).parent
+sys.path.append(str(current_dir))
+
+import httpx
+
+from services.vision_client import AsyncVisionClient, CircuitBreaker, CircuitOpenError
+
+DATA_URL = "data:image/jpeg;base64,AAAA"
+OK_BODY = {
+    "id": "chatcmpl-test",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{
+        "index": 0,
+        "finish_reason": "stop",
+        "message": {"role": "assistant", "content": json.dumps({"items": [{"name": "rice", "grams": 150}], "notes": "ok"})},
+    }],
+}
+
+class StubUpstream:
+    """Replies with the queued status codes in order (200 once the queue is empty)"""
+
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 200:
+            return httpx.Response(200, json=OK_BODY)
+        return httpx.Response(status, json={"error": {"message": f"stub {status}", "type": "stub"}})
+
+def make_client(upstream: StubUpstream, max_retries: int = 2, failure_threshold: int = 2,
+                reset_timeout: float = 0.2) -> AsyncVisionClient:
+    return AsyncVisionClient(
+        api_key="test",
+        model="gpt-4o-mini",
+        prompt="test",
+        base_url="http://stub.local/v1",
+        timeout=5,
+        max_retries=max_retries,
+        backoff_base=0.001,
+        backoff_max=0.001,
+        breaker=CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout),
+        transport=httpx.MockTransport(upstream.handler),
+    )
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_retry_then_success():
+    """Two 503s are retried; the third attempt succeeds and keeps the breaker closed"""
+    upstream = StubUpstream([503, 503])
+    client = make_client(upstream)
+
+    async def scenario():
+        try:
+            return await client.detect(DATA_URL)
+        finally:
+            await client.aclose()
+
+    items, notes, error = run(scenario())
+    assert error is None, error
+    assert items[0]["name"] == "rice" and notes == "ok"
+    assert upstream.requests == 3 and client.retries == 2
+    assert client.breaker.state == "closed" and client.breaker.failures == 0
+
+def test_breaker_opens_and_rejects():
+    """Exhausted retries count as failures; at the threshold further calls are rejected upstream-free"""
+    upstream = StubUpstream([500] * 10)
+    client = make_client(upstream, max_retries=1, failure_threshold=2, reset_timeout=60)
+
+    async def scenario():
+        try:
+            for _ in range(2):
+                _, _, error = await client.detect(DATA_URL)
+                assert error is not None
+            assert client.breaker.state == "open"
+            sent = upstream.requests
+            try:
+                await client.detect(DATA_URL)
+            except CircuitOpenError:
+                pass
+            else:
+                raise AssertionError("open circuit let a call through")
+            assert upstream.requests == sent
+        finally:
+            await client.aclose()
+
+    run(scenario())
+    assert client.rejected == 1 and client.breaker.times_opened == 1
+
+def test_half_open_trial():
+    """After reset_timeout one trial goes through: failure re-opens, success closes"""
+    upstream = StubUpstream([500, 500, 500])
+    client = make_client(upstream, max_retries=0, failure_threshold=2, reset_timeout=0.05)
+
+    async def scenario():
+        try:
+            await client.detect(DATA_URL)
+            await client.detect(DATA_URL)
+            assert client.breaker.state == "open"
+
+            time.sleep(0.06)
+            _, _, error = await client.detect(DATA_URL)  # half-open trial fails
+            assert error is not None and client.breaker.state == "open"
+
+            time.sleep(0.06)
+            assert client.breaker.allow() and client.breaker.state == "half_open"
+            assert not client.breaker.allow()  # only one trial at a time
+            client.breaker.cancel_trial()
+            items, _, error = await client.detect(DATA_URL)  # trial succeeds
+            assert error is None and items
+            assert client.breaker.state == "closed" and client.breaker.failures == 0
+        finally:
+            await client.aclose()
+
+    run(scenario())
+
+def test_rejected_request_leaves_breaker_alone():
+    """A 400 is not retried and neither resets nor adds to the failure count"""
+    upstream = StubUpstream([500, 400])
+    client = make_client(upstream, max_retries=0, failure_threshold=3, reset_timeout=0.05)
+
+    async def scenario():
+        try:
+            await client.detect(DATA_URL)
+            assert client.breaker.failures == 1
+            _, _, error = await client.detect(DATA_URL)
+            assert error is not None and upstream.requests == 2
+            assert client.breaker.failures == 1 and client.breaker.state == "closed"
+
+            # A 400 on the half-open trial keeps the circuit half-open and frees the trial slot
+            client.breaker.record_failure()
+            client.breaker.record_failure()
+            assert client.breaker.state == "open"
+            time.sleep(0.06)
+            upstream.statuses = [400]
+            await client.detect(DATA_URL)
+            assert client.breaker.state == "half_open"
+            items, _, error = await client.detect(DATA_URL)
+            assert error is None and client.breaker.state == "closed"
+        finally:
+            await client.aclose()
+
+    run(scenario())
+
+def main():
+    print("🚀 Starting vision client test")
+    print("=" * 50)
+    tests = [test_retry_then_success, test_breaker_opens_and_rejects, test_half_open_trial,
+             test_rejected_request_leaves_breaker_alone]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__}: {e}")
+
+    print("\n" + "=" * 50)
+    if failed:
+        print(f"❌ {failed} vision client checks failed")
+        sys.exit(1)
+    print("🎉 All vision client checks passed")
+
+if __name__ == "__main__":
+    main()
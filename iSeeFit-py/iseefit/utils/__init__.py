@@ -2,13 +2,14 @@
 Utilities package
 """
 
-from .auth import hash_password, verify_password, create_access_token, get_current_user
+from .auth import hash_password, verify_password, create_access_token, create_user_access_token, get_current_user
 from .image import save_image, delete_image
 
 __all__ = [
     "hash_password", 
     "verify_password", 
     "create_access_token", 
+    "create_user_access_token",
     "get_current_user",
     "save_image",
     "delete_image"
@@ -7,20 +7,23 @@ import bcrypt
 from datetime import datetime, timedelta
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from config.database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.database import get_async_db
 from config.settings import settings
 from models.user import User
+from services.refresh_tokens import revocation_list
+from services.user_cache import cache_user, get_cached_user
 
 # Security configuration
 security = HTTPBearer()
 
 def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    """Hash password using bcrypt (blocking; routes use services.password_hasher)"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)).decode('utf-8')
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password against hash"""
+    """Verify password against hash (blocking; routes use services.password_hasher)"""
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 def create_access_token(data: dict):
@@ -31,30 +34,59 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
-    """Get current authenticated user"""
+def create_user_access_token(user: User, session_id: str = None) -> str:
+    """
+    Access token carrying the user id and profile version, so requests can skip the user query;
+    session_id is the refresh token family, checked against the revocation list
+    """
+    claims = {"sub": user.username, "uid": user.id, "pv": user.profile_version}
+    if session_id:
+        claims["sid"] = session_id
+    return create_access_token(data=claims)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security),
+                           db: AsyncSession = Depends(get_async_db)):
+    """Get current authenticated user (from the snapshot cache when the token has a uid claim)"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
     token = credentials.credentials
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
     except jwt.PyJWTError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise credentials_exception
+    username = payload.get("sub")
+    if username is None:
+        raise credentials_exception
+    
+    # Logged-out / compromised sessions (in-memory set, synced from refresh_tokens periodically)
+    session_id = payload.get("sid")
+    if session_id:
+        if revocation_list.needs_sync():
+            await revocation_list.sync(db)
+        if revocation_list.is_revoked(session_id):
+            raise credentials_exception
+    
+    # Tokens issued before the uid / pv claims existed fall back to the username lookup
+    user_id = payload.get("uid")
+    profile_version = payload.get("pv")
+    generation = None
+    if isinstance(user_id, int):
+        user, generation = get_cached_user(user_id, profile_version)
+        if user is not None and user.username == username:
+            return user
+        user = await db.get(User, user_id)
+    else:
+        user = await db.scalar(select(User).where(User.username == username))
     
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    if user is None or user.username != username:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if generation is not None:
+        cache_user(user, generation)
     return user
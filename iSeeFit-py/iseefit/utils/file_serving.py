@@ -0,0 +1,145 @@
+"""
+File responses with validators and byte ranges
+Strong ETag / If-None-Match (304), single Range requests (206 / 416) and If-Range. File bodies
+go out through the ASGI zero-copy send extension when the server offers it, or through an
+X-Accel-Redirect to the reverse proxy when IMAGE_ACCEL_REDIRECT_PREFIX is set; otherwise they
+are streamed in chunks from the requested offset.
+"""
+
+import os
+from typing import Dict, Optional, Tuple
+
+import anyio
+from fastapi import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 64 * 1024
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison: W/"x" matches "x"; "*" matches anything"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any(tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == bare for tag in tags)
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single "bytes=" range, None to serve the whole body
+    (no header, malformed or multiple ranges). Raises ValueError when unsatisfiable.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, sep, end_text = range_header[len("bytes="):].strip().partition("-")
+    if not sep or not (start_text or end_text) or not (start_text + end_text).isdigit():
+        return None
+    if not start_text:
+        # Suffix range: the last N bytes
+        length = int(end_text)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+def _range_for(request: Request, etag: str, size: int) -> Optional[Tuple[int, int]]:
+    # If-Range: only honour Range when the client's copy is still current (strong comparison)
+    if_range = request.headers.get("if-range")
+    if if_range and (etag.startswith("W/") or if_range.strip() != etag):
+        return None
+    return parse_range(request.headers.get("range"), size)
+
+def not_modified(etag: str, headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers={**headers, "ETag": etag})
+
+def _unsatisfiable_response(size: int, headers: Dict[str, str]) -> Response:
+    return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+class RangeFileResponse(Response):
+    """Sends [start, end] of a file; uses zero-copy send when the ASGI server supports it"""
+
+    def __init__(self, path: str, start: int, end: int, status_code: int, headers: Dict[str, str],
+                 media_type: str, send_body: bool = True):
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.send_body = send_body
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers({**headers, "Content-Length": str(self.count)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.wrapped,
+                    "offset": self.start,
+                    "count": self.count,
+                    "more_body": False,
+                })
+                return
+            await file.seek(self.start)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; close the body anyway
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def serve_file(request: Request, path: str, etag: str, media_type: str, cache_control: str,
+               accel_path: Optional[str] = None, stat_result: Optional[os.stat_result] = None) -> Response:
+    """Conditional / ranged response for a file on disk (stat it in a worker thread beforehand)"""
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes", "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, headers)
+    if accel_path:
+        # The proxy (nginx) sends the file with sendfile and handles Range itself
+        return Response(headers={**headers, "X-Accel-Redirect": accel_path}, media_type=media_type)
+
+    size = (stat_result or os.stat(path)).st_size
+    send_body = request.method != "HEAD"
+    try:
+        byte_range = _range_for(request, etag, size)
+    except ValueError:
+        return _unsatisfiable_response(size, headers)
+    if byte_range is None:
+        return RangeFileResponse(path, 0, size - 1, 200, headers, media_type, send_body)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return RangeFileResponse(path, start, end, 206, headers, media_type, send_body)
+
+def serve_bytes(request: Request, data: bytes, etag: str, media_type: str, cache_control: str) -> Response:
+    """Same as serve_file for objects fetched into memory (remote storage backends)"""
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes", "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, headers)
+    try:
+        byte_range = _range_for(request, etag, len(data))
+    except ValueError:
+        return _unsatisfiable_response(len(data), headers)
+    status_code = 200
+    if byte_range is not None:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        data = data[start:end + 1]
+        status_code = 206
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers={**headers, "Content-Length": str(len(data))},
+                        media_type=media_type)
+    return Response(content=data, status_code=status_code, headers=headers, media_type=media_type)
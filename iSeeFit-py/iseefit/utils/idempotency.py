@@ -0,0 +1,183 @@
+"""
+Idempotency-Key middleware
+Mobile clients retry POSTs after timeouts on flaky networks. When such a request carries an
+Idempotency-Key header, the first response is stored (per user and key) and retries with the same
+key get it back without reaching the route: no duplicate rows, no second image upload, no
+second paid vision call. A retry with a different body is rejected with 422; a retry while the
+first request is still running gets 409.
+
+Pure ASGI (no BaseHTTPMiddleware) so uploads are streamed to the route unchanged and replays
+cost one store lookup.
+"""
+
+import re
+import hashlib
+import logging
+from typing import List, Optional, Sequence
+
+import anyio
+import jwt
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import sys
+from pathlib import Path
+
+# Add parent directory to Python path
+parent_dir = Path(__file__).parent.parent
+sys.path.append(str(parent_dir))
+
+from config.settings import settings
+from services.idempotency_store import IdempotencyStore, create_idempotency_store
+
+logger = logging.getLogger(__name__)
+
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 255
+BOUNDARY_RE = re.compile(rb"boundary=\"?([^\";]+)\"?")
+
+idempotency_store = create_idempotency_store(
+    backend=settings.IDEMPOTENCY_BACKEND,
+    path=settings.IDEMPOTENCY_PATH,
+    max_entries=settings.IDEMPOTENCY_MAX_ENTRIES,
+    ttl_seconds=settings.IDEMPOTENCY_TTL_SECONDS,
+    lock_seconds=settings.IDEMPOTENCY_LOCK_SECONDS,
+)
+
+def _header(scope: Scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+def _principal(scope: Scope) -> str:
+    """Keys are scoped to the caller: the token's user id, or 'anon' for unauthenticated routes"""
+    authorization = (_header(scope, b"authorization") or b"").decode("latin-1")
+    if authorization.lower().startswith("bearer "):
+        try:
+            payload = jwt.decode(authorization[7:], settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            return f"user:{payload.get('uid') or payload.get('sub')}"
+        except jwt.PyJWTError:
+            pass
+    return "anon"
+
+def _fingerprint(scope: Scope, body: bytes) -> str:
+    content_type = _header(scope, b"content-type") or b""
+    match = BOUNDARY_RE.search(content_type)
+    if content_type.startswith(b"multipart/") and match:
+        # Clients pick a new multipart boundary for every attempt; it is not part of the request's meaning
+        body = body.replace(b"--" + match.group(1), b"--boundary")
+        content_type = content_type.split(b";", 1)[0]
+    h = hashlib.sha256()
+    for part in (scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), content_type):
+        h.update(part)
+        h.update(b"\0")
+    h.update(body)
+    return h.hexdigest()
+
+class IdempotencyMiddleware:
+    """Replays stored responses for POSTs under `paths` that carry an Idempotency-Key header"""
+
+    def __init__(self, app: ASGIApp, store: Optional[IdempotencyStore] = None, paths: Optional[Sequence[str]] = None,
+                 max_body_bytes: Optional[int] = None, max_response_bytes: Optional[int] = None):
+        self.app = app
+        self.store = store or idempotency_store
+        if paths is None:
+            paths = [p.strip() for p in settings.IDEMPOTENCY_PATHS.split(",") if p.strip()]
+        self.paths = tuple(paths)
+        self.max_body_bytes = max_body_bytes if max_body_bytes is not None else settings.IDEMPOTENCY_MAX_BODY_BYTES
+        self.max_response_bytes = (max_response_bytes if max_response_bytes is not None
+                                   else settings.IDEMPOTENCY_MAX_RESPONSE_BYTES)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+        key = _header(scope, HEADER)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        key = key.decode("latin-1").strip()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await JSONResponse({"detail": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"},
+                               status_code=400)(scope, receive, send)
+            return
+
+        # Buffer the body to fingerprint it; the route then reads it from the buffer
+        messages: List[Message] = []
+        size = 0
+        complete = False
+        while not complete:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            messages.append(message)
+            size += len(message.get("body", b""))
+            complete = not message.get("more_body", False)
+            if size > self.max_body_bytes:
+                break
+
+        async def buffered_receive() -> Message:
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        if not complete:
+            logger.info(f"Request body over {self.max_body_bytes} bytes; {scope['path']} runs without idempotency")
+            await self.app(scope, buffered_receive, send)
+            return
+
+        body = b"".join(m.get("body", b"") for m in messages)
+        fingerprint = _fingerprint(scope, body)
+        store_key = hashlib.sha256(f"{_principal(scope)}|{key}".encode()).hexdigest()
+        record = await self.store.reserve(store_key, fingerprint)
+        if record is not None:
+            await self._respond_existing(record, fingerprint, scope, receive, send)
+            return
+
+        status = None
+        headers: List = []
+        chunks: List[bytes] = []
+        stored_size = 0
+        finished = False
+
+        async def capture_send(message: Message) -> None:
+            nonlocal status, headers, stored_size, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [(k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                stored_size += len(chunk)
+                if stored_size <= self.max_response_bytes:
+                    chunks.append(chunk)
+                finished = not message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, buffered_receive, capture_send)
+        except BaseException:
+            with anyio.CancelScope(shield=True):
+                await self.store.release(store_key)
+            raise
+
+        # Only successful responses are replayed; errors are cheap to retry and may be transient
+        if finished and status is not None and status < 400 and stored_size <= self.max_response_bytes:
+            await self.store.complete(store_key, status, headers, b"".join(chunks))
+        else:
+            await self.store.release(store_key)
+
+    async def _respond_existing(self, record, fingerprint: str, scope: Scope, receive: Receive, send: Send):
+        if record["fingerprint"] != fingerprint:
+            response = JSONResponse({"detail": "Idempotency-Key was already used with a different request"},
+                                    status_code=422)
+        elif record["status"] is None:
+            response = JSONResponse({"detail": "A request with this Idempotency-Key is still being processed"},
+                                    status_code=409, headers={"Retry-After": "1"})
+        else:
+            headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in record["headers"]]
+            headers.append((b"idempotent-replayed", b"true"))
+            await send({"type": "http.response.start", "status": record["status"], "headers": headers})
+            await send({"type": "http.response.body", "body": record["body"], "more_body": False})
+            return
+        await response(scope, receive, send)
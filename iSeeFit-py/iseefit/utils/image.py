@@ -1,46 +1,218 @@
 """
 Image processing utilities
+Uploads are streamed to a staging file in chunks off the event loop while their SHA-256 is
+computed. Content already in image storage is not processed again; otherwise the derivatives
+(services.image_storage) are generated on a small image worker pool. With
+IMAGE_DEFERRED_PROCESSING the request returns as soon as the upload is staged.
+
+Content is shared between records, and a deduplicated upload returns its reference before the
+new record is committed. Releasing an image therefore only schedules a re-check: content is
+deleted IMAGE_RELEASE_GRACE_SECONDS later if nothing references, processes or has just been
+handed that digest.
 """
 
 import os
+import uuid
+import asyncio
+import hashlib
 import logging
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Dict, Optional
 from fastapi import UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from config.settings import settings
+from services.image_storage import delete_image_content, has_image, image_ref, parse_image_ref, store_image
 
 logger = logging.getLogger(__name__)
 
-def save_image(file: UploadFile, user_id: int, record_type: str) -> str:
-    """Save uploaded image and return path"""
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+class UploadTooLarge(Exception):
+    pass
+
+# ============== Worker pool / background queue ==============
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: Dict[str, Future] = {}  # digest -> background job
+_claimed: Dict[str, float] = {}  # digest -> monotonic time save_image last returned it
+_release_tasks: Dict[str, "asyncio.Task"] = {}  # digest -> scheduled deletion re-check
+_stats = {"processed": 0, "failed": 0, "deferred": 0, "deduplicated": 0}
+_stats_lock = threading.Lock()
+
+def _count(key: str):
+    with _stats_lock:
+        _stats[key] += 1
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        # PIL releases the GIL while decoding, resizing and encoding
+        _executor = ThreadPoolExecutor(max_workers=max(1, settings.IMAGE_WORKERS), thread_name_prefix="image")
+    return _executor
+
+def is_pending(digest: str) -> bool:
+    """Upload accepted but its derivatives not stored yet (deferred processing)"""
+    return digest in _pending
+
+def _claim(digest: str):
+    """Record that a reference to digest was just handed out (its record may not be committed yet)"""
+    now = time.monotonic()
+    _claimed[digest] = now
+    for key in [k for k, at in _claimed.items() if now - at > settings.IMAGE_RELEASE_GRACE_SECONDS]:
+        del _claimed[key]
+
+def _recently_claimed(digest: str) -> bool:
+    claimed_at = _claimed.get(digest)
+    return claimed_at is not None and time.monotonic() - claimed_at < settings.IMAGE_RELEASE_GRACE_SECONDS
+
+def image_queue_stats() -> dict:
+    with _stats_lock:
+        return {"pending": len(_pending), "release_checks": len(_release_tasks), **_stats}
+
+async def drain_image_jobs(timeout: float = 30):
+    """Wait for deferred derivative jobs to finish, then stop the pool (application shutdown)"""
+    global _executor
+    if _pending:
+        await asyncio.wait([asyncio.wrap_future(f) for f in list(_pending.values())], timeout=timeout)
+    # Unreferenced content whose re-check is cancelled stays in storage; a later upload reuses it
+    for task in list(_release_tasks.values()):
+        task.cancel()
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+# ============== Blocking steps (worker threads) ==============
+def _write_upload(src: BinaryIO, staging_path: str, max_bytes: int) -> str:
+    """Copy the upload to staging_path chunk by chunk; returns its SHA-256 after checking PIL can open it"""
+    os.makedirs(os.path.dirname(staging_path), exist_ok=True)
+    digest = hashlib.sha256()
     try:
-        # Create user directory
-        upload_dir = f"{settings.UPLOAD_DIR}/{user_id}/{record_type}"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Generate filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{record_type}_{timestamp}_{file.filename}"
-        file_path = os.path.join(upload_dir, filename)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = file.file.read()
-            buffer.write(content)
-        
-        # Compress image
-        with Image.open(file_path) as img:
-            img.thumbnail((800, 600), Image.Resampling.LANCZOS)
-            img.save(file_path, "JPEG", quality=85)
-        
-        logger.info(f"Image saved: {file_path}")
-        return file_path
+        written = 0
+        with open(staging_path, "wb") as buffer:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(f"{written} bytes")
+                digest.update(chunk)
+                buffer.write(chunk)
+        # Header only; pixels are decoded once, by store_image
+        with Image.open(staging_path):
+            pass
+    except BaseException:
+        _remove_staging(staging_path)
+        raise
+    return digest.hexdigest()
+
+def _remove_staging(staging_path: str):
+    if os.path.exists(staging_path):
+        os.remove(staging_path)
+
+def _store_job(staging_path: str, digest: str):
+    try:
+        store_image(staging_path, digest)
+        _count("processed")
+    except Exception as e:
+        _count("failed")
+        logger.error(f"Background image processing failed for {digest}: {e}")
+    finally:
+        _remove_staging(staging_path)
+
+# ============== Public API ==============
+async def save_image(file: UploadFile, user_id: int, record_type: str) -> str:
+    """Store an uploaded image and return the image_path reference ("sha256:<hex>")"""
+    staging_path = os.path.join(settings.UPLOAD_DIR, "staging", f"{user_id}_{record_type}_{uuid.uuid4().hex}.part")
+    try:
+        # Stream to disk
+        digest = await run_in_threadpool(_write_upload, file.file, staging_path, settings.MAX_FILE_SIZE)
+
+        # Same bytes uploaded before (or being processed right now): nothing to do
+        if digest in _pending or await run_in_threadpool(has_image, digest):
+            await run_in_threadpool(_remove_staging, staging_path)
+            _claim(digest)
+            _count("deduplicated")
+            logger.info(f"Image already stored: {digest}")
+            return image_ref(digest)
+
+        # Generate derivatives: in the background unless the queue is full
+        if settings.IMAGE_DEFERRED_PROCESSING and len(_pending) < settings.IMAGE_QUEUE_SIZE:
+            future = _get_executor().submit(_store_job, staging_path, digest)
+            _pending[digest] = future
+            future.add_done_callback(lambda f: _pending.pop(digest, None))
+            _count("deferred")
+        else:
+            try:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(_get_executor(), store_image, staging_path, digest)
+                _count("processed")
+            finally:
+                await run_in_threadpool(_remove_staging, staging_path)
+
+        _claim(digest)
+        logger.info(f"Image saved: {digest} ({record_type}, user {user_id})")
+        return image_ref(digest)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"Image larger than {settings.MAX_FILE_SIZE} bytes")
+    except Image.UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="Uploaded file is not a supported image")
     except Exception as e:
         logger.error(f"Error saving image: {e}")
         raise HTTPException(status_code=500, detail="Failed to save image")
 
+async def _is_referenced(db: AsyncSession, image_path: str) -> bool:
+    from models import MealRecord, WorkoutRecord, WeightRecord
+
+    for model in (MealRecord, WorkoutRecord, WeightRecord):
+        if await db.scalar(select(model.id).where(model.image_path == image_path).limit(1)) is not None:
+            return True
+    return False
+
+async def _delete_when_unreferenced(digest: str):
+    """Delete content once the grace period has passed with no pending job, claim or record using it"""
+    from config.database import get_async_session_factory
+
+    image_path = image_ref(digest)
+    try:
+        while True:
+            await asyncio.sleep(settings.IMAGE_RELEASE_GRACE_SECONDS)
+            if is_pending(digest) or _recently_claimed(digest):
+                continue
+            async with get_async_session_factory()() as db:
+                if await _is_referenced(db, image_path):
+                    return
+            await run_in_threadpool(delete_image_content, digest)
+            logger.info(f"Image deleted: {digest}")
+            return
+    except Exception as e:
+        logger.warning(f"Failed to delete image {digest}: {e}")
+    finally:
+        _release_tasks.pop(digest, None)
+
+async def release_image(db: AsyncSession, image_path: Optional[str]):
+    """
+    Delete an image that a record no longer uses (call after the change is committed).
+    Content-addressed images are shared: when no record references one, its deletion is
+    re-checked after IMAGE_RELEASE_GRACE_SECONDS instead of happening now.
+    """
+    if not image_path:
+        return
+    digest = parse_image_ref(image_path)
+    if digest is None:
+        await run_in_threadpool(delete_image, image_path)
+        return
+
+    if digest in _release_tasks or await _is_referenced(db, image_path):
+        return
+    _release_tasks[digest] = asyncio.create_task(_delete_when_unreferenced(digest))
+
 def delete_image(image_path: str) -> bool:
-    """Delete image file"""
+    """Delete image file (legacy image_path values that are file paths)"""
     try:
         if image_path and os.path.exists(image_path):
             os.remove(image_path)
@@ -0,0 +1,69 @@
+"""
+Keyset (cursor) pagination utilities
+Lists are ordered newest first on (timestamp, id); the cursor encodes the last row of a
+page and the next page continues with rows strictly before it, so every page is an index
+range scan of `limit` rows no matter how deep the client has scrolled.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """Opaque, URL-safe token for the position after (sort_value, row_id)"""
+    payload = json.dumps({"t": sort_value.isoformat(), "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(token: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor(); raises HTTP 400 for malformed tokens"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_condition(sort_column, id_column, last_value: datetime, last_id: int):
+    """Rows strictly after (last_value, last_id) in (sort, id) DESC order"""
+    # Expanded form of (sort, id) < (last_value, last_id); row-value comparisons are not
+    # turned into index ranges by every MySQL version
+    return or_(
+        sort_column < last_value,
+        and_(sort_column == last_value, id_column < last_id),
+    )
+
+async def keyset_page(db: AsyncSession, stmt: Select, sort_column, id_column, cursor: Optional[str],
+                      limit: int, offset: Optional[int] = None) -> Tuple[List[Any], Optional[str]]:
+    """
+    Apply (sort_column, id_column) DESC keyset pagination to a select() of ORM entities.
+    Returns the page rows and the cursor of the next page (None when there are no more rows).
+    `offset` is the deprecated pre-cursor paging of old clients (same order, OFFSET scan);
+    its pages also carry a next cursor so clients can switch over.
+    """
+    if cursor and offset:
+        raise HTTPException(status_code=400, detail="Use either cursor or offset, not both")
+    if cursor:
+        stmt = stmt.where(keyset_condition(sort_column, id_column, *decode_cursor(cursor)))
+    stmt = stmt.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+    if offset:
+        stmt = stmt.offset(offset)
+    rows = (await db.execute(stmt)).scalars().all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    """Expose the next-page cursor on list endpoints whose body is a plain JSON array"""
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor